@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare the speed of the diff algorithms available in Trac.
+#
+# Usage: diffbench.py OLD NEW
+#
+# OLD and NEW are either two files, or two directories in which case all
+# the files present in both directories are compared, e.g. two exports of
+# a repository at different revisions.
+#
+# Note: This is a development tool used for tuning the diff algorithms,
+#       not something particularly useful for end-users.
+
+import os
+import sys
+import time
+
+from trac.versioncontrol.diff import diff_algorithms, get_hunks
+
+
+def file_pairs(old, new):
+    if not os.path.isdir(old):
+        yield old, new
+        return
+    for dirpath, dirnames, filenames in os.walk(old):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for filename in filenames:
+            oldpath = os.path.join(dirpath, filename)
+            newpath = os.path.join(new, oldpath[len(old):].lstrip(os.sep))
+            if os.path.isfile(newpath):
+                yield oldpath, newpath
+
+def read_lines(path):
+    f = open(path, 'rb')
+    try:
+        content = f.read()
+    finally:
+        f.close()
+    if '\0' in content[:1024]:
+        return None # binary
+    return content.splitlines()
+
+def main(old, new):
+    names = sorted(diff_algorithms)
+    totals = dict((name, [0.0, 0]) for name in names)
+    slowest = []
+    pairs = 0
+    for oldpath, newpath in file_pairs(old, new):
+        fromlines, tolines = read_lines(oldpath), read_lines(newpath)
+        if fromlines is None or tolines is None or fromlines == tolines:
+            continue
+        pairs += 1
+        times = {}
+        for name in names:
+            start = time.time()
+            changed = sum(max(i2 - i1, j2 - j1)
+                          for hunk in get_hunks(fromlines, tolines, 3, name)
+                          for tag, i1, i2, j1, j2 in hunk if tag != 'equal')
+            times[name] = time.time() - start
+            totals[name][0] += times[name]
+            totals[name][1] += changed
+        slowest.append((max(times.values()), newpath, times))
+
+    print '%d modified files' % pairs
+    for name in names:
+        print '%-10s %10.3fs %10d changed lines' % (name, totals[name][0],
+                                                    totals[name][1])
+    slowest.sort(reverse=True)
+    if slowest:
+        print
+        print 'Slowest files:'
+        for t, path, times in slowest[:10]:
+            print '  %s' % path
+            print '    ' + ', '.join('%s %.3fs' % (name, times[name])
+                                     for name in names)
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print >> sys.stderr, __doc__ or 'Usage: diffbench.py OLD NEW'
+        sys.exit(2)
+    main(*sys.argv[1:])
@@ -127,6 +127,7 @@ facilities.
         trac.mimeview.txtl = trac.mimeview.txtl[Textile]
         trac.prefs = trac.prefs.web_ui
         trac.search = trac.search.web_ui
+        trac.search.index = trac.search.index
         trac.ticket.admin = trac.ticket.admin
         trac.ticket.query = trac.ticket.query
         trac.ticket.report = trac.ticket.report
@@ -142,6 +143,7 @@ facilities.
         trac.web.session = trac.web.session
         trac.wiki.admin = trac.wiki.admin
         trac.wiki.interwiki = trac.wiki.interwiki
+        trac.wiki.links = trac.wiki.links
         trac.wiki.macros = trac.wiki.macros
         trac.wiki.web_ui = trac.wiki.web_ui
         trac.wiki.web_api = trac.wiki.web_api
@@ -24,6 +24,7 @@ from StringIO import StringIO
 import trac.admin.api
 import trac.attachment
 import trac.perm
+import trac.search.index
 import trac.ticket.admin
 import trac.versioncontrol.admin
 import trac.versioncontrol.api
@@ -18,7 +18,6 @@
 
 from __future__ import with_statement
 
-from cStringIO import StringIO
 from datetime import datetime
 import os.path
 import re
@@ -36,8 +35,11 @@ from trac.env import IEnvironmentSetupParticipant
 from trac.mimeview import *
 from trac.perm import PermissionError, IPermissionPolicy
 from trac.resource import *
-from trac.search import search_to_sql, shorten_result
+from trac.search import ISearchDocumentProvider, SearchIndex, \
+                        search_by_ids, search_to_sql, shorten_result
+from trac.timeline.api import get_timeline_rows
 from trac.util import content_disposition, create_unique_file, get_reporter_id
+from trac.util.archive import ZipStream
 from trac.util.datefmt import format_datetime, from_utimestamp, \
                               to_datetime, to_utimestamp, utc
 from trac.util.text import exception_to_unicode, path_to_unicode, \
@@ -376,7 +378,7 @@ class AttachmentModule(Component):
 
     implements(IEnvironmentSetupParticipant, IRequestHandler,
                INavigationContributor, IWikiSyntaxProvider,
-               IResourceManager)
+               IResourceManager, ISearchDocumentProvider)
 
     change_listeners = ExtensionPoint(IAttachmentChangeListener)
     manipulators = ExtensionPoint(IAttachmentManipulator)
@@ -531,31 +533,37 @@ class AttachmentModule(Component):
                 'attachments': attachments,
                 'parent': context.resource}
     
-    def get_history(self, start, stop, realm):
+    def get_history(self, start, stop, realm, limit=None):
         """Return an iterable of tuples describing changes to attachments on
         a particular object realm.
 
         The tuples are in the form (change, realm, id, filename, time,
         description, author). `change` can currently only be `created`.
 
-        FIXME: no iterator
+        The changes are sorted by decreasing time. The optional `limit` is
+        a hint for retrieving the changes by batches (see
+        `~trac.timeline.api.get_timeline_rows`).
         """
         for realm, id, filename, ts, description, author in \
-                self.env.db_query("""
+                get_timeline_rows(self.env, """
                 SELECT type, id, filename, time, description, author
                 FROM attachment WHERE time > %s AND time < %s AND type = %s
-                """, (to_utimestamp(start), to_utimestamp(stop), realm)):
+                ORDER BY time DESC, id, filename
+                """, (to_utimestamp(start), to_utimestamp(stop), realm),
+                limit):
             time = from_utimestamp(ts or 0)
             yield ('created', realm, id, filename, time, description, author)
 
-    def get_timeline_events(self, req, resource_realm, start, stop):
+    def get_timeline_events(self, req, resource_realm, start, stop,
+                            limit=None):
         """Return an event generator suitable for ITimelineEventProvider.
 
         Events are changes to attachments on resources of the given
-        `resource_realm.realm`.
+        `resource_realm.realm`. They are sorted by decreasing date, and
+        `limit` is passed as a hint to `get_history`.
         """
         for change, realm, id, filename, time, descr, author in \
-                self.get_history(start, stop, resource_realm.realm):
+                self.get_history(start, stop, resource_realm.realm, limit):
             attachment = resource_realm(id=id).child('attachment', filename)
             if 'ATTACHMENT_VIEW' in req.perm(attachment):
                 yield ('attachment', time, author, (attachment, descr), self)
@@ -581,19 +589,72 @@ class AttachmentModule(Component):
         `resource_realm.realm` whose filename, description or author match 
         the given terms.
         """
+        ids = SearchIndex(self.env).find_documents('attachment', terms)
         with self.env.db_query as db:
-            sql_query, args = search_to_sql(
-                    db, ['filename', 'description', 'author'], terms)
-            for id, time, filename, desc, author in db("""
-                    SELECT id, time, filename, description, author
-                    FROM attachment WHERE type = %s AND """ + sql_query, 
-                    (resource_realm.realm,) + args):
+            if ids is not None:
+                rows = self._search_by_ids(db, ids, resource_realm.realm)
+            else:
+                sql_query, args = search_to_sql(
+                        db, ['filename', 'description', 'author'], terms)
+                rows = db("""
+                    SELECT type, id, filename, time, description, author
+                    FROM attachment WHERE type = %s AND """ + sql_query,
+                    (resource_realm.realm,) + args)
+            rows = list(rows)
+            allowed = set(req.perm.filter('ATTACHMENT_VIEW',
+                                          [resource_realm(id=row[1])
+                                           .child('attachment', row[2])
+                                           for row in rows]))
+            for type, id, filename, time, desc, author in rows:
                 attachment = resource_realm(id=id).child('attachment', filename)
-                if 'ATTACHMENT_VIEW' in req.perm(attachment):
+                if attachment in allowed:
                     yield (get_resource_url(self.env, attachment, req.href),
                            get_resource_shortname(self.env, attachment),
                            from_utimestamp(time), author,
                            shorten_result(desc, terms))
+
+    @staticmethod
+    def search_document_id(parent_realm, parent_id, filename):
+        """Return the identifier of an attachment in the full-text search
+        index."""
+        return u'%s:%s/%s' % (parent_realm, parent_id, filename)
+
+    # ISearchDocumentProvider methods
+
+    def get_search_document_realms(self):
+        yield 'attachment'
+
+    def get_search_documents(self, realm, ids=None):
+        with self.env.db_query as db:
+            if ids is None:
+                rows = db("""
+                    SELECT type, id, filename, time, description, author
+                    FROM attachment""")
+            else:
+                rows = self._search_by_ids(db, ids)
+            for type, id, filename, time, desc, author in rows:
+                yield (self.search_document_id(type, id, filename),
+                       '\n'.join([filename, desc or '', author or '']))
+
+    def _search_by_ids(self, db, ids, parent_realm=None):
+        """Generate the `attachment` rows for the search index
+        identifiers `ids`, restricted to the attachments of
+        `parent_realm` if specified."""
+        parent_ids = {}
+        for id in ids:
+            realm, path = id.split(':', 1)
+            parent_id, filename = path.rsplit('/', 1)
+            if parent_realm in (None, realm):
+                parent_ids.setdefault((realm, filename), set()).add(parent_id)
+        realms = set(realm for realm, filename in parent_ids)
+        for realm in sorted(realms):
+            filenames = sorted(f for r, f in parent_ids if r == realm)
+            for row in search_by_ids(db, """
+                    SELECT type, id, filename, time, description, author
+                    FROM attachment WHERE type = %s
+                    """, 'filename', filenames, (realm,)):
+                if row[1] in parent_ids.get((realm, row[2]), ()):
+                    yield row
     
     # IResourceManager methods
     
@@ -764,29 +825,17 @@ class AttachmentModule(Component):
         req.send_header('Content-Disposition',
                         content_disposition('inline', filename))
 
-        from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
-
-        buf = StringIO()
-        zipfile = ZipFile(buf, 'w', ZIP_DEFLATED)
+        zipstream = ZipStream()
         for attachment in attachments:
-            zipinfo = ZipInfo()
-            zipinfo.filename = attachment.filename.encode('utf-8')
-            zipinfo.date_time = attachment.date.utctimetuple()[:6]
-            zipinfo.compress_type = ZIP_DEFLATED
-            if attachment.description:
-                zipinfo.comment = attachment.description.encode('utf-8')
-            zipinfo.external_attr = 0644 << 16L # needed since Python 2.5
-            try:
-                with attachment.open() as fd:
-                    zipfile.writestr(zipinfo, fd.read())
-            except ResourceNotFound:
-                pass # skip missing files
-        zipfile.close()
+            if not os.path.isfile(attachment.path):
+                continue # skip missing files
+            zipstream.add(attachment.filename,
+                          attachment.date.utctimetuple()[:6], attachment.open,
+                          comment=attachment.description or '')
 
-        zip_str = buf.getvalue()
-        req.send_header("Content-Length", len(zip_str))
         req.end_headers()
-        req.write(zip_str)
+        if req.method != 'HEAD':
+            req.write_stream(zipstream)
         raise RequestDone()
 
     def _render_list(self, req, parent):
@@ -943,6 +992,38 @@ class LegacyAttachmentPolicy(Component):
                 if decision is not None:
                     return decision
 
+    def check_permissions(self, action, username, resources, perm):
+        perm_map = self._perm_maps.get(action)
+        if not perm_map:
+            return [None] * len(resources)
+        parents = {}
+        for resource in resources:
+            if resource and resource.realm == 'attachment' and \
+                    resource.parent.realm in perm_map:
+                parents.setdefault(perm_map[resource.parent.realm],
+                                   []).append(resource.parent)
+        allowed = {}
+        for legacy_action, parent_resources in parents.iteritems():
+            allowed[legacy_action] = set(perm.filter(legacy_action,
+                                                     parent_resources))
+        decisions = []
+        for resource in resources:
+            if not resource or resource.realm != 'attachment':
+                decisions.append(None)
+            elif resource.parent.realm in perm_map:
+                legacy_action = perm_map[resource.parent.realm]
+                decision = resource.parent in allowed[legacy_action]
+                if not decision:
+                    self.log.debug('LegacyAttachmentPolicy denied %s access '
+                                   'to %s. User needs %s' %
+                                   (username, resource, legacy_action))
+                decisions.append(decision)
+            else:
+                decisions.append(self.check_permission(action, username,
+                                                       resource,
+                                                       perm(resource)))
+        return decisions
+
 
 class AttachmentAdmin(Component):
     """trac-admin command provider for attachment administration."""
@@ -13,11 +13,14 @@
 
 from __future__ import with_statement
 
+import cPickle
+import os
+
 from .core import Component
-from .util import arity
+from .util import AtomicFile, arity, sha1
 from .util.concurrency import ThreadLocal, threading
 
-__all__ = ['CacheManager', 'cached']
+__all__ = ['CacheManager', 'FileCache', 'cached']
 
 
 _id_to_key = {}
@@ -273,3 +276,158 @@ class CacheManager(Component):
                     del self._local.cache[id]
                 except (KeyError, TypeError):
                     pass
+
+
+class Generation(object):
+    """Generation token of a set of data, shared by all the processes
+    using an environment.
+
+    Caches keep the `token` of the generations their entries depend on,
+    and consider an entry stale when one of these tokens changed. The
+    `token` changes whenever the generation is invalidated by deleting
+    it, in this or another process.
+
+    The generations named after a resource realm are invalidated when
+    the resources of that realm change. In particular, the `repository`
+    generation is invalidated when changesets are added to the cache of
+    a repository, even if the change listeners aren't notified.
+    """
+
+    def __init__(self, env, name):
+        self.env = env
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        self._generation_id = name
+
+    @cached('_generation_id')
+    def token(self):
+        return object()
+
+
+class FileCache(object):
+    """Cache of values pickled in the files of a directory.
+
+    This is meant for values which are costly to compute but never change
+    for a given key, like the diff of two file revisions. The keys are
+    tuples of strings and numbers, and the files are named after a hash of
+    the key, so the same key always addresses the same file.
+
+    When the total size of the files exceeds `max_size` bytes, the least
+    recently used entries are removed. Errors when accessing the directory
+    are logged and otherwise ignored, so the cache behaves as if it was
+    empty.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path, max_size, log=None):
+        self.path = path
+        self.max_size = max_size
+        self.log = log
+        self._size = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_option(cls, env, section, name, dirname):
+        """Return the cache stored in the `cache/<dirname>` directory of
+        the environment `env`, or `None` if it is disabled.
+
+        The maximum size of the cache is read in kilobytes from the
+        `[section] name` option, a size of 0 disabling the cache. The
+        same instance is returned for a given directory, so that its
+        size is tracked by a single object.
+        """
+        max_size = env.config.getint(section, name) * 1024
+        if max_size <= 0:
+            return None
+        path = os.path.join(env.path, 'cache', dirname)
+        with cls._instances_lock:
+            cache = cls._instances.get(path)
+            if cache is None:
+                cache = cls._instances[path] = cls(path, max_size, env.log)
+            cache.max_size = max_size
+        return cache
+
+    def __getitem__(self, key):
+        filename = self._filename(key)
+        try:
+            f = open(filename, 'rb')
+            try:
+                stored_key, value = cPickle.load(f)
+            finally:
+                f.close()
+            os.utime(filename, None) # mark as recently used
+        except Exception, e:
+            if not isinstance(e, IOError) and self.log:
+                self.log.warning("Unreadable cache file %s (%s)", filename,
+                                 e)
+            raise KeyError(key)
+        if stored_key != key:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        filename = self._filename(key)
+        data = cPickle.dumps((key, value), cPickle.HIGHEST_PROTOCOL)
+        try:
+            dirname = os.path.dirname(filename)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            with AtomicFile(filename, 'wb') as f:
+                f.write(data)
+        except (IOError, OSError), e:
+            if self.log:
+                self.log.warning("Can't write cache file %s (%s)", filename,
+                                 e)
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size += len(data)
+            if self._size is None or self._size > self.max_size:
+                self._evict()
+
+    def clear(self):
+        """Remove all the entries of the cache."""
+        with self._lock:
+            for filename, mtime, size in self._files():
+                self._remove(filename)
+            self._size = 0
+
+    # Internal methods
+
+    def _filename(self, key):
+        digest = sha1(repr(key)).hexdigest()
+        return os.path.join(self.path, digest[:2], digest[2:])
+
+    def _files(self):
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            for filename in filenames:
+                filename = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(filename)
+                except OSError:
+                    continue # removed concurrently
+                files.append((filename, st.st_mtime, st.st_size))
+        return files
+
+    def _remove(self, filename):
+        try:
+            os.unlink(filename)
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Remove the least recently used files until the size of the
+        cache is below 90% of its maximum size."""
+        files = self._files()
+        size = sum(f[2] for f in files)
+        if size > self.max_size:
+            files.sort(key=lambda f: f[1])
+            for filename, mtime, fsize in files:
+                if size <= self.max_size * 0.9:
+                    break
+                self._remove(filename)
+                size -= fsize
+        self._size = size
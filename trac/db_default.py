@@ -17,7 +17,7 @@
 from trac.db import Table, Column, Index
 
 # Database version identifier. Used for automatic upgrades.
-db_version = 27
+db_version = 29
 
 def __mkreports(reports):
     """Utility function used to create report data in same syntax as the
@@ -84,6 +84,14 @@ schema = [
         Column('comment'),
         Column('readonly', type='int'),
         Index(['time'])],
+    Table('resource_link', key=('source_realm', 'source_id', 'target_realm',
+                                'target_id'))[
+        Column('source_realm', key_size=16),
+        Column('source_id', key_size=120),
+        Column('source_version', type='int'),
+        Column('target_realm', key_size=16),
+        Column('target_id', key_size=120),
+        Index(['target_realm', 'target_id'])],
 
     # Version control cache
     Table('repository', key=('id', 'name'))[
@@ -105,7 +113,12 @@ schema = [
         Column('change_type', size=1, key_size=2),
         Column('base_path'),
         Column('base_rev'),
-        Index(['repos', 'rev'])],
+        Index(['repos', 'rev']),
+        Index(['repos', 'path', 'rev'])],
+    Table('node_change_prefix', key=('repos', 'prefix', 'rev'))[
+        Column('repos', type='int'),
+        Column('prefix', key_size=255),
+        Column('rev', key_size=20)],
 
     # Ticket system
     Table('ticket', key='id')[
@@ -15,12 +15,13 @@ import os
 from pkg_resources import resource_filename
 import re
 
+from trac.cache import FileCache
 from trac.core import *
-from trac.config import ListOption, Option
+from trac.config import IntOption, ListOption, Option
 from trac.env import ISystemInfoProvider
 from trac.mimeview.api import IHTMLPreviewRenderer, Mimeview
 from trac.prefs import IPreferencePanelProvider
-from trac.util import get_pkginfo
+from trac.util import get_pkginfo, sha1
 from trac.util.datefmt import http_date, localtz
 from trac.util.translation import _
 from trac.web.api import IRequestHandler, HTTPNotFound
@@ -62,6 +63,13 @@ class PygmentsRenderer(Component):
         to override the default quality ratio used by the
         Pygments render.""")
 
+    cache_size = IntOption('mimeviewer', 'pygments_cache_size', 10240,
+        """Disk space in kilobytes for the `cache/pygments` directory of
+        the environment, which keeps the tokens produced by the Pygments
+        lexers for the highlighted files. The tokens don't depend on the
+        Pygments style, so they can be reused after changing it. Set to
+        0 to run the lexer on each rendering (''since 0.13'').""")
+
     expand_tabs = True
     returns_source = True
 
@@ -198,8 +206,26 @@ class PygmentsRenderer(Component):
         )
 
     def _generate(self, language, content):
+        formatter = GenshiHtmlFormatter()
+        cache = FileCache.for_option(self.env, 'mimeviewer',
+                                     'pygments_cache_size', 'pygments')
+        if cache is None:
+            return formatter.generate(self._get_tokens(language, content))
+        if isinstance(content, unicode):
+            digest = sha1(content.encode('utf-8')).hexdigest()
+        else:
+            digest = sha1(content).hexdigest()
+        key = (digest, language, getattr(pygments, '__version__', None))
+        try:
+            chunks = cache[key]
+        except KeyError:
+            chunks = cache[key] = list(formatter._chunk(
+                self._get_tokens(language, content)))
+        return formatter.generate_chunks(chunks)
+
+    def _get_tokens(self, language, content):
         lexer = get_lexer_by_name(language, stripnl=False)
-        return GenshiHtmlFormatter().generate(lexer.get_tokens(content))
+        return lexer.get_tokens(content)
 
 
 class GenshiHtmlFormatter(HtmlFormatter):
@@ -232,12 +258,18 @@ class GenshiHtmlFormatter(HtmlFormatter):
             yield last_class, u''.join(text)
 
     def generate(self, tokens):
+        return self.generate_chunks(self._chunk(tokens))
+
+    def generate_chunks(self, chunks):
+        """Generate the stream for the `(css_class, text)` pairs returned
+        by `_chunk()`, which are more compact than the tokens and can be
+        cached."""
         pos = (None, -1, -1)
         span = QName('span')
         class_ = QName('class')
 
         def _generate():
-            for c, text in self._chunk(tokens):
+            for c, text in chunks:
                 if c:
                     attrs = Attrs([(class_, c)])
                     yield START, (span, attrs), pos
@@ -12,6 +12,8 @@
 # history and logs, available at http://trac.edgewall.org/log/.
 
 import os
+import shutil
+import tempfile
 import unittest
 
 from genshi.core import Stream, TEXT
@@ -35,6 +37,7 @@ class PygmentsRendererTestCase(unittest.TestCase):
 
     def setUp(self):
         self.env = EnvironmentStub(enable=[Chrome, PygmentsRenderer])
+        self.env.path = tempfile.mkdtemp(prefix='trac-tempenv-')
         self.pygments = Mimeview(self.env).renderers[0]
         self.req = Mock(base_path='', chrome={}, args={},
                         abs_href=Href('/'), href=Href('/'),
@@ -44,6 +47,9 @@ class PygmentsRendererTestCase(unittest.TestCase):
                                        'pygments.html'))
         self.pygments_html = Stream(list(HTMLParser(pygments_html, encoding='utf-8')))
 
+    def tearDown(self):
+        shutil.rmtree(self.env.path)
+
     def _expected(self, expected_id):
         return self.pygments_html.select(
             '//div[@id="%s"]/*|//div[@id="%s"]/text())' % 
@@ -81,6 +87,26 @@ def hello():
         self.assertTrue(result)
         self._test('python_hello_mimeview', result)
 
+    def test_cached_output(self):
+        """
+        The highlighted content is cached and rendered again without
+        lexing it
+        """
+        lexed = []
+        get_tokens = self.pygments._get_tokens
+        def _get_tokens(language, content):
+            lexed.append(content)
+            return get_tokens(language, content)
+        self.pygments._get_tokens = _get_tokens
+        content = 'def hello():\n        return "Hello World!"\n'
+        result = str(self.pygments.render(self.context, 'text/x-python',
+                                          content))
+        self.assertEqual(result, str(self.pygments.render(
+            self.context, 'text/x-python', content)))
+        self.assertEqual(1, len(lexed))
+        self.pygments.render(self.context, 'text/x-python', content + '\n')
+        self.assertEqual(2, len(lexed))
+
     def test_newline_content(self):
         """
         The behavior of Pygments changed post-Pygments 0.11.1, and now
@@ -23,6 +23,7 @@ import os
 from time import time
 
 from trac.admin import AdminCommandError, IAdminCommandProvider, get_dir_list
+from trac.cache import cached
 from trac.config import ExtensionOption, OrderedExtensionsOption
 from trac.core import *
 from trac.resource import Resource, get_resource_name
@@ -118,7 +119,16 @@ class IPermissionGroupProvider(Interface):
 
 
 class IPermissionPolicy(Interface):
-    """A security policy provider used for fine grained permission checks."""
+    """A security policy provider used for fine grained permission checks.
+
+    A policy can optionally implement a
+    `check_permissions(action, username, resources, perm)` method, taking
+    a list of resources and returning the list of the corresponding
+    decisions, each decision being as described for `check_permission`.
+    It is used by `PermissionCache.filter` for deciding on a whole batch
+    of resources at once, e.g. with a single database query. `perm` is
+    the permission cache for that username. (''since 0.13'')
+    """
 
     def check_permission(action, username, resource, perm):
         """Check that the action can be performed by username on the resource
@@ -181,23 +191,38 @@ class DefaultPermissionStore(Component):
         for provider in self.group_providers:
             subjects.update(provider.get_permission_groups(username) or [])
 
+        subject_actions = self._subject_actions
         actions = set()
-        rows = self.env.db_query("SELECT username, action FROM permission")
-        while True:
-            num_users = len(subjects)
-            num_actions = len(actions)
-            for user, action in rows:
-                if user in subjects:
-                    if action.isupper() and action not in actions:
-                        actions.add(action)
-                    if not action.isupper() and action not in subjects:
-                        # action is actually the name of the permission 
-                        # group here
-                        subjects.add(action)
-            if num_users == len(subjects) and num_actions == len(actions):
-                break
+        for subject in subjects:
+            actions.update(subject_actions.get(subject, ()))
         return list(actions)
 
+    @cached
+    def _subject_actions(self):
+        """Map each subject of the `permission` table to the actions granted
+        to it, either directly or through the groups it belongs to.
+        """
+        grants = {}
+        for username, action in self.env.db_query(
+                "SELECT username, action FROM permission"):
+            grants.setdefault(username, []).append(action)
+        subject_actions = {}
+        for subject in grants:
+            # Collect the groups reachable from the subject, i.e. the
+            # lowercase "actions" granted to it or to its groups
+            members = set([subject])
+            pending = [subject]
+            while pending:
+                for action in grants.get(pending.pop(), ()):
+                    if not action.isupper() and action not in members:
+                        members.add(action)
+                        pending.append(action)
+            subject_actions[subject] = frozenset(
+                action for member in members
+                       for action in grants.get(member, ())
+                       if action.isupper())
+        return subject_actions
+
     def get_users_with_permissions(self, permissions):
         """Retrieve a list of users that have any of the specified permissions
         
@@ -225,15 +250,17 @@ class DefaultPermissionStore(Component):
 
     def grant_permission(self, username, action):
         """Grants a user the permission to perform the specified action."""
-        self.env.db_transaction("INSERT INTO permission VALUES (%s, %s)",
-                                (username, action))
+        with self.env.db_transaction as db:
+            db("INSERT INTO permission VALUES (%s, %s)", (username, action))
+            del self._subject_actions
         self.log.info("Granted permission for %s to %s", action, username)
 
     def revoke_permission(self, username, action):
         """Revokes a users' permission to perform the specified action."""
-        self.env.db_transaction(
-                "DELETE FROM permission WHERE username=%s AND action=%s",
-                (username, action))
+        with self.env.db_transaction as db:
+            db("DELETE FROM permission WHERE username=%s AND action=%s",
+               (username, action))
+            del self._subject_actions
         self.log.info("Revoked permission for %s to %s", action, username)
 
 
@@ -269,6 +296,15 @@ class DefaultPermissionPolicy(Component):
     # IPermissionPolicy methods
 
     def check_permission(self, action, username, resource, perm):
+        return action in self._get_permissions(username) or None
+
+    def check_permissions(self, action, username, resources, perm):
+        decision = action in self._get_permissions(username) or None
+        return [decision] * len(resources)
+
+    # Internal methods
+
+    def _get_permissions(self, username):
         now = time()
 
         if now - self.last_reap > self.CACHE_REAP_TIME:
@@ -284,8 +320,7 @@ class DefaultPermissionPolicy(Component):
                           get_user_permissions(username)
             self.permission_cache[username] = (now, permissions)
 
-        return action in permissions or None
-
+        return permissions
 
 
 class PermissionSystem(Component):
@@ -458,6 +493,48 @@ class PermissionSystem(Component):
                        username, action, resource)
         return False
 
+    def check_permissions(self, action, username, resources, perm):
+        """Return the list of the decisions for performing action on each
+        of the `resources`.
+
+        The policies implementing `check_permissions` decide on all the
+        resources for which no decision was made yet at once, the other
+        policies are asked for each of these resources in turn.
+        """
+        if username is None:
+            username = 'anonymous'
+        resources = [resource if resource and resource.realm is not None
+                     else None for resource in resources]
+        decisions = [False] * len(resources)
+        pending = range(len(resources))
+        for policy in self.policies:
+            if not pending:
+                break
+            batch = [resources[idx] for idx in pending]
+            if hasattr(policy, 'check_permissions'):
+                batch_decisions = policy.check_permissions(action, username,
+                                                           batch, perm)
+            else:
+                batch_decisions = [policy.check_permission(
+                                       action, username, resource,
+                                       perm(resource) if resource else perm)
+                                   for resource in batch]
+            undecided = []
+            for idx, decision in zip(pending, batch_decisions):
+                if decision is None:
+                    undecided.append(idx)
+                else:
+                    decisions[idx] = decision
+                    if not decision:
+                        self.log.debug("%s denies %s performing %s on %r",
+                                       policy.__class__.__name__, username,
+                                       action, resources[idx])
+            pending = undecided
+        for idx in pending:
+            self.log.debug("No policy allowed %s performing %s on %r",
+                           username, action, resources[idx])
+        return decisions
+
     # IPermissionRequestor methods
 
     def get_permission_actions(self):
@@ -561,6 +638,33 @@ class PermissionCache(object):
 
     __contains__ = has_permission
 
+    def filter(self, action, resources):
+        """Return the list of the `resources` on which `action` is allowed.
+
+        The permissions not yet in the cache are checked for all the
+        resources at once, which is much faster than checking them one
+        at a time with policies implementing `check_permissions`.
+        """
+        resources = list(resources)
+        decisions = {}
+        pending = []
+        for idx, resource in enumerate(resources):
+            cached = self._cache.get((self.username, hash(resource), action))
+            if cached and resource == cached[1]:
+                decisions[idx] = cached[0]
+            else:
+                pending.append(idx)
+        if pending:
+            batch = [resources[idx] for idx in pending]
+            for idx, resource, decision in zip(pending, batch,
+                    PermissionSystem(self.env).check_permissions(
+                        action, self.username, batch, self)):
+                self._cache[(self.username, hash(resource), action)] = \
+                    (decision, resource)
+                decisions[idx] = decision
+        return [resource for idx, resource in enumerate(resources)
+                if decisions[idx]]
+
     def require(self, action, realm_or_resource=None, id=False, version=False):
         resource = self._normalize_resource(realm_or_resource, id, version)
         if not self._has_permission(action, resource):
@@ -11,7 +11,14 @@
 # individuals. For the exact contribution history, see the revision
 # history and logs, available at http://trac.edgewall.org/log/.
 
+from __future__ import with_statement
+
+import re
+
+from trac.cache import cached
+from trac.config import OrderedExtensionsOption
 from trac.core import *
+from trac.util.translation import _
 
 
 class ISearchSource(Interface):
@@ -36,9 +43,183 @@ class ISearchSource(Interface):
 
         The events returned by this function must be tuples of the form
         `(href, title, date, author, excerpt).`
+
+        Only the results the user is allowed to view must be returned.
+        `PermissionCache.filter()` checks the permissions on all the
+        matching resources at once.
+        """
+
+
+class ISearchDocumentProvider(Interface):
+    """Extension point interface for components providing the documents
+    stored in the full-text search index (''since 0.13'').
+    """
+
+    def get_search_document_realms():
+        """Return the realms of the documents provided by this component.
+        """
+
+    def get_search_documents(realm, ids=None):
+        """Generate `(id, text)` tuples for the documents of the given
+        `realm`.
+
+        `id` is an `unicode` string identifying the document within the
+        realm and `text` is all the text which should be searchable for
+        that document. When `ids` is specified, only the documents
+        having these identifiers are generated, if they still exist.
         """
 
 
+class ISearchIndexBackend(Interface):
+    """Extension point interface for full-text search index storages
+    (''since 0.13'').
+    """
+
+    def is_available():
+        """Return whether this backend can be used in this environment."""
+
+    def clear():
+        """Remove all the documents from the index, creating the storage
+        if needed."""
+
+    def add_documents(realm, documents):
+        """Add or replace the `(id, text)` `documents` of `realm`."""
+
+    def remove_documents(realm, ids):
+        """Remove the documents of `realm` having the given `ids`."""
+
+    def find_documents(realm, terms):
+        """Return the identifiers of the documents of `realm` containing
+        all the `terms`.
+
+        Each term is a list of words which must appear in sequence, the
+        last one being possibly only the prefix of a word.
+        """
+
+
+class SearchIndex(Component):
+    """Full-text search index for the search sources.
+
+    The index is maintained by the first available backend among the
+    configured ones. It is only used once it has been built, either
+    at environment creation or with the `search reindex` command of
+    `trac-admin`. Until then, `find_documents` returns `None` and the
+    search sources are expected to fall back to a plain SQL search.
+    """
+
+    backends = OrderedExtensionsOption('search', 'index_backends',
+                                       ISearchIndexBackend,
+                                       'SQLiteFullTextIndex, '
+                                       'DatabaseFullTextIndex',
+        include_missing=False,
+        doc="""Ordered list of the full-text search index backends. The
+        first available backend is used. (''since 0.13'')""")
+
+    document_providers = ExtensionPoint(ISearchDocumentProvider)
+
+    @property
+    def backend(self):
+        """The backend used for the search index, or `None`."""
+        for backend in self.backends:
+            if backend.is_available():
+                return backend
+
+    @cached
+    def built_backend(self):
+        """Name of the backend with which the index was last built."""
+        for value, in self.env.db_query("""
+                SELECT value FROM system WHERE name='search_index'"""):
+            return value
+
+    def is_ready(self):
+        """Return whether the index is built and can be queried."""
+        if self.built_backend is None:
+            return False
+        backend = self.backend
+        return backend is not None and \
+               backend.__class__.__name__ == self.built_backend
+
+    def find_documents(self, realm, terms):
+        """Return the identifiers of the documents of `realm` matching all
+        the search `terms`, or `None` if the index can't be used.
+        """
+        if not self.is_ready():
+            return None
+        words = [tokenize(term) for term in terms]
+        if not all(words):
+            return None # terms made only of punctuation
+        return self.backend.find_documents(realm, words)
+
+    def update_documents(self, realm, ids):
+        """Update the index for the documents of `realm` having the given
+        `ids`, which are removed if they don't exist anymore."""
+        if not self.is_ready():
+            return
+        ids = set(ids)
+        documents = []
+        for provider in self.document_providers:
+            if realm in provider.get_search_document_realms():
+                documents.extend(provider.get_search_documents(realm, ids))
+        backend = self.backend
+        backend.add_documents(realm, documents)
+        backend.remove_documents(realm, ids - set(d[0] for d in documents))
+
+    def remove_documents(self, realm, ids):
+        """Remove the documents of `realm` having the given `ids`."""
+        if self.is_ready():
+            self.backend.remove_documents(realm, ids)
+
+    def rebuild(self):
+        """Build the index from scratch with the first available backend.
+        """
+        backend = self.backend
+        if backend is None:
+            raise TracError(_("No full-text search index backend "
+                              "available"))
+        backend.clear()
+        for provider in self.document_providers:
+            for realm in provider.get_search_document_realms():
+                backend.add_documents(realm,
+                                      provider.get_search_documents(realm))
+        with self.env.db_transaction as db:
+            db("DELETE FROM system WHERE name='search_index'")
+            db("INSERT INTO system (name, value) VALUES ('search_index', %s)",
+               (backend.__class__.__name__,))
+        del self.built_backend
+
+
+_word_re = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(text):
+    """Split `text` in lower case words for the full-text search index.
+
+    >>> tokenize(u'Hello, World! foo_bar-2')
+    [u'hello', u'world', u'foo_bar', u'2']
+    """
+    return _word_re.findall((text or u'').lower())
+
+def search_by_ids(db, query, column, ids, args=()):
+    """Generate the rows returned by `query`, restricted to those whose
+    `column` is one of the given `ids`.
+
+    The restriction is added as a ``WHERE`` clause, or appended to the
+    existing one with ``AND``. The `ids` are processed by chunks, in
+    order to stay within the limits on the number of parameters of the
+    database backends. If `ids` is `None`, the `query` is not restricted.
+    """
+    if ids is None:
+        for row in db(query, args):
+            yield row
+        return
+    ids = list(ids)
+    query += " AND " if re.search(r'\sWHERE\s', query, re.I) else " WHERE "
+    for i in xrange(0, len(ids), 100):
+        chunk = ids[i:i + 100]
+        for row in db(query + "%s IN (%s)"
+                      % (column, ','.join(['%s'] * len(chunk))),
+                      tuple(args) + tuple(chunk)):
+            yield row
+
 def search_to_sql(db, columns, terms):
     """Convert a search query into an SQL WHERE clause and corresponding
     parameters.
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011 Edgewall Software
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution. The terms
+# are also available at http://trac.edgewall.org/wiki/TracLicense.
+#
+# This software consists of voluntary contributions made by many
+# individuals. For the exact contribution history, see the revision
+# history and logs, available at http://trac.edgewall.org/log/.
+
+from __future__ import with_statement
+
+from trac.admin import IAdminCommandProvider
+from trac.attachment import AttachmentModule, IAttachmentChangeListener
+from trac.core import *
+from trac.db.api import DatabaseManager, _parse_db_str
+from trac.db.schema import Column, Index, Table
+from trac.env import IEnvironmentSetupParticipant
+from trac.search.api import ISearchIndexBackend, SearchIndex, tokenize
+from trac.ticket.api import IMilestoneChangeListener, ITicketChangeListener
+from trac.util.text import printout
+from trac.util.translation import _
+from trac.wiki.api import IWikiChangeListener
+
+
+class SQLiteFullTextIndex(Component):
+    """Full-text search index using the FTS module of SQLite.
+
+    Only available when the environment uses an SQLite database and the
+    SQLite library provides the FTS3 or FTS4 module.
+    """
+
+    implements(ISearchIndexBackend)
+
+    def __init__(self):
+        self._fts = None
+
+    # ISearchIndexBackend methods
+
+    def is_available(self):
+        if self._fts is None:
+            self._fts = ''
+            scheme, args = _parse_db_str(DatabaseManager(self.env)
+                                         .connection_uri)
+            if scheme == 'sqlite':
+                from trac.db.sqlite_backend import sqlite_version
+                try:
+                    for enabled, in self.env.db_query("""
+                            SELECT sqlite_compileoption_used('ENABLE_FTS3')
+                            """):
+                        if enabled:
+                            self._fts = 'fts4' if sqlite_version >= (3, 7, 4) \
+                                        else 'fts3'
+                except self.env.db_exc.Error:
+                    pass # no sqlite_compileoption_used(), SQLite < 3.6.23
+        return bool(self._fts)
+
+    def clear(self):
+        with self.env.db_transaction as db:
+            db("DROP TABLE IF EXISTS search_fulltext")
+            db("DROP TABLE IF EXISTS search_document")
+            db("""CREATE TABLE search_document (
+                      docid integer PRIMARY KEY,
+                      realm text,
+                      id text,
+                      UNIQUE (realm, id))""")
+            db("CREATE VIRTUAL TABLE search_fulltext USING %s(words)"
+               % self._fts)
+
+    def add_documents(self, realm, documents):
+        with self.env.db_transaction as db:
+            cursor = db.cursor()
+            for id, text in documents:
+                words = ' '.join(tokenize(text))
+                for docid, in db("""
+                        SELECT docid FROM search_document
+                        WHERE realm=%s AND id=%s
+                        """, (realm, id)):
+                    db("UPDATE search_fulltext SET words=%s WHERE docid=%s",
+                       (words, docid))
+                    break
+                else:
+                    cursor.execute("""
+                        INSERT INTO search_document (realm, id)
+                        VALUES (%s, %s)
+                        """, (realm, id))
+                    docid = db.get_last_id(cursor, 'search_document')
+                    db("""INSERT INTO search_fulltext (docid, words)
+                          VALUES (%s, %s)""", (docid, words))
+
+    def remove_documents(self, realm, ids):
+        with self.env.db_transaction as db:
+            for id in ids:
+                for docid, in db("""
+                        SELECT docid FROM search_document
+                        WHERE realm=%s AND id=%s
+                        """, (realm, id)):
+                    db("DELETE FROM search_fulltext WHERE docid=%s", (docid,))
+                    db("DELETE FROM search_document WHERE docid=%s",
+                       (docid,))
+
+    def find_documents(self, realm, terms):
+        # Each term is a phrase whose last word is a prefix
+        query = ' '.join('"%s*"' % ' '.join(words) for words in terms)
+        return [id for id, in self.env.db_query("""
+                SELECT d.id FROM search_fulltext f
+                  INNER JOIN search_document d ON (d.docid = f.docid)
+                WHERE f.words MATCH %s AND d.realm=%s
+                """, (query, realm))]
+
+
+class DatabaseFullTextIndex(Component):
+    """Full-text search index stored as a table of words in the database.
+
+    This is the fallback for databases without full-text search support.
+    Each document is stored as the set of its distinct words, so the
+    updates are done within the database transactions and don't depend
+    on the size of the index. Unlike the other backends, it doesn't store
+    the position of the words, so a search term made of several words
+    matches the documents containing all these words.
+    """
+
+    implements(ISearchIndexBackend)
+
+    # ISearchIndexBackend methods
+
+    def is_available(self):
+        return True
+
+    def clear(self):
+        table = Table('search_word', key=('realm', 'word', 'id'))[
+            Column('realm', key_size=16),
+            Column('word', key_size=64),
+            Column('id', key_size=120),
+            Index(['realm', 'id'])]
+        db_connector, _ = DatabaseManager(self.env).get_connector()
+        with self.env.db_transaction as db:
+            db("DROP TABLE IF EXISTS search_word")
+            for stmt in db_connector.to_sql(table):
+                db(stmt)
+
+    def add_documents(self, realm, documents):
+        with self.env.db_transaction as db:
+            for id, text in documents:
+                db("DELETE FROM search_word WHERE realm=%s AND id=%s",
+                   (realm, id))
+                db.executemany("""
+                    INSERT INTO search_word (realm, word, id)
+                    VALUES (%s, %s, %s)
+                    """, [(realm, word, id)
+                          for word in sorted(set(tokenize(text)))])
+
+    def remove_documents(self, realm, ids):
+        with self.env.db_transaction as db:
+            for id in ids:
+                db("DELETE FROM search_word WHERE realm=%s AND id=%s",
+                   (realm, id))
+
+    def find_documents(self, realm, terms):
+        found = None
+        with self.env.db_query as db:
+            for term in terms:
+                ids = set(id for id, in db("""
+                    SELECT DISTINCT id FROM search_word
+                    WHERE realm=%%s AND word %s
+                    """ % db.like(), (realm, db.like_escape(term[-1]) + '%')))
+                for word in term[:-1]:
+                    if not ids:
+                        break
+                    ids &= set(id for id, in db("""
+                        SELECT id FROM search_word
+                        WHERE realm=%s AND word=%s
+                        """, (realm, word)))
+                found = ids if found is None else found & ids
+                if not found:
+                    break
+        return list(found or ())
+
+
+class SearchIndexUpdater(Component):
+    """Keep the full-text search index up to date with the changes made
+    to the tickets, milestones, wiki pages and attachments.
+
+    The changesets are indexed when they are synchronized in the
+    repository cache.
+    """
+
+    implements(IAdminCommandProvider, IAttachmentChangeListener,
+               IEnvironmentSetupParticipant, IMilestoneChangeListener,
+               ITicketChangeListener, IWikiChangeListener)
+
+    # IAdminCommandProvider methods
+
+    def get_admin_commands(self):
+        yield ('search reindex', '',
+               """Rebuild the full-text search index
+
+               The index is built with the first available backend listed
+               in the `[search] index_backends` option. Until it has been
+               built, or after the backend has changed, the searches don't
+               use the index.
+               """,
+               None, self._do_reindex)
+
+    def _do_reindex(self):
+        index = SearchIndex(self.env)
+        index.rebuild()
+        printout(_("Full-text search index built with %(backend)s.",
+                   backend=index.built_backend))
+
+    # IEnvironmentSetupParticipant methods
+
+    def environment_created(self):
+        if SearchIndex(self.env).backend is not None:
+            SearchIndex(self.env).rebuild()
+
+    def environment_needs_upgrade(self, db):
+        return False
+
+    def upgrade_environment(self, db):
+        pass
+
+    # IAttachmentChangeListener methods
+
+    def attachment_added(self, attachment):
+        SearchIndex(self.env).update_documents('attachment',
+            [self._attachment_id(attachment)])
+
+    def attachment_deleted(self, attachment):
+        SearchIndex(self.env).remove_documents('attachment',
+            [self._attachment_id(attachment)])
+
+    def attachment_reparented(self, attachment, old_parent_realm,
+                              old_parent_id):
+        SearchIndex(self.env).remove_documents('attachment',
+            [AttachmentModule.search_document_id(old_parent_realm,
+                                                 old_parent_id,
+                                                 attachment.filename)])
+        self.attachment_added(attachment)
+
+    # IMilestoneChangeListener methods
+
+    def milestone_created(self, milestone):
+        SearchIndex(self.env).update_documents('milestone', [milestone.name])
+
+    def milestone_changed(self, milestone, old_values):
+        SearchIndex(self.env).update_documents('milestone',
+            [milestone.name, old_values.get('name', milestone.name)])
+
+    def milestone_deleted(self, milestone):
+        SearchIndex(self.env).remove_documents('milestone', [milestone.name])
+
+    # ITicketChangeListener methods
+
+    def ticket_created(self, ticket):
+        SearchIndex(self.env).update_documents('ticket', [unicode(ticket.id)])
+
+    def ticket_changed(self, ticket, comment, author, old_values):
+        self.ticket_created(ticket)
+
+    def ticket_deleted(self, ticket):
+        SearchIndex(self.env).remove_documents('ticket', [unicode(ticket.id)])
+
+    def ticket_comment_modified(self, ticket, cdate, author, comment,
+                                old_comment):
+        self.ticket_created(ticket)
+
+    def ticket_change_deleted(self, ticket, cdate, changes):
+        self.ticket_created(ticket)
+
+    # IWikiChangeListener methods
+
+    def wiki_page_added(self, page):
+        SearchIndex(self.env).update_documents('wiki', [page.name])
+
+    def wiki_page_changed(self, page, version, t, comment, author, ipnr):
+        self.wiki_page_added(page)
+
+    def wiki_page_deleted(self, page):
+        SearchIndex(self.env).remove_documents('wiki', [page.name])
+
+    def wiki_page_version_deleted(self, page):
+        self.wiki_page_added(page)
+
+    def wiki_page_renamed(self, page, old_name):
+        SearchIndex(self.env).update_documents('wiki', [page.name, old_name])
+
+    # Internal methods
+
+    def _attachment_id(self, attachment):
+        return AttachmentModule.search_document_id(attachment.parent_realm,
+                                                   attachment.parent_id,
+                                                   attachment.filename)
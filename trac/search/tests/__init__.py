@@ -0,0 +1,15 @@
+import doctest
+import unittest
+
+import trac.search.api
+from trac.search.tests import index, web_ui
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(index.suite())
+    suite.addTest(web_ui.suite())
+    suite.addTest(doctest.DocTestSuite(trac.search.api))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
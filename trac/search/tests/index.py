@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+from StringIO import StringIO
+import tempfile
+import unittest
+
+from trac.attachment import Attachment
+from trac.core import TracError
+from trac.perm import PermissionCache, PermissionSystem
+from trac.search.api import SearchIndex
+from trac.search.index import DatabaseFullTextIndex, SQLiteFullTextIndex
+from trac.test import EnvironmentStub, Mock, MockPerm
+from trac.ticket.model import Milestone, Ticket
+import trac.ticket.roadmap
+from trac.ticket.web_ui import TicketModule
+from trac.web.href import Href
+from trac.wiki.model import WikiPage
+from trac.wiki.web_ui import WikiModule
+
+
+class SearchIndexTestCase(unittest.TestCase):
+
+    backend = None
+
+    def setUp(self):
+        self.env = EnvironmentStub(default_data=True)
+        self.env.path = os.path.join(tempfile.gettempdir(), 'trac-tempenv')
+        os.makedirs(os.path.join(self.env.path, 'db'))
+        self.env.config.set('search', 'index_backends',
+                            self.backend.__name__)
+        self.index = SearchIndex(self.env)
+
+    def tearDown(self):
+        shutil.rmtree(self.env.path)
+        self.env.reset_db()
+
+    def _insert_ticket(self, summary, **kw):
+        ticket = Ticket(self.env)
+        ticket['summary'] = summary
+        ticket['reporter'] = 'joe'
+        for name, value in kw.iteritems():
+            ticket[name] = value
+        ticket.insert()
+        return ticket
+
+    def _find(self, realm, *terms):
+        return sorted(self.index.find_documents(realm, list(terms)))
+
+    def test_not_used_before_rebuild(self):
+        self._insert_ticket('Foo')
+        self.assertEqual(None, self.index.find_documents('ticket', ['foo']))
+        self.index.rebuild()
+        self.assertEqual(['1'], self._find('ticket', 'foo'))
+
+    def test_rebuild_without_backend(self):
+        self.env.config.set('search', 'index_backends', '')
+        self.assertRaises(TracError, self.index.rebuild)
+
+    def test_find_words_and_prefixes(self):
+        self._insert_ticket('The quick brown fox')
+        self._insert_ticket('The lazy dog', description='Brownish')
+        self.index.rebuild()
+        self.assertEqual(['1', '2'], self._find('ticket', 'the'))
+        self.assertEqual(['1', '2'], self._find('ticket', 'BROWN'))
+        self.assertEqual(['1'], self._find('ticket', 'brown', 'qui'))
+        self.assertEqual(['2'], self._find('ticket', 'lazy dog'))
+        self.assertEqual([], self._find('ticket', 'cat'))
+        self.assertEqual([], self._find('wiki', 'fox'))
+        self.assertEqual(None, self.index.find_documents('ticket', ['+']))
+
+    def test_ticket_changes(self):
+        self.index.rebuild()
+        ticket = self._insert_ticket('Foo')
+        self.assertEqual(['1'], self._find('ticket', 'foo'))
+        ticket['summary'] = 'Bar'
+        ticket.save_changes('joe', 'Some comment')
+        self.assertEqual([], self._find('ticket', 'foo'))
+        self.assertEqual(['1'], self._find('ticket', 'bar'))
+        self.assertEqual(['1'], self._find('ticket', 'comment'))
+        ticket.modify_comment(ticket['changetime'], 'joe', 'Edited')
+        self.assertEqual([], self._find('ticket', 'comment'))
+        self.assertEqual(['1'], self._find('ticket', 'edited'))
+        ticket['owner'] = 'someone'
+        ticket['status'] = 'assigned'
+        ticket.save_changes('joe', '')
+        self.assertEqual([], self._find('ticket', 'someone'))
+        self.assertEqual([], self._find('ticket', 'assigned'))
+        ticket.delete()
+        self.assertEqual([], self._find('ticket', 'bar'))
+
+    def test_wiki_changes(self):
+        self.index.rebuild()
+        page = WikiPage(self.env, 'SomePage')
+        page.text = 'Hello world'
+        page.save('joe', '', '::1')
+        self.assertEqual(['SomePage'], self._find('wiki', 'hello'))
+        page.rename('OtherPage')
+        self.assertEqual(['OtherPage'], self._find('wiki', 'hello'))
+        page.delete()
+        self.assertEqual([], self._find('wiki', 'hello'))
+
+    def test_milestone_changes(self):
+        self.index.rebuild()
+        milestone = Milestone(self.env)
+        milestone.name = 'release'
+        milestone.description = 'First release'
+        milestone.insert()
+        self.assertEqual(['release'], self._find('milestone', 'first'))
+        milestone.name = 'v1'
+        milestone.update()
+        self.assertEqual(['v1'], self._find('milestone', 'first'))
+
+    def test_attachment_changes(self):
+        self.index.rebuild()
+        attachment = Attachment(self.env, 'wiki', 'Some/Page')
+        attachment.description = 'Screenshot'
+        attachment.insert('shot.png', StringIO(''), 0)
+        self.assertEqual([u'wiki:Some/Page/shot.png'],
+                         self._find('attachment', 'screen'))
+        attachment.delete()
+        self.assertEqual([], self._find('attachment', 'screen'))
+
+    def test_search_results(self):
+        self._insert_ticket('Foo bar')
+        self._insert_ticket('Foo baz')
+        page = WikiPage(self.env, 'FooPage')
+        page.text = 'Foo bar'
+        page.save('joe', '', '::1')
+        self.index.rebuild()
+        req = Mock(perm=MockPerm(), href=Href('/trac'))
+        results = TicketModule(self.env).get_search_results(
+            req, ['foo', 'bar'], ['ticket'])
+        self.assertEqual(['/trac/ticket/1'], [r[0] for r in results])
+        results = WikiModule(self.env).get_search_results(
+            req, ['bar'], ['wiki'])
+        self.assertEqual(['/trac/wiki/FooPage'], [r[0] for r in results])
+
+    def test_search_results_permissions(self):
+        self._insert_ticket('Foo bar')
+        page = WikiPage(self.env, 'FooPage')
+        page.text = 'Foo bar'
+        page.save('joe', '', '::1')
+        self.index.rebuild()
+        PermissionSystem(self.env).revoke_permission('anonymous', 'WIKI_VIEW')
+        req = Mock(perm=PermissionCache(self.env, 'anonymous'),
+                   href=Href('/trac'))
+        results = TicketModule(self.env).get_search_results(
+            req, ['foo'], ['ticket'])
+        self.assertEqual(['/trac/ticket/1'], [r[0] for r in results])
+        results = WikiModule(self.env).get_search_results(
+            req, ['foo'], ['wiki'])
+        self.assertEqual([], list(results))
+
+
+class SQLiteFullTextIndexTestCase(SearchIndexTestCase):
+
+    backend = SQLiteFullTextIndex
+
+
+class DatabaseFullTextIndexTestCase(SearchIndexTestCase):
+
+    backend = DatabaseFullTextIndex
+
+
+def suite():
+    suite = unittest.TestSuite()
+    env = EnvironmentStub()
+    if SQLiteFullTextIndex(env).is_available():
+        suite.addTest(unittest.makeSuite(SQLiteFullTextIndexTestCase, 'test'))
+    else:
+        print "SKIP: search/tests/index.py (no SQLite FTS module)"
+    suite.addTest(unittest.makeSuite(DatabaseFullTextIndexTestCase, 'test'))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
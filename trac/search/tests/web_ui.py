@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+import unittest
+
+from genshi.builder import tag
+
+from trac.core import Component, ComponentMeta, implements
+from trac.search.api import ISearchSource
+from trac.search.web_ui import SearchModule
+from trac.test import EnvironmentStub, Mock
+from trac.util.datefmt import utc
+from trac.util.html import Markup
+
+
+class SearchModuleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub()
+        self.now = datetime.now(utc)
+        self._old_registry = ComponentMeta._registry
+        ComponentMeta._registry = {}
+        self.search = SearchModule(self.env)
+        self.search.RESULTS_PER_PAGE = 2
+
+    def tearDown(self):
+        ComponentMeta._registry = self._old_registry
+
+    def _source(self, results):
+        now = self.now
+        class Source(Component):
+            implements(ISearchSource)
+            def get_search_filters(self, req):
+                yield ('wiki', 'Wiki')
+            def get_search_results(self, req, terms, filters):
+                for name, days, text in results:
+                    yield (name, name, now - timedelta(days=days), 'joe',
+                           text)
+        return Source
+
+    def _do_search(self, terms, page=1):
+        req = Mock()
+        results, num_items = self.search._do_search(req, terms, ['wiki'],
+                                                    page)
+        return [r[0] for r in results], num_items
+
+    def test_ranked_by_frequency_and_age(self):
+        self._source([('A', 1, 'foo'), ('B', 1, 'foo foo foo'),
+                      ('C', 900, 'foo foo foo'), ('D', 0, 'foo')])
+        self.assertEqual((['B', 'D'], 4), self._do_search(['foo']))
+        self.assertEqual((['A', 'C'], 4), self._do_search(['foo'], 2))
+
+    def test_last_page(self):
+        self._source([('A', 1, 'foo foo'), ('B', 2, 'foo'), ('C', 3, 'foo')])
+        self.assertEqual((['C'], 3), self._do_search(['foo'], 2))
+        self.assertEqual(([], 3), self._do_search(['foo'], 3))
+
+    def test_markup_excerpts(self):
+        self._source([('A', 1, tag.em('foo')),
+                      ('B', 1, Markup('<em>foo</em> foo'))])
+        self.assertEqual((['B', 'A'], 2), self._do_search(['foo']))
+
+
+def suite():
+    return unittest.makeSuite(SearchModuleTestCase, 'test')
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -14,6 +14,9 @@
 #
 # Author: Jonas Borgström <jonas@edgewall.com>
 
+from datetime import datetime
+import heapq
+from math import log
 import pkg_resources
 import re
 
@@ -24,8 +27,8 @@ from trac.core import *
 from trac.mimeview import RenderingContext
 from trac.perm import IPermissionRequestor
 from trac.search.api import ISearchSource
-from trac.util.datefmt import format_datetime, user_time
-from trac.util.html import find_element
+from trac.util.datefmt import format_datetime, to_utimestamp, user_time, utc
+from trac.util.html import find_element, plaintext
 from trac.util.presentation import Paginator
 from trac.util.text import quote_query_string
 from trac.util.translation import _
@@ -103,9 +106,12 @@ class SearchModule(Component):
 
             terms = self._parse_query(req, query)
             if terms:
-                results = self._do_search(req, terms, filters)
-                if results:
-                    data.update(self._prepare_results(req, filters, results))
+                page = int(req.args.get('page', '1'))
+                results, num_items = self._do_search(req, terms, filters,
+                                                     page)
+                if num_items:
+                    data.update(self._prepare_results(req, filters, results,
+                                                      page, num_items))
 
         add_stylesheet(req, 'common/css/search.css')
         return 'search.html', data, None
@@ -207,16 +213,45 @@ class SearchModule(Component):
                            'Query must be at least %(num)s characters long.',
                            num=self.min_query_length))
 
-    def _do_search(self, req, terms, filters):
-        results = []
-        for source in self.search_sources:
-            results.extend(source.get_search_results(req, terms, filters)
-                           or [])
-        return sorted(results, key=lambda x: x[2], reverse=True)
+    def _do_search(self, req, terms, filters, page=1):
+        """Return the results shown on `page` and the total number of
+        results.
 
-    def _prepare_results(self, req, filters, results):
-        page = int(req.args.get('page', '1'))
-        results = Paginator(results, page - 1, self.RESULTS_PER_PAGE)
+        The results are ranked by decreasing relevance. Only the ranks are
+        kept in a heap, so that just the results of the requested page are
+        sorted.
+        """
+        now = datetime.now(utc)
+        heap = []
+        for source in self.search_sources:
+            for result in source.get_search_results(req, terms, filters) \
+                          or []:
+                heap.append((-self._score(result, terms, now),
+                             -to_utimestamp(result[2]), len(heap), result))
+        heapq.heapify(heap)
+        num_items = len(heap)
+        start = (page - 1) * self.RESULTS_PER_PAGE
+        stop = min(start + self.RESULTS_PER_PAGE, num_items)
+        results = [heapq.heappop(heap)[-1] for idx in xrange(stop)]
+        return results[start:], num_items
+
+    def _score(self, result, terms, now):
+        """Return the relevance of a search result, based on the number of
+        occurrences of the terms in its title and excerpt, the title
+        counting double, and decreasing with its age.
+        """
+        title = plaintext(result[1] or '', False).lower()
+        excerpt = plaintext(result[4] or '', False).lower()
+        frequency = 0
+        for term in terms:
+            term = term.lower()
+            frequency += 2 * title.count(term) + excerpt.count(term)
+        age = max((now - result[2]).days, 0)
+        return (1 + log(1 + frequency)) / (1 + age / 365.0)
+
+    def _prepare_results(self, req, filters, results, page, num_items):
+        results = Paginator(results, page - 1, self.RESULTS_PER_PAGE,
+                            num_items)
         for idx, result in enumerate(results):
             results[idx] = {'href': result[0], 'title': result[1],
                             'date': user_time(req, format_datetime, result[2]),
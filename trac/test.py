@@ -116,6 +116,9 @@ class MockPerm(object):
         pass
     assert_permission = require
 
+    def filter(self, action, resources):
+        return list(resources)
+
 
 class TestSetup(unittest.TestSuite):
     """
@@ -414,13 +417,16 @@ def suite():
     import trac.admin.tests
     import trac.db.tests
     import trac.mimeview.tests
+    import trac.search.tests
     import trac.ticket.tests
+    import trac.timeline.tests
     import trac.util.tests
     import trac.versioncontrol.tests
     import trac.versioncontrol.web_ui.tests
     import trac.web.tests
     import trac.wiki.tests
     import tracopt.mimeview.tests
+    import tracopt.perm.tests
 
     suite = unittest.TestSuite()
     suite.addTest(trac.tests.basicSuite())
@@ -429,13 +435,16 @@ def suite():
     suite.addTest(trac.admin.tests.suite())
     suite.addTest(trac.db.tests.suite())
     suite.addTest(trac.mimeview.tests.suite())
+    suite.addTest(trac.search.tests.suite())
     suite.addTest(trac.ticket.tests.suite())
+    suite.addTest(trac.timeline.tests.suite())
     suite.addTest(trac.util.tests.suite())
     suite.addTest(trac.versioncontrol.tests.suite())
     suite.addTest(trac.versioncontrol.web_ui.tests.suite())
     suite.addTest(trac.web.tests.suite())
     suite.addTest(trac.wiki.tests.suite())
     suite.addTest(tracopt.mimeview.tests.suite())
+    suite.addTest(tracopt.perm.tests.suite())
     suite.addTest(doctest.DocTestSuite(sys.modules[__name__]))
 
     return suite
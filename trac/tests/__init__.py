@@ -1,6 +1,6 @@
 import unittest
 
-from trac.tests import attachment, config, core, env, perm, resource, \
+from trac.tests import attachment, cache, config, core, env, perm, resource, \
                        wikisyntax, functional
 
 def suite():
@@ -12,6 +12,7 @@ def suite():
 def basicSuite():
     suite = unittest.TestSuite()
     suite.addTest(attachment.suite())
+    suite.addTest(cache.suite())
     suite.addTest(config.suite())
     suite.addTest(core.suite())
     suite.addTest(env.suite())
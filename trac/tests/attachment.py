@@ -156,6 +156,13 @@ class AttachmentTestCase(unittest.TestCase):
         attachment = Attachment(self.env, 'ticket', 42)
         self.assert_('ATTACHMENT_VIEW' in self.perm(attachment.resource))
 
+    def test_legacy_permission_on_parent_batch(self):
+        resources = [Resource('ticket', 42).child('attachment', 'foo.txt'),
+                     Resource('wiki', 'WikiStart').child('attachment',
+                                                         'bar.txt')]
+        self.assertEqual(resources[:1],
+                         self.perm.filter('ATTACHMENT_VIEW', resources))
+
     def test_resource_doesnt_exist(self):
         r = Resource('wiki', 'WikiStart').child('attachment', 'file.txt')
         self.assertEqual(False, AttachmentModule(self.env).resource_exists(r))
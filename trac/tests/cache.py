@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011 Edgewall Software
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution. The terms
+# are also available at http://trac.edgewall.org/wiki/TracLicense.
+#
+# This software consists of voluntary contributions made by many
+# individuals. For the exact contribution history, see the revision
+# history and logs, available at http://trac.edgewall.org/log/.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from genshi.core import Markup
+
+from trac.cache import FileCache
+from trac.test import EnvironmentStub
+
+
+class FileCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='trac-testdir-')
+        self.cache = FileCache(os.path.join(self.path, 'cache'), 2000)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _set_mtime(self, key, mtime):
+        filename = self.cache._filename(key)
+        os.utime(filename, (mtime, mtime))
+
+    def test_get_missing(self):
+        self.assertRaises(KeyError, self.cache.__getitem__, ('a', 1))
+
+    def test_set_and_get(self):
+        value = [{'lines': [Markup(u'<del>x</del>')]}, None]
+        self.cache[('a', 1)] = value
+        self.assertEqual(value, self.cache[('a', 1)])
+        self.assertEqual(Markup, type(self.cache[('a', 1)][0]['lines'][0]))
+        self.assertEqual(value, FileCache(self.cache.path, 2000)[('a', 1)])
+        self.assertRaises(KeyError, self.cache.__getitem__, ('a', 2))
+
+    def test_evict_least_recently_used(self):
+        for i in range(3):
+            self.cache[i] = 'x' * 500
+            self._set_mtime(i, 1000 + i)
+        self.cache[0] # marks 0 as recently used
+        self.cache[3] = 'x' * 500
+        self.assertEqual('x' * 500, self.cache[0])
+        self.assertRaises(KeyError, self.cache.__getitem__, 1)
+        self.assertEqual('x' * 500, self.cache[2])
+        self.assertEqual('x' * 500, self.cache[3])
+
+    def test_unreadable_file(self):
+        self.cache['a'] = 'value'
+        f = open(self.cache._filename('a'), 'wb')
+        try:
+            f.write('garbage')
+        finally:
+            f.close()
+        self.assertRaises(KeyError, self.cache.__getitem__, 'a')
+
+    def test_clear(self):
+        self.cache['a'] = 'value'
+        self.cache.clear()
+        self.assertRaises(KeyError, self.cache.__getitem__, 'a')
+
+    def test_for_option(self):
+        env = EnvironmentStub()
+        env.path = self.path
+        env.config.set('changeset', 'diff_cache_size', 4)
+        cache = FileCache.for_option(env, 'changeset', 'diff_cache_size',
+                                     'diff')
+        self.assertEqual(os.path.join(self.path, 'cache', 'diff'), cache.path)
+        self.assertEqual(4096, cache.max_size)
+        env.config.set('changeset', 'diff_cache_size', 8)
+        self.assertTrue(cache is FileCache.for_option(env, 'changeset',
+                                                      'diff_cache_size',
+                                                      'diff'))
+        self.assertEqual(8192, cache.max_size)
+        env.config.set('changeset', 'diff_cache_size', 0)
+        self.assertEqual(None, FileCache.for_option(env, 'changeset',
+                                                    'diff_cache_size', 'diff'))
+
+
+def suite():
+    return unittest.makeSuite(FileCacheTestCase, 'test')
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
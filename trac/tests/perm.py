@@ -1,5 +1,6 @@
 from trac import perm
 from trac.core import *
+from trac.resource import Resource
 from trac.test import EnvironmentStub
 
 import unittest
@@ -66,6 +67,28 @@ class DefaultPermissionStoreTestCase(unittest.TestCase):
         self.assertEquals(['TICKET_CREATE'],
                           self.store.get_user_permissions('anonymous'))
 
+    def test_cyclic_groups(self):
+        self.env.db_transaction.executemany(
+            "INSERT INTO permission VALUES (%s,%s)",
+            [('dev', 'WIKI_MODIFY'),
+             ('dev', 'admin'),
+             ('admin', 'REPORT_ADMIN'),
+             ('admin', 'dev'),
+             ('john', 'admin')])
+        self.assertEquals(['REPORT_ADMIN', 'WIKI_MODIFY'],
+                          sorted(self.store.get_user_permissions('john')))
+
+    def test_grant_revoke_invalidate_cache(self):
+        self.store.grant_permission('dev', 'WIKI_MODIFY')
+        self.store.grant_permission('john', 'dev')
+        self.assertEquals(['WIKI_MODIFY'],
+                          self.store.get_user_permissions('john'))
+        self.store.grant_permission('dev', 'REPORT_ADMIN')
+        self.assertEquals(['REPORT_ADMIN', 'WIKI_MODIFY'],
+                          sorted(self.store.get_user_permissions('john')))
+        self.store.revoke_permission('john', 'dev')
+        self.assertEquals([], self.store.get_user_permissions('john'))
+
     def test_get_all_permissions(self):
         self.env.db_transaction.executemany(
             "INSERT INTO permission VALUES (%s,%s)",
@@ -215,11 +238,26 @@ class TestPermissionPolicy(Component):
         return result
 
 
+class TestBatchPermissionPolicy(Component):
+    implements(perm.IPermissionPolicy)
+
+    def __init__(self):
+        self.batches = []
+
+    def check_permission(self, action, username, resource, perm):
+        return self.check_permissions(action, username, [resource], perm)[0]
+
+    def check_permissions(self, action, username, resources, perm):
+        self.batches.append([resource.id for resource in resources])
+        return [None if resource.id % 3 else False for resource in resources]
+
+
 class PermissionPolicyTestCase(unittest.TestCase):
     def setUp(self):
         self.env = EnvironmentStub(enable=[perm.DefaultPermissionStore,
                                            perm.DefaultPermissionPolicy,
                                            TestPermissionPolicy,
+                                           TestBatchPermissionPolicy,
                                            TestPermissionRequestor])
         self.env.config.set('trac', 'permission_policies', 'TestPermissionPolicy')
         self.policy = TestPermissionPolicy(self.env)
@@ -259,6 +297,37 @@ class PermissionPolicyTestCase(unittest.TestCase):
         self.assertEqual(self.policy.results,
                          {('testuser', 'TEST_MODIFY'): True,
                           ('testuser', 'TEST_ADMIN'): None})
+
+    def test_filter(self):
+        self.env.config.set('trac', 'permission_policies',
+                            'TestBatchPermissionPolicy,TestPermissionPolicy')
+        batch_policy = TestBatchPermissionPolicy(self.env)
+        self.policy.grant('testuser', ['TEST_MODIFY'])
+        resources = [Resource('ticket', id) for id in range(1, 7)]
+        self.assertEqual([1, 2, 4, 5],
+                         [r.id for r in self.perm.filter('TEST_MODIFY',
+                                                         resources)])
+        self.assertEqual([], self.perm.filter('TEST_ADMIN', resources[:2]))
+        self.assertEqual([[1, 2, 3, 4, 5, 6], [1, 2]], batch_policy.batches)
+        # Decisions are cached
+        self.assertEqual(False, 'TEST_MODIFY' in self.perm('ticket', 3))
+        self.assertEqual(True, 'TEST_MODIFY' in self.perm('ticket', 4))
+        self.assertEqual([1, 2],
+                         [r.id for r in self.perm.filter('TEST_MODIFY',
+                                                         resources[:3])])
+        self.assertEqual(2, len(batch_policy.batches))
+
+    def test_filter_default_policy(self):
+        self.env.config.set('trac', 'permission_policies',
+                            'DefaultPermissionPolicy')
+        perm.PermissionSystem(self.env).grant_permission('testuser',
+                                                         'TEST_MODIFY')
+        resources = [Resource('ticket', id) for id in range(1, 3)]
+        self.assertEqual(resources, self.perm.filter('TEST_MODIFY',
+                                                     resources))
+        self.assertEqual([], self.perm.filter('TEST_ADMIN', resources))
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(DefaultPermissionStoreTestCase, 'test'))
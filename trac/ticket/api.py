@@ -14,6 +14,8 @@
 #
 # Author: Jonas Borgström <jonas@edgewall.com>
 
+from __future__ import with_statement
+
 import copy
 import re
 
@@ -27,7 +29,7 @@ from trac.resource import IResourceManager
 from trac.util import Ranges, as_int
 from trac.util.text import shorten_line
 from trac.util.translation import _, N_, gettext
-from trac.wiki import IWikiSyntaxProvider, WikiParser
+from trac.wiki import IWikiLinkPrefetcher, IWikiSyntaxProvider, WikiParser
 
 
 class ITicketActionController(Interface):
@@ -122,6 +124,24 @@ class ITicketChangeListener(Interface):
     def ticket_deleted(ticket):
         """Called when a ticket is deleted."""
 
+    # The following methods are optional, and only called if they are
+    # defined by the listener (''since 0.13'')
+
+    def ticket_comment_modified(ticket, cdate, author, comment, old_comment):
+        """Called when a ticket comment is modified.
+
+        `cdate` is the date of the change containing the comment, and
+        `old_comment` the previous text of the comment.
+        """
+
+    def ticket_change_deleted(ticket, cdate, changes):
+        """Called when a ticket change is deleted.
+
+        `changes` is a dictionary mapping the fields changed by the
+        deleted change, including the comment, to their `(old, new)`
+        values.
+        """
+
 
 class ITicketManipulator(Interface):
     """Miscellaneous manipulation of ticket workflow features."""
@@ -158,7 +178,8 @@ class IMilestoneChangeListener(Interface):
 
 
 class TicketSystem(Component):
-    implements(IPermissionRequestor, IWikiSyntaxProvider, IResourceManager)
+    implements(IPermissionRequestor, IWikiLinkPrefetcher, IWikiSyntaxProvider,
+               IResourceManager)
 
     change_listeners = ExtensionPoint(ITicketChangeListener)
     milestone_change_listeners = ExtensionPoint(IMilestoneChangeListener)
@@ -426,6 +447,35 @@ class TicketSystem(Component):
                                   'TICKET_EDIT_DESCRIPTION',
                                   'TICKET_EDIT_COMMENT'])]
 
+    # IWikiLinkPrefetcher methods
+
+    def prefetch_links(self, formatter, matches):
+        from trac.ticket.model import Ticket
+        targets = formatter.get_link_targets(matches, ('bug', 'ticket'))
+        targets += [m.group(0)[1:] for m in matches
+                    if m.group('it_ticket') == '' and m.group(0)[0] != '!']
+        ids = set()
+        for target in targets:
+            try:
+                r = Ranges(formatter.split_link(target)[0])
+            except ValueError:
+                continue
+            if len(r) == 1 and Ticket.id_is_valid(r.a):
+                ids.add(r.a)
+        if not ids:
+            return
+        tickets = dict((id, []) for id in ids)
+        keys = list(ids)
+        with self.env.db_query as db:
+            for i in xrange(0, len(keys), 100):
+                chunk = keys[i:i + 100]
+                for id, type, summary, status, resolution in db("""
+                        SELECT id, type, summary, status, resolution
+                        FROM ticket WHERE id IN (%s)
+                        """ % ','.join(['%s'] * len(chunk)), chunk):
+                    tickets[id].append((type, summary, status, resolution))
+        formatter.prefetched.setdefault('ticket', {}).update(tickets)
+
     # IWikiSyntaxProvider methods
 
     def get_link_resolvers(self):
@@ -456,13 +506,13 @@ class TicketSystem(Component):
                 from trac.ticket.model import Ticket
                 if Ticket.id_is_valid(num) and \
                         'TICKET_VIEW' in formatter.perm(ticket):
-                    # TODO: attempt to retrieve ticket view directly,
-                    #       something like: t = Ticket.view(num)
-                    for type, summary, status, resolution in \
-                            self.env.db_query("""
+                    rows = formatter.prefetched.get('ticket', {}).get(num)
+                    if rows is None:
+                        rows = self.env.db_query("""
                             SELECT type, summary, status, resolution
                             FROM ticket WHERE id=%s
-                            """, (str(num),)):
+                            """, (str(num),))
+                    for type, summary, status, resolution in rows:
                         title = self.format_summary(summary, status,
                                                     resolution, type)
                         href = formatter.href.ticket(num) + params + fragment
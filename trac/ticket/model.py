@@ -459,12 +459,15 @@ class Ticket(object):
         ts = to_utimestamp(cdate)
         with self.env.db_transaction as db:
             # Find modified fields and their previous value
+            changes = dict((field, (old, new))
+                           for field, old, new in db("""
+                             SELECT field, oldvalue, newvalue
+                             FROM ticket_change WHERE ticket=%s AND time=%s
+                             """, (self.id, ts))
+                           if not field.startswith('_'))
             fields = [(field, old, new)
-                      for field, old, new in db("""
-                        SELECT field, oldvalue, newvalue FROM ticket_change
-                        WHERE ticket=%s AND time=%s
-                        """, (self.id, ts))
-                      if field != 'comment' and not field.startswith('_')]
+                      for field, (old, new) in changes.iteritems()
+                      if field != 'comment']
             for field, oldvalue, newvalue in fields:
                 # Find the next change
                 for next_ts, in db("""SELECT time FROM ticket_change
@@ -505,6 +508,10 @@ class Ticket(object):
 
         self._fetch_ticket(self.id)
 
+        for listener in TicketSystem(self.env).change_listeners:
+            if hasattr(listener, 'ticket_change_deleted'):
+                listener.ticket_change_deleted(self, cdate, changes)
+
     def modify_comment(self, cdate, author, comment, when=None):
         """Modify a ticket comment specified by its date, while keeping a
         history of edits.
@@ -561,6 +568,11 @@ class Ticket(object):
 
         self.values['changetime'] = when
 
+        for listener in TicketSystem(self.env).change_listeners:
+            if hasattr(listener, 'ticket_comment_modified'):
+                listener.ticket_comment_modified(self, cdate, author, comment,
+                                                 old_comment or '')
+
     def get_comment_history(self, cnum=None, cdate=None, db=None):
         """Retrieve the edit history of a comment identified by its number or
         date.
@@ -774,6 +774,12 @@ class Query(object):
                             self.page - 1,
                             self.max,
                             self.num_items)
+
+        # Check the permissions of the shown tickets in a single batch, the
+        # template then finds the decisions in the permission cache
+        if context.perm:
+            context.perm.filter('TICKET_VIEW', [Resource('ticket', t['id'])
+                                                for t in results])
         
         if req:
             if results.has_next_page:
@@ -1131,9 +1137,11 @@ class QueryModule(Component):
 
         context = web_context(req)
         results = query.execute(req)
+        allowed = set(req.perm.filter('TICKET_VIEW',
+                      [Resource('ticket', result['id']) for result in results]))
         for result in results:
             ticket = Resource('ticket', result['id'])
-            if 'TICKET_VIEW' in req.perm(ticket):
+            if ticket in allowed:
                 values = []
                 for col in cols:
                     value = result[col]
@@ -1153,6 +1161,8 @@ class QueryModule(Component):
         if 'description' not in query.rows:
             query.rows.append('description')
         results = query.execute(req)
+        req.perm.filter('TICKET_VIEW', [Resource('ticket', result['id'])
+                                        for result in results])
         data = {
             'context': context,
             'results': results,
@@ -1376,8 +1386,10 @@ class TicketQueryMacro(WikiMacroBase):
         # Formats above had their own permission checks, here we need to
         # do it explicitly:
 
-        tickets = [t for t in tickets 
-                   if 'TICKET_VIEW' in req.perm('ticket', t['id'])]
+        allowed = set(resource.id for resource in req.perm.filter(
+                      'TICKET_VIEW',
+                      [Resource('ticket', t['id']) for t in tickets]))
+        tickets = [t for t in tickets if t['id'] in allowed]
 
         if not tickets:
             return tag.span(_("No results"), class_='query_no_results')
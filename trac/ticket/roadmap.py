@@ -29,7 +29,9 @@ from trac.config import ConfigSection, ExtensionOption
 from trac.core import *
 from trac.perm import IPermissionRequestor
 from trac.resource import *
-from trac.search import ISearchSource, search_to_sql, shorten_result
+from trac.search import ISearchDocumentProvider, ISearchSource, \
+                        SearchIndex, search_by_ids, search_to_sql, \
+                        shorten_result
 from trac.util import as_bool
 from trac.util.datefmt import parse_date, utc, to_utimestamp, \
                               get_datetime_format_hint, format_date, \
@@ -37,12 +39,13 @@ from trac.util.datefmt import parse_date, utc, to_utimestamp, \
 from trac.util.text import CRLF
 from trac.util.translation import _, tag_
 from trac.ticket import Milestone, Ticket, TicketSystem, group_milestones
-from trac.timeline.api import ITimelineEventProvider
+from trac.timeline.api import ITimelineEventProvider, get_timeline_rows, \
+                             merge_events
 from trac.web import IRequestHandler, RequestDone
 from trac.web.chrome import (Chrome, INavigationContributor,
                              add_link, add_notice, add_script, add_stylesheet,
                              add_warning, auth_link, prevnext_nav, web_context)
-from trac.wiki.api import IWikiSyntaxProvider
+from trac.wiki.api import IWikiLinkPrefetcher, IWikiSyntaxProvider
 from trac.wiki.formatter import format_to
 
 
@@ -316,8 +319,9 @@ def get_tickets_for_milestone(env, db=None, milestone=None, field='component'):
 def apply_ticket_permissions(env, req, tickets):
     """Apply permissions to a set of milestone tickets as returned by
     `get_tickets_for_milestone()`."""
-    return [t for t in tickets
-            if 'TICKET_VIEW' in req.perm('ticket', t['id'])]
+    allowed = set(resource.id for resource in req.perm.filter('TICKET_VIEW',
+                  [Resource('ticket', t['id']) for t in tickets]))
+    return [t for t in tickets if t['id'] in allowed]
 
 def milestone_stats_data(env, req, stat, name, grouped_by='component',
                          group=None):
@@ -582,7 +586,8 @@ class MilestoneModule(Component):
     """View and edit individual milestones."""
 
     implements(INavigationContributor, IPermissionRequestor, IRequestHandler,
-               ITimelineEventProvider, IWikiSyntaxProvider, IResourceManager,
+               ITimelineEventProvider, IWikiLinkPrefetcher,
+               IWikiSyntaxProvider, IResourceManager, ISearchDocumentProvider,
                ISearchSource)
  
     stats_provider = ExtensionOption('milestone', 'stats_provider',
@@ -614,23 +619,33 @@ class MilestoneModule(Component):
         if 'MILESTONE_VIEW' in req.perm:
             yield ('milestone', _('Milestones reached'))
 
-    def get_timeline_events(self, req, start, stop, filters):
+    timeline_events_ordered = True
+
+    def get_timeline_events(self, req, start, stop, filters, limit=None):
         if 'milestone' in filters:
             milestone_realm = Resource('milestone')
-            for completed, name, description in self.env.db_query("""
-                    SELECT completed, name, description FROM milestone
-                    WHERE completed>=%s AND completed<=%s
-                    """, (to_utimestamp(start), to_utimestamp(stop))):
-                # TODO: creation and (later) modifications should also be
-                #       reported
-                milestone = milestone_realm(id=name)
-                if 'MILESTONE_VIEW' in req.perm(milestone):
-                    yield ('milestone', from_utimestamp(completed),
-                           '', (milestone, description)) # FIXME: author?
+            def milestone_events():
+                for completed, name, description in get_timeline_rows(
+                        self.env, """
+                        SELECT completed, name, description FROM milestone
+                        WHERE completed>=%s AND completed<=%s
+                        ORDER BY completed DESC, name
+                        """, (to_utimestamp(start), to_utimestamp(stop)),
+                        limit):
+                    # TODO: creation and (later) modifications should also be
+                    #       reported
+                    milestone = milestone_realm(id=name)
+                    if 'MILESTONE_VIEW' in req.perm(milestone):
+                        yield ('milestone', from_utimestamp(completed),
+                               '', (milestone, description)) # FIXME: author?
 
             # Attachments
-            for event in AttachmentModule(self.env).get_timeline_events(
-                req, milestone_realm, start, stop):
+            attachment_events = AttachmentModule(self.env) \
+                                .get_timeline_events(req, milestone_realm,
+                                                     start, stop, limit)
+
+            for event in merge_events([milestone_events(),
+                                       attachment_events]):
                 yield event
                 
     def render_timeline_event(self, context, field, event):
@@ -889,6 +904,26 @@ class MilestoneModule(Component):
 
         return 'milestone_view.html', data, None
 
+    # IWikiLinkPrefetcher methods
+
+    def prefetch_links(self, formatter, matches):
+        names = list(set(formatter.split_link(target)[0] for target in
+                         formatter.get_link_targets(matches, ('milestone',))))
+        if not names:
+            return
+        milestones = dict((name, None) for name in names)
+        with self.env.db_query as db:
+            for i in xrange(0, len(names), 100):
+                chunk = names[i:i + 100]
+                for row in db("""
+                        SELECT name, due, completed, description
+                        FROM milestone WHERE name IN (%s)
+                        """ % ','.join(['%s'] * len(chunk)), chunk):
+                    milestone = Milestone(self.env)
+                    milestone._from_database(row)
+                    milestones[milestone.name] = milestone
+        formatter.prefetched.setdefault('milestone', {}).update(milestones)
+
     # IWikiSyntaxProvider methods
 
     def get_wiki_syntax(self):
@@ -900,13 +935,17 @@ class MilestoneModule(Component):
     def _format_link(self, formatter, ns, name, label):
         name, query, fragment = formatter.split_link(name)
         return self._render_link(formatter.context, name, label,
-                                 query + fragment)
+                                 query + fragment,
+                                 formatter.prefetched.get('milestone'))
 
-    def _render_link(self, context, name, label, extra=''):
-        try:
-            milestone = Milestone(self.env, name)
-        except TracError:
-            milestone = None
+    def _render_link(self, context, name, label, extra='', milestones=None):
+        if milestones is not None and name in milestones:
+            milestone = milestones[name]
+        else:
+            try:
+                milestone = Milestone(self.env, name)
+            except TracError:
+                milestone = None
         # Note: the above should really not be needed, `Milestone.exists`
         # should simply be false if the milestone doesn't exist in the db
         # (related to #4130)
@@ -962,15 +1001,24 @@ class MilestoneModule(Component):
     def get_search_results(self, req, terms, filters):
         if not 'milestone' in filters:
             return
+        milestone_realm = Resource('milestone')
+        ids = SearchIndex(self.env).find_documents('milestone', terms)
         with self.env.db_query as db:
-            sql_query, args = search_to_sql(db, ['name', 'description'], terms)
-
-            milestone_realm = Resource('milestone')
-            for name, due, completed, description in db("""
-                    SELECT name, due, completed, description FROM milestone
-                    WHERE """ + sql_query, args):
+            query = """
+                SELECT name, due, completed, description FROM milestone"""
+            if ids is not None:
+                rows = search_by_ids(db, query, 'name', ids)
+            else:
+                sql_query, args = search_to_sql(db, ['name', 'description'],
+                                                terms)
+                rows = db(query + " WHERE " + sql_query, args)
+            rows = list(rows)
+            allowed = set(req.perm.filter('MILESTONE_VIEW',
+                                          [milestone_realm(id=row[0])
+                                           for row in rows]))
+            for name, due, completed, description in rows:
                 milestone = milestone_realm(id=name)
-                if 'MILESTONE_VIEW' in req.perm(milestone):
+                if milestone in allowed:
                     dt = (from_utimestamp(completed) if completed else
                           from_utimestamp(due) if due else datetime.now(utc))
                     yield (get_resource_url(self.env, milestone, req.href),
@@ -981,3 +1029,14 @@ class MilestoneModule(Component):
         for result in AttachmentModule(self.env).get_search_results(
                 req, milestone_realm, terms):
             yield result
+
+    # ISearchDocumentProvider methods
+
+    def get_search_document_realms(self):
+        yield 'milestone'
+
+    def get_search_documents(self, realm, ids=None):
+        with self.env.db_query as db:
+            for name, description in search_by_ids(db, """
+                    SELECT name, description FROM milestone""", 'name', ids):
+                yield name, '\n'.join([name, description or ''])
@@ -1,7 +1,11 @@
+from trac.mimeview.api import RenderingContext
 from trac.perm import PermissionCache, PermissionSystem
+from trac.resource import Resource
 from trac.ticket.api import TicketSystem
 from trac.ticket.model import Ticket
-from trac.test import EnvironmentStub, Mock
+from trac.test import EnvironmentStub, Mock, MockPerm
+from trac.web.href import Href
+from trac.wiki.formatter import Formatter
 
 import unittest
 
@@ -121,6 +125,21 @@ class TicketSystemTestCase(unittest.TestCase):
         self.assertEqual(['leave'], self._get_actions({'status': 'reopened'}))
         self.assertEqual(['leave'], self._get_actions({'status': 'closed'}))
 
+    def test_prefetch_links(self):
+        for summary in ('First', 'Second'):
+            ticket = Ticket(self.env)
+            ticket.populate({'summary': summary, 'status': 'new'})
+            ticket.insert()
+        context = RenderingContext(Resource('wiki', 'WikiStart'),
+                                   href=Href('/'), perm=MockPerm())
+        context.req = None
+        formatter = Formatter(self.env, context)
+        formatter.format("#1, [ticket:2 two], bug:3, !#4, #5-6\n"
+                         "{{{\n#7\n}}}\n")
+        self.assertEqual({1: [(None, 'First', 'new', None)],
+                          2: [(None, 'Second', 'new', None)], 3: []},
+                         formatter.prefetched['ticket'])
+
 
 def suite():
     return unittest.makeSuite(TicketSystemTestCase, 'test')
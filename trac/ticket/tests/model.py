@@ -36,6 +36,21 @@ class TestTicketChangeListener(core.Component):
         self.action = 'deleted'
         self.ticket = ticket
 
+    def ticket_comment_modified(self, ticket, cdate, author, comment,
+                                old_comment):
+        self.action = 'comment_modified'
+        self.ticket = ticket
+        self.cdate = cdate
+        self.author = author
+        self.comment = comment
+        self.old_comment = old_comment
+
+    def ticket_change_deleted(self, ticket, cdate, changes):
+        self.action = 'change_deleted'
+        self.ticket = ticket
+        self.cdate = cdate
+        self.changes = changes
+
 
 class TicketTestCase(unittest.TestCase):
 
@@ -455,6 +470,18 @@ class TicketCommentEditTestCase(TicketCommentTestCase):
                            new=str(to_utimestamp(t))))
         self.assertEqual(t, Ticket(self.env, self.id)['changetime'])
 
+    def test_change_listener_comment_modified(self):
+        listener = TestTicketChangeListener(self.env)
+        ticket = Ticket(self.env, self.id)
+        ticket.modify_comment(cdate=self.t2, author='jack',
+                              comment='New Comment 2')
+        self.assertEqual('comment_modified', listener.action)
+        self.assertEqual(ticket, listener.ticket)
+        self.assertEqual(self.t2, listener.cdate)
+        self.assertEqual('jack', listener.author)
+        self.assertEqual('New Comment 2', listener.comment)
+        self.assertEqual('Comment 2', listener.old_comment)
+
     def test_threading(self):
         """Check modification of a "threaded" comment"""
         ticket = Ticket(self.env, self.id)
@@ -614,6 +641,17 @@ class TicketCommentDeleteTestCase(TicketCommentTestCase):
         self.assertNotEqual(None, ticket.get_change(cnum=3))
         self.assertEqual(self.t3, ticket.time_changed)
     
+    def test_change_listener_change_deleted(self):
+        listener = TestTicketChangeListener(self.env)
+        ticket = Ticket(self.env, self.id)
+        ticket.delete_change(cnum=4)
+        self.assertEqual('change_deleted', listener.action)
+        self.assertEqual(ticket, listener.ticket)
+        self.assertEqual(self.t4, listener.cdate)
+        self.assertEqual(dict(comment=('4', 'Comment 4'),
+                              keywords=('a, b', 'a'),
+                              foo=('change3', 'change4')), listener.changes)
+
     def test_delete_last_comment_by_date(self):
         ticket = Ticket(self.env, self.id)
         self.assertEqual('a', ticket['keywords'])
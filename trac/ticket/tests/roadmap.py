@@ -1,6 +1,10 @@
-from trac.test import EnvironmentStub
+from trac.mimeview.api import RenderingContext
+from trac.resource import Resource
+from trac.test import EnvironmentStub, MockPerm
 from trac.ticket.roadmap import *
 from trac.core import ComponentManager
+from trac.web.href import Href
+from trac.wiki.formatter import Formatter
 
 import unittest
 
@@ -124,6 +128,28 @@ class DefaultTicketGroupStatsProviderTestCase(unittest.TestCase):
         self.assertEquals(67, open['percent'], 'open percent incorrect')
 
 
+class MilestoneModuleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub(default_data=True)
+
+    def tearDown(self):
+        self.env.reset_db()
+
+    def test_prefetch_links(self):
+        context = RenderingContext(Resource('wiki', 'WikiStart'),
+                                   href=Href('/'), perm=MockPerm())
+        context.req = None
+        formatter = Formatter(self.env, context)
+        formatter.format("milestone:milestone1 [milestone:milestone2 two]\n"
+                         "milestone:missing !milestone:milestone3\n")
+        milestones = formatter.prefetched['milestone']
+        self.assertEqual(['milestone1', 'milestone2', 'missing'],
+                         sorted(milestones))
+        self.assertEqual('milestone2', milestones['milestone2'].name)
+        self.assertEqual(None, milestones['missing'])
+
+
 def in_tlist(ticket, list):
     return len([t for t in list if t['id'] == ticket.id]) > 0
 
@@ -132,6 +158,7 @@ def suite():
     suite.addTest(unittest.makeSuite(TicketGroupStatsTestCase, 'test'))
     suite.addTest(unittest.makeSuite(DefaultTicketGroupStatsProviderTestCase,
                                       'test'))
+    suite.addTest(unittest.makeSuite(MilestoneModuleTestCase, 'test'))
     return suite
 
 if __name__ == '__main__':
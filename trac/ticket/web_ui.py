@@ -31,11 +31,14 @@ from trac.core import *
 from trac.mimeview.api import Mimeview, IContentConverter
 from trac.resource import Resource, ResourceNotFound, get_resource_url, \
                          render_resource_link, get_resource_shortname
-from trac.search import ISearchSource, search_to_sql, shorten_result
+from trac.search import ISearchDocumentProvider, ISearchSource, \
+                        SearchIndex, search_by_ids, search_to_sql, \
+                        shorten_result
 from trac.ticket.api import TicketSystem, ITicketManipulator
 from trac.ticket.model import Milestone, Ticket, group_milestones
 from trac.ticket.notification import TicketNotifyEmail
-from trac.timeline.api import ITimelineEventProvider
+from trac.timeline.api import ITimelineEventProvider, get_timeline_rows, \
+                             merge_events
 from trac.util import as_bool, as_int, get_reporter_id
 from trac.util.datefmt import format_datetime, from_utimestamp, \
                               to_utimestamp, utc
@@ -60,7 +63,8 @@ class InvalidTicket(TracError):
 class TicketModule(Component):
 
     implements(IContentConverter, INavigationContributor, IRequestHandler,
-               ISearchSource, ITemplateProvider, ITimelineEventProvider)
+               ISearchDocumentProvider, ISearchSource, ITemplateProvider,
+               ITimelineEventProvider)
 
     ticket_manipulators = ExtensionPoint(ITicketManipulator)
 
@@ -189,17 +193,21 @@ class TicketModule(Component):
         if not 'ticket' in filters:
             return
         ticket_realm = Resource('ticket')
+        ids = SearchIndex(self.env).find_documents('ticket', terms)
         with self.env.db_query as db:
-            sql, args = search_to_sql(db, ['summary', 'keywords',
-                                           'description', 'reporter', 'cc', 
-                                           db.cast('id', 'text')], terms)
-            sql2, args2 = search_to_sql(db, ['newvalue'], terms)
-            sql3, args3 = search_to_sql(db, ['value'], terms)
-            ticketsystem = TicketSystem(self.env)
-            for summary, desc, author, type, tid, ts, status, resolution in \
-                    db("""SELECT summary, description, reporter, type, id,
-                                 time, status, resolution 
-                          FROM ticket
+            query = """SELECT summary, description, reporter, type, id,
+                              time, status, resolution 
+                       FROM ticket"""
+            if ids is not None:
+                rows = search_by_ids(db, query, 'id', [int(id) for id in ids])
+            else:
+                sql, args = search_to_sql(db, ['summary', 'keywords',
+                                               'description', 'reporter',
+                                               'cc', db.cast('id', 'text')],
+                                          terms)
+                sql2, args2 = search_to_sql(db, ['newvalue'], terms)
+                sql3, args3 = search_to_sql(db, ['value'], terms)
+                rows = db(query + """
                           WHERE id IN (
                               SELECT id FROM ticket WHERE %s
                             UNION
@@ -209,9 +217,16 @@ class TicketModule(Component):
                               SELECT ticket FROM ticket_custom WHERE %s
                           )
                           """ % (sql, sql2, sql3),
-                          args + args2 + args3):
+                          args + args2 + args3)
+            rows = list(rows)
+            allowed = set(req.perm.filter('TICKET_VIEW',
+                                          [ticket_realm(id=row[4])
+                                           for row in rows]))
+            ticketsystem = TicketSystem(self.env)
+            for summary, desc, author, type, tid, ts, status, resolution in \
+                    rows:
                 t = ticket_realm(id=tid)
-                if 'TICKET_VIEW' in req.perm(t):
+                if t in allowed:
                     yield (req.href.ticket(tid),
                            tag_("%(title)s: %(message)s",
                                 title=tag.span(
@@ -227,6 +242,34 @@ class TicketModule(Component):
             req, ticket_realm, terms):
             yield result        
 
+    # ISearchDocumentProvider methods
+
+    def get_search_document_realms(self):
+        yield 'ticket'
+
+    def get_search_documents(self, realm, ids=None):
+        with self.env.db_query as db:
+            if ids is not None:
+                ids = [int(id) for id in ids]
+            texts = {}
+            for row in search_by_ids(db, """
+                    SELECT id, summary, keywords, description, reporter, cc
+                    FROM ticket""", 'id', ids):
+                texts[row[0]] = [unicode(row[0])] + list(row[1:])
+            # Like the plain SQL search, match the comments but not the
+            # other changes
+            for id, value in search_by_ids(db, """
+                    SELECT ticket, newvalue FROM ticket_change
+                    WHERE field='comment'""", 'ticket', ids):
+                if id in texts:
+                    texts[id].append(value)
+            for id, value in search_by_ids(db, """
+                    SELECT ticket, value FROM ticket_custom""", 'ticket', ids):
+                if id in texts:
+                    texts[id].append(value)
+            for id in sorted(texts):
+                yield unicode(id), '\n'.join(t for t in texts[id] if t)
+
     # ITimelineEventProvider methods
 
     def get_timeline_filters(self, req):
@@ -235,7 +278,9 @@ class TicketModule(Component):
             if self.timeline_details:
                 yield ('ticket_details', _("Ticket updates"), False)
 
-    def get_timeline_events(self, req, start, stop, filters):
+    timeline_events_ordered = True
+
+    def get_timeline_events(self, req, start, stop, filters, limit=None):
         ts_start = to_utimestamp(start)
         ts_stop = to_utimestamp(stop)
 
@@ -280,61 +325,69 @@ class TicketModule(Component):
                      description, comment, cid))
 
         # Ticket changes
-        with self.env.db_query as db:
-            if 'ticket' in filters or 'ticket_details' in filters:
-                data = None
-                for id, t, author, type, summary, field, oldvalue, newvalue \
-                        in db("""
-                        SELECT t.id, tc.time, tc.author, t.type, t.summary, 
-                               tc.field, tc.oldvalue, tc.newvalue 
-                        FROM ticket_change tc 
-                            INNER JOIN ticket t ON t.id = tc.ticket 
-                                AND tc.time>=%s AND tc.time<=%s 
-                        ORDER BY tc.time
-                        """ % (ts_start, ts_stop)):
-                    if not (oldvalue or newvalue):
-                        # ignore empty change corresponding to custom field 
-                        # created (None -> '') or deleted ('' -> None)
-                        continue 
-                    if not data or (id, t) != data[:2]:
-                        if data:
-                            ev = produce_event(data, status, fields, comment,
-                                               cid)
-                            if ev:
-                                yield ev
-                        status, fields, comment, cid = 'edit', {}, '', None
-                        data = (id, t, author, type, summary, None)
-                    if field == 'comment':
-                        comment = newvalue
-                        cid = oldvalue and oldvalue.split('.')[-1]
-                        # Always use the author from the comment field
-                        data = data[:2] + (author,) + data[3:]
-                    elif field == 'status' and \
-                            newvalue in ('reopened', 'closed'):
-                        status = newvalue
-                    elif field[0] != '_':
-                        # properties like _comment{n} are hidden
-                        fields[field] = newvalue
-                if data:
-                    ev = produce_event(data, status, fields, comment, cid)
-                    if ev:
-                        yield ev
-
-                # New tickets
-                if 'ticket' in filters:
-                    for row in db("""SELECT id, time, reporter, type, summary,
-                                            description
-                                     FROM ticket WHERE time>=%s AND time<=%s
-                                     """, (ts_start, ts_stop)):
-                        ev = produce_event(row, 'new', {}, None, None)
+        def change_events():
+            data = None
+            for id, t, author, type, summary, field, oldvalue, newvalue \
+                    in get_timeline_rows(self.env, """
+                    SELECT t.id, tc.time, tc.author, t.type, t.summary, 
+                           tc.field, tc.oldvalue, tc.newvalue 
+                    FROM ticket_change tc 
+                        INNER JOIN ticket t ON t.id = tc.ticket 
+                            AND tc.time>=%s AND tc.time<=%s 
+                    ORDER BY tc.time DESC, tc.ticket, tc.field
+                    """, (ts_start, ts_stop), limit):
+                if not (oldvalue or newvalue):
+                    # ignore empty change corresponding to custom field 
+                    # created (None -> '') or deleted ('' -> None)
+                    continue 
+                if not data or (id, t) != data[:2]:
+                    if data:
+                        ev = produce_event(data, status, fields, comment,
+                                           cid)
                         if ev:
                             yield ev
+                    status, fields, comment, cid = 'edit', {}, '', None
+                    data = (id, t, author, type, summary, None)
+                if field == 'comment':
+                    comment = newvalue
+                    cid = oldvalue and oldvalue.split('.')[-1]
+                    # Always use the author from the comment field
+                    data = data[:2] + (author,) + data[3:]
+                elif field == 'status' and \
+                        newvalue in ('reopened', 'closed'):
+                    status = newvalue
+                elif field[0] != '_':
+                    # properties like _comment{n} are hidden
+                    fields[field] = newvalue
+            if data:
+                ev = produce_event(data, status, fields, comment, cid)
+                if ev:
+                    yield ev
+
+        # New tickets
+        def new_events():
+            for row in get_timeline_rows(self.env, """
+                    SELECT id, time, reporter, type, summary, description
+                    FROM ticket WHERE time>=%s AND time<=%s
+                    ORDER BY time DESC, id
+                    """, (ts_start, ts_stop), limit):
+                ev = produce_event(row, 'new', {}, None, None)
+                if ev:
+                    yield ev
+
+        streams = []
+        if 'ticket' in filters or 'ticket_details' in filters:
+            streams.append(change_events())
+            if 'ticket' in filters:
+                streams.append(new_events())
+
+        # Attachments
+        if 'ticket_details' in filters:
+            streams.append(AttachmentModule(self.env).get_timeline_events(
+                req, ticket_realm, start, stop, limit))
 
-            # Attachments
-            if 'ticket_details' in filters:
-                for event in AttachmentModule(self.env).get_timeline_events(
-                    req, ticket_realm, start, stop):
-                    yield event
+        for event in merge_events(streams):
+            yield event
 
     def render_timeline_event(self, context, field, event):
         ticket, verb, info, summary, status, resolution, type, \
@@ -17,12 +17,23 @@
 # Author: Jonas Borgström <jonas@edgewall.com>
 #         Christopher Lenz <cmlenz@gmx.de>
 
+import heapq
+
 from trac.core import *
+from trac.util.datefmt import to_utimestamp
 
 
 class ITimelineEventProvider(Interface):
     """Extension point interface for adding sources for timed events to the
     timeline.
+
+    A component implementing this interface can set its
+    `timeline_events_ordered` attribute to `True` when the events
+    returned by `get_timeline_events` are guaranteed to be sorted by
+    decreasing date (newest first). The timeline can then stop consuming
+    the events of that provider as soon as it has gathered enough events
+    to display, instead of retrieving and sorting all the events of the
+    requested period. (''since 0.13'')
     """
 
     def get_timeline_filters(req):
@@ -36,7 +47,7 @@ class ITimelineEventProvider(Interface):
         otherwise it will be inactive.
         """
 
-    def get_timeline_events(req, start, stop, filters):
+    def get_timeline_events(req, start, stop, filters, limit=None):
         """Return a list of events in the time range given by the `start` and
         `stop` parameters.
 
@@ -57,6 +68,14 @@ class ITimelineEventProvider(Interface):
         be tuples of the form `(kind, href, title, date, author, markup)`.
         This is still supported but less flexible, as `href`, `title` and
         `markup` are not context dependent.
+
+        Since 0.13, providers declaring `timeline_events_ordered` can
+        accept the optional `limit` parameter. It is a hint giving the
+        number of events the timeline intends to display, or `None` if all
+        the events of the period will be displayed. As the events which
+        are not consumed don't need to be retrieved, it can be used for
+        fetching the events by batches (see `get_timeline_rows`).
+        Providers not accepting that parameter are still supported.
         """
 
     def render_timeline_event(context, field, event):
@@ -71,3 +90,63 @@ class ITimelineEventProvider(Interface):
         """
 
 
+def get_timeline_rows(env, query, args, limit=None):
+    """Generate the rows returned by the SQL `query` of a timeline event
+    provider.
+
+    When a `limit` hint is given, the rows are retrieved by batches, the
+    first one containing `limit` rows and each following batch being twice
+    as large as the previous one. No further batches are retrieved once
+    the consumer stops iterating. The `query` must therefore sort the rows
+    in a deterministic order, typically by decreasing time followed by
+    the primary key of the table.
+    """
+    if not limit:
+        for row in env.db_query(query, args):
+            yield row
+        return
+    offset = 0
+    while True:
+        rows = env.db_query(query + " LIMIT %d OFFSET %d" % (limit, offset),
+                            args)
+        for row in rows:
+            yield row
+        if len(rows) < limit:
+            return
+        offset += limit
+        limit *= 2
+
+
+def merge_events(streams, key=None):
+    """Merge `streams` of timeline events, each of them sorted by
+    decreasing date, into a single generator of events sorted by
+    decreasing date.
+
+    The `key` function must return the date of an event as a timestamp
+    in microseconds. By default, the date of `(kind, date, author, data)`
+    event tuples is used. Events having the same date are produced in
+    the order of the `streams` they come from.
+
+    The streams are consumed lazily, so that only the events which are
+    actually produced need to be retrieved.
+
+    >>> list(merge_events([[3, 1], [4, 2, 1], []], key=lambda e: e))
+    [4, 3, 2, 1, 1]
+    """
+    if key is None:
+        key = lambda event: to_utimestamp(event[1])
+    heap = []
+    for idx, stream in enumerate(streams):
+        stream = iter(stream)
+        for event in stream:
+            heap.append((-key(event), idx, event, stream))
+            break
+    heapq.heapify(heap)
+    while heap:
+        ts, idx, event, stream = heap[0]
+        yield event
+        for event in stream:
+            heapq.heapreplace(heap, (-key(event), idx, event, stream))
+            break
+        else:
+            heapq.heappop(heap)
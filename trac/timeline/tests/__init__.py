@@ -1 +1,15 @@
+import doctest
+import unittest
+
+import trac.timeline.api
+from trac.timeline.tests import web_ui
 from trac.timeline.tests.functional import functionalSuite
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(web_ui.suite())
+    suite.addTest(doctest.DocTestSuite(trac.timeline.api))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,174 @@
+from datetime import datetime, timedelta
+import unittest
+
+from trac.core import Component, ComponentMeta, implements
+from trac.test import EnvironmentStub, Mock, MockPerm
+from trac.ticket.model import Ticket
+from trac.ticket.web_ui import TicketModule
+from trac.timeline.api import ITimelineEventProvider
+from trac.timeline.web_ui import TimelineModule, TimelineRenderCache
+from trac.util.datefmt import utc
+from trac.web.href import Href
+from trac.wiki.model import WikiPage
+from trac.wiki.web_ui import WikiModule
+
+
+class TimelineModuleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub()
+        self.now = datetime.now(utc)
+        self.calls = []
+        self._old_registry = ComponentMeta._registry
+        ComponentMeta._registry = {}
+
+    def tearDown(self):
+        ComponentMeta._registry = self._old_registry
+
+    def _provider(self, name, ordered, events):
+        now, calls = self.now, self.calls
+        class Provider(Component):
+            implements(ITimelineEventProvider)
+            timeline_events_ordered = ordered
+            def get_timeline_filters(self, req):
+                yield (name, name)
+            def get_timeline_events(self, req, start, stop, filters,
+                                    limit=None):
+                calls.append((name, 'limit', limit))
+                for days, author in events:
+                    calls.append((name, days))
+                    yield (name, now - timedelta(days=days), author,
+                           None)
+            def render_timeline_event(self, context, field, event):
+                calls.append((name, 'render', field))
+                return name
+        return Provider
+
+    def _request(self, **args):
+        return Mock(args=args, session={}, perm=MockPerm(), tz=utc,
+                    href=Href('/trac'), abs_href=Href('http://example.org'),
+                    authname='anonymous', chrome={'static_hash': 'hash'},
+                    lc_time='iso8601', locale=None)
+
+    def _process_request(self, **args):
+        module = TimelineModule(self.env)
+        data = module.process_request(self._request(**args))[1]
+        return [(e['kind'], (self.now - e['date']).days)
+                for e in data['events']]
+
+    def _render_titles(self):
+        """Render the title of all events and return the number of calls
+        to the providers `render_timeline_event`."""
+        data = TimelineModule(self.env).process_request(
+            self._request(daysback='10'))[1]
+        del self.calls[:]
+        for event in data['events']:
+            event['render']('title', data['context'])
+        return len([c for c in self.calls if c[1] == 'render'])
+
+    def test_merge_ordered_and_unordered_providers(self):
+        self._provider('a', True, [(1, 'joe'), (4, 'joe'), (6, 'joe')])
+        self._provider('b', False, [(5, 'joe'), (2, 'joe'), (3, 'joe')])
+        self.assertEqual([('a', 1), ('b', 2), ('b', 3), ('a', 4), ('b', 5),
+                          ('a', 6)],
+                         self._process_request(daysback='10'))
+
+    def test_maxrows_stops_ordered_providers(self):
+        self._provider('a', True, [(1, 'joe'), (4, 'joe'), (6, 'joe'),
+                                   (8, 'joe')])
+        self._provider('b', False, [(3, 'joe'), (2, 'joe')])
+        self.assertEqual([('a', 1), ('b', 2), ('b', 3)],
+                         self._process_request(daysback='10', max='3'))
+        self.assertEqual([('a', 'limit', 3), ('a', 1), ('a', 4)],
+                         [c for c in self.calls if c[0] == 'a'])
+
+    def test_limit_hint_only_for_ordered_providers(self):
+        self._provider('a', True, [])
+        self._provider('b', False, [])
+        self._process_request(daysback='10', max='3')
+        self._process_request(daysback='10')
+        self.assertEqual([('a', 'limit', 3), ('a', 'limit', None)],
+                         [c for c in self.calls if c[0] == 'a'])
+        self.assertEqual([('b', 'limit', None)] * 2,
+                         [c for c in self.calls if c[0] == 'b'])
+
+    def test_maxrows_counts_only_matching_authors(self):
+        self._provider('a', True, [(1, 'joe'), (2, 'jim'), (3, 'joe'),
+                                   (4, 'jim'), (5, 'joe')])
+        self.assertEqual([('a', 2), ('a', 4)],
+                         self._process_request(daysback='10', max='2',
+                                               authors='jim'))
+
+    def test_render_cache_for_past_days(self):
+        self._provider('a', True, [(0, 'joe'), (1, 'joe'), (2, 'joe')])
+        self.assertEqual(3, self._render_titles())
+        self.assertEqual(1, self._render_titles())
+        TimelineRenderCache(self.env).invalidate(self.now -
+                                                 timedelta(days=1))
+        self.assertEqual(2, self._render_titles())
+        self.assertEqual(1, self._render_titles())
+
+    def test_render_cache_generations_reused(self):
+        cache = TimelineRenderCache(self.env)
+        cache.invalidate(*[self.now - timedelta(days=days)
+                           for days in xrange(3 * cache.day_slots)])
+        self.assertEqual(cache.day_slots, self.env.db_query(
+            "SELECT COUNT(*) FROM cache")[0][0])
+
+    def test_render_cache_for_other_events(self):
+        events = [(0, 'joe'), (1, 'joe'), (2, 'joe')]
+        self._provider('a', True, events)
+        self.assertEqual(3, self._render_titles())
+        events[1] = (1, 'jim')
+        self.assertEqual(2, self._render_titles())
+
+
+class OrderedProvidersTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub(default_data=True)
+        self.req = Mock(perm=MockPerm())
+        self.now = datetime(2011, 1, 10, tzinfo=utc)
+        self.start = self.now - timedelta(days=30)
+
+    def tearDown(self):
+        self.env.reset_db()
+
+    def _days(self, events):
+        return [(e[0], (self.now - e[1]).days) for e in events]
+
+    def test_wiki_events(self):
+        for name, days in [('A', 9), ('B', 3), ('A', 5), ('C', 1), ('B', 2)]:
+            page = WikiPage(self.env, name)
+            page.text = 'Text %d' % days
+            page.save('joe', '', '::1', self.now - timedelta(days=days))
+        events = WikiModule(self.env).get_timeline_events(
+            self.req, self.start, self.now, ['wiki'], 2)
+        self.assertEqual([('wiki', 1), ('wiki', 2), ('wiki', 3),
+                          ('wiki', 5), ('wiki', 9)], self._days(events))
+
+    def test_ticket_events(self):
+        for summary, created, closed in [('A', 9, 1), ('B', 4, 2)]:
+            ticket = Ticket(self.env)
+            ticket['summary'] = summary
+            ticket['reporter'] = 'joe'
+            ticket.insert(self.now - timedelta(days=created))
+            ticket['status'] = 'closed'
+            ticket['resolution'] = 'fixed'
+            ticket.save_changes('joe', 'Fixed',
+                                self.now - timedelta(days=closed))
+        events = TicketModule(self.env).get_timeline_events(
+            self.req, self.start, self.now, ['ticket'], 1)
+        self.assertEqual([('closedticket', 1), ('closedticket', 2),
+                          ('newticket', 4), ('newticket', 9)],
+                         self._days(events))
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TimelineModuleTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(OrderedProvidersTestCase, 'test'))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -17,27 +17,36 @@
 # Author: Jonas Borgström <jonas@edgewall.com>
 #         Christopher Lenz <cmlenz@gmx.de>
 
+from __future__ import with_statement
+
 from datetime import datetime, timedelta
+from itertools import islice
 import pkg_resources
 import re
 
-from genshi.builder import tag
+from genshi.builder import Fragment, tag
 
+from trac.attachment import IAttachmentChangeListener
+from trac.cache import Generation
 from trac.config import IntOption, BoolOption
 from trac.core import *
 from trac.perm import IPermissionRequestor
-from trac.timeline.api import ITimelineEventProvider
-from trac.util import as_int
+from trac.ticket.api import IMilestoneChangeListener, ITicketChangeListener
+from trac.timeline.api import ITimelineEventProvider, merge_events
+from trac.util import arity, as_int
+from trac.util.compat import sha1
+from trac.util.concurrency import threading
 from trac.util.datefmt import format_date, format_datetime, format_time, \
                               parse_date, to_utimestamp, utc, \
                               pretty_timedelta,  user_time
 from trac.util.text import exception_to_unicode, to_unicode
 from trac.util.translation import _, tag_
+from trac.versioncontrol.api import IRepositoryChangeListener
 from trac.web import IRequestHandler, IRequestFilter
 from trac.web.chrome import (Chrome, INavigationContributor, ITemplateProvider,
                              add_link, add_stylesheet, auth_link, prevnext_nav,
                              web_context)
-from trac.wiki.api import IWikiSyntaxProvider
+from trac.wiki.api import IWikiChangeListener, IWikiSyntaxProvider
 from trac.wiki.formatter import concat_path_query_fragment, \
                                 split_url_into_path_query_fragment
 
@@ -182,26 +191,22 @@ class TimelineModule(Component):
             else:
                 include.add(name)
         
-        # gather all events for the given period of time
-        events = []
-        for provider in self.event_providers:
-            try:
-                for event in provider.get_timeline_events(req, start, stop,
-                                                          filters) or []:
-                    # Check for 0.10 events
-                    author = (event[2 if len(event) < 6 else 4] or '').lower()
-                    if (not include or author in include) \
-                       and not author in exclude:
-                        events.append(self._event_data(provider, event))
-            except Exception, e: # cope with a failure of that provider
-                self._provider_failure(e, req, provider, filters,
-                                       [f[0] for f in available_filters])
-
-        # prepare sorted global list
-        events = sorted(events, key=lambda e: e['date'], reverse=True)
+        # merge the events of all providers for the given period of time,
+        # newest first, stopping as soon as enough events have been gathered
+        all_filters = [f[0] for f in available_filters]
+        events = merge_events([self._provider_events(req, provider, start,
+                                                     stop, filters, maxrows,
+                                                     all_filters, include,
+                                                     exclude)
+                               for provider in self.event_providers],
+                              key=lambda e: e['dateuid'])
         if maxrows:
-            events = events[:maxrows]
+            events = islice(events, maxrows)
+        events = list(events)
 
+        key = (req.authname, format, str(req.locale), req.abs_href(),
+               req.href(), tuple(sorted(filters)))
+        TimelineRenderCache(self.env).prepare_events(req, events, key)
         data['events'] = events
         
         if format == 'rss':
@@ -358,6 +363,39 @@ class TimelineModule(Component):
                 'dateuid': dateuid, 'render': render, 'event': event,
                 'data': data, 'provider': provider}
 
+    def _provider_events(self, req, provider, start, stop, filters, maxrows,
+                         all_filters, include, exclude):
+        """Generate the event data for the events of `provider` which pass
+        the author filters, sorted by decreasing date.
+
+        The events of providers not declaring `timeline_events_ordered`
+        have to be retrieved and sorted up front. The others are given
+        `maxrows` as a `limit` hint, if they support it.
+        """
+        try:
+            ordered = getattr(provider, 'timeline_events_ordered', False)
+            if ordered and arity(provider.get_timeline_events) > 4:
+                events = provider.get_timeline_events(req, start, stop,
+                                                      filters, maxrows or None)
+            else:
+                events = provider.get_timeline_events(req, start, stop,
+                                                      filters)
+            events = (self._event_data(provider, event)
+                      for event in events or []
+                      if self._match_author(event, include, exclude))
+            if not ordered:
+                events = sorted(events, key=lambda e: e['dateuid'],
+                                reverse=True)
+            for event in events:
+                yield event
+        except Exception, e: # cope with a failure of that provider
+            self._provider_failure(e, req, provider, filters, all_filters)
+
+    def _match_author(self, event, include, exclude):
+        # Check for 0.10 events
+        author = (event[2 if len(event) < 6 else 4] or '').lower()
+        return (not include or author in include) and author not in exclude
+
     def _provider_failure(self, exc, req, ep, current_filters, all_filters):
         """Raise a TracError exception explaining the failure of a provider.
 
@@ -390,3 +428,170 @@ class TimelineModule(Component):
                        "Timeline or notify your Trac administrator about the "
                        "error (detailed information was written to the log).",
                        other_events=other_events))))
+
+
+class TimelineRenderCache(Component):
+    """Cache for the rendered timeline events of past days.
+
+    The rendered fragments are stored per day and per timeline view, and
+    are reused as long as that day shows the same events for that view
+    and none of the resources changed on that day has been modified.
+    Modifications are tracked with `~trac.cache.CacheManager`
+    generations. The days share a fixed number of generations, so that
+    the `cache` table doesn't grow with each new day: a modification
+    also invalidates the days `day_slots` days apart from its own.
+
+    Only the rendering is cached: the events themselves are still
+    retrieved and filtered by permissions for every request.
+    """
+
+    implements(IAttachmentChangeListener, IMilestoneChangeListener,
+               IRepositoryChangeListener, ITicketChangeListener,
+               IWikiChangeListener)
+
+    cache_size = IntOption('timeline', 'render_cache_size', 100,
+        """Maximum number of days for which the rendered timeline events
+        are kept in memory. The limit is shared by all the timeline
+        views, and a day shown with different filters or user settings
+        counts once per view. Set to 0 to disable the cache.
+        (''since 0.13'')""")
+
+    day_slots = 128
+
+    def __init__(self):
+        self._days = {}
+        self._tick = 0
+        self._lock = threading.Lock()
+
+    # Public methods
+
+    def prepare_events(self, req, events, key):
+        """Make the events of past days render through the cache.
+
+        The `render` function of each event data in `events` is replaced
+        by a function looking up the cache first. `key` identifies the
+        timeline view, i.e. everything besides the events which can
+        influence their rendering.
+        """
+        if self.cache_size <= 0:
+            return
+        today = format_date(datetime.now(req.tz), '%Y-%m-%d', req.tz)
+        days = {}
+        for event in events:
+            day = format_date(event['date'], '%Y-%m-%d', req.tz)
+            if day < today:
+                days.setdefault(day, []).append(event)
+        for day, day_events in days.iteritems():
+            fragments = self._get_fragments(key + (day,), day_events)
+            for idx, event in enumerate(day_events):
+                event['render'] = self._cached_render(event['render'],
+                                                      fragments, idx)
+
+    def invalidate(self, *dates):
+        """Invalidate the rendered events of the days of the given `dates`.
+        """
+        for slot in set(self._day_slot(d) for d in dates if d):
+            del Generation(self.env, 'timeline:%d' % slot).token
+
+    # IAttachmentChangeListener methods
+
+    def attachment_added(self, attachment):
+        self.invalidate(attachment.date)
+
+    def attachment_deleted(self, attachment):
+        self.invalidate(attachment.date)
+
+    def attachment_reparented(self, attachment, old_parent_realm,
+                              old_parent_id):
+        self.invalidate(attachment.date)
+
+    # IMilestoneChangeListener methods
+
+    def milestone_created(self, milestone):
+        self.invalidate(milestone.completed)
+
+    def milestone_changed(self, milestone, old_values):
+        self.invalidate(milestone.completed, old_values.get('completed'))
+
+    def milestone_deleted(self, milestone):
+        self.invalidate(milestone.completed)
+
+    # IRepositoryChangeListener methods
+
+    def changeset_added(self, repos, changeset):
+        self.invalidate(changeset.date)
+
+    def changeset_modified(self, repos, changeset, old_changeset):
+        self.invalidate(changeset.date,
+                        old_changeset and old_changeset.date)
+
+    # ITicketChangeListener methods
+
+    def ticket_created(self, ticket):
+        self.invalidate(ticket['time'])
+
+    def ticket_changed(self, ticket, comment, author, old_values):
+        self.invalidate(ticket['changetime'])
+
+    def ticket_deleted(self, ticket):
+        self.invalidate(ticket['time'])
+
+    # IWikiChangeListener methods
+
+    def wiki_page_added(self, page):
+        self.invalidate(page.time)
+
+    def wiki_page_changed(self, page, version, t, comment, author, ipnr):
+        self.invalidate(t)
+
+    def wiki_page_deleted(self, page):
+        # The events of the deleted versions are no longer shown
+        pass
+
+    def wiki_page_version_deleted(self, page):
+        pass
+
+    def wiki_page_renamed(self, page, old_name):
+        # The events of the renamed page are shown for a different resource
+        pass
+
+    # Internal methods
+
+    def _get_fragments(self, key, events):
+        """Return the dictionary of rendered fragments for the given day
+        `key`, which is only reused if it was filled for the same
+        `events`."""
+        signature = sha1('\0'.join(repr(e['event']) for e in events)) \
+                    .digest()
+        slots = sorted(set(self._day_slot(e['date']) for e in events))
+        tokens = tuple(Generation(self.env, 'timeline:%d' % slot).token
+                       for slot in slots)
+        with self._lock:
+            self._tick += 1
+            entry = self._days.get(key)
+            if entry and entry[1:3] == [signature, tokens]:
+                entry[0] = self._tick
+                return entry[3]
+            fragments = {}
+            self._days[key] = [self._tick, signature, tokens, fragments]
+            if len(self._days) > self.cache_size:
+                lru = min(self._days, key=lambda k: self._days[k][0])
+                del self._days[lru]
+            return fragments
+
+    def _day_slot(self, date):
+        """Return the generation slot of the UTC day of `date`."""
+        return date.astimezone(utc).toordinal() % self.day_slots
+
+    def _cached_render(self, render, fragments, idx):
+        def cached_render(field, context):
+            try:
+                return fragments[(idx, field)]
+            except KeyError:
+                fragment = render(field, context)
+                # Streams can't be reused
+                if fragment is None or \
+                        isinstance(fragment, (basestring, Fragment)):
+                    fragments[(idx, field)] = fragment
+                return fragment
+        return cached_render
@@ -0,0 +1,57 @@
+from trac.db import Table, Column, Index, DatabaseManager
+
+def do_upgrade(env, ver, cursor):
+    """Add an index on the path of the node changes, and the
+    `node_change_prefix` table listing the revisions changing each
+    directory of the repository cache."""
+    db_connector, _ = DatabaseManager(env).get_connector()
+
+    node_change = Table('node_change', key=('repos', 'rev', 'path',
+                                            'change_type'))[
+        Column('repos', type='int'),
+        Column('rev', key_size=20),
+        Column('path', key_size=255),
+        Column('node_type', size=1),
+        Column('change_type', size=1, key_size=2),
+        Column('base_path'),
+        Column('base_rev'),
+        Index(['repos', 'path', 'rev'])]
+    for stmt in db_connector.to_sql(node_change):
+        if 'node_change_repos_path_rev_idx' in stmt:
+            cursor.execute(stmt)
+
+    table = Table('node_change_prefix', key=('repos', 'prefix', 'rev'))[
+        Column('repos', type='int'),
+        Column('prefix', key_size=255),
+        Column('rev', key_size=20)]
+    for stmt in db_connector.to_sql(table):
+        cursor.execute(stmt)
+
+    # Fill the table by chunks of revisions
+    cursor.execute("SELECT DISTINCT repos, rev FROM node_change")
+    revs = {}
+    for repos, rev in cursor.fetchall():
+        revs.setdefault(repos, []).append(rev)
+    for repos, repos_revs in revs.iteritems():
+        repos_revs.sort()
+        for i in xrange(0, len(repos_revs), 1000):
+            chunk = repos_revs[i:i + 1000]
+            changes = {}
+            cursor.execute("""
+                SELECT rev, path FROM node_change
+                WHERE repos=%s AND rev>=%s AND rev<=%s
+                """, (repos, chunk[0], chunk[-1]))
+            for rev, path in cursor.fetchall():
+                # Each changed path and all its parent directories, except
+                # the root, are prefixes of the revision
+                prefixes = changes.setdefault(rev, set())
+                path = path.strip('/')
+                while path and path not in prefixes:
+                    prefixes.add(path)
+                    path = path.rpartition('/')[0]
+            cursor.executemany("""
+                INSERT INTO node_change_prefix (repos, prefix, rev)
+                VALUES (%s, %s, %s)
+                """, [(repos, prefix, rev)
+                      for rev, prefixes in changes.iteritems()
+                      for prefix in prefixes])
@@ -0,0 +1,18 @@
+from trac.db import Table, Column, Index, DatabaseManager
+
+def do_upgrade(env, ver, cursor):
+    """Add the `resource_link` table indexing the links between the wiki
+    pages and tickets."""
+    table = Table('resource_link', key=('source_realm', 'source_id',
+                                        'target_realm', 'target_id'))[
+        Column('source_realm', key_size=16),
+        Column('source_id', key_size=120),
+        Column('source_version', type='int'),
+        Column('target_realm', key_size=16),
+        Column('target_id', key_size=120),
+        Index(['target_realm', 'target_id'])]
+    db_connector, _ = DatabaseManager(env).get_connector()
+    for stmt in db_connector.to_sql(table):
+        cursor.execute(stmt)
+
+    print 'Please perform a "wiki links-rebuild" after this upgrade.'
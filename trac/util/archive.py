@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011 Edgewall Software
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution. The terms
+# are also available at http://trac.edgewall.org/wiki/TracLicense.
+#
+# This software consists of voluntary contributions made by many
+# individuals. For the exact contribution history, see the revision
+# history and logs, available at http://trac.edgewall.org/log/.
+
+"""Generation of archives as a stream of strings, suitable for sending
+large archives without building them in memory first."""
+
+import struct
+import zlib
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+
+class ZipStream(object):
+    """Zip archive generated incrementally.
+
+    Entries are added with `add()`, then iterating over the `ZipStream`
+    generates the archive as a sequence of strings. The content of each
+    file is read by chunks and compressed while the archive is generated,
+    and the sizes and checksum of the files are written after their
+    content, so the memory use doesn't depend on the size of the archive.
+
+    The archive is limited to 4 GB and 65535 entries, as the Zip64
+    extensions aren't supported.
+
+    >>> from StringIO import StringIO
+    >>> from zipfile import ZipFile
+    >>> stream = ZipStream()
+    >>> stream.add(u'dir/', (2011, 1, 1, 0, 0, 0))
+    >>> stream.add(u'dir/file.txt', (2011, 1, 1, 0, 0, 0),
+    ...            lambda: StringIO('content ' * 1000), comment=u'Notes')
+    >>> zipfile = ZipFile(StringIO(''.join(stream)))
+    >>> [(i.file_size, i.comment) for i in zipfile.infolist()]
+    [(0, ''), (8000, 'Notes')]
+    >>> zipfile.read('dir/file.txt') == 'content ' * 1000
+    True
+    """
+
+    chunk_size = 65536
+
+    def __init__(self, compress_type=ZIP_DEFLATED):
+        self.compress_type = compress_type
+        self._entries = []
+
+    def add(self, filename, date_time, open_content=None, comment='',
+            external_attr=None):
+        """Add an entry to the archive.
+
+        :param filename: the `unicode` path of the entry, ending with a `/`
+                         for a directory
+        :param date_time: the `(year, month, day, hour, minute, second)`
+                          modification time of the entry
+        :param open_content: a callable returning a file-like object for
+                             the content of a file, which is only called
+                             and read while the archive is generated
+        :param comment: the `unicode` comment of the entry
+        :param external_attr: the attributes of the entry, by default
+                              the Unix mode 0755 for directories and 0644
+                              for files
+        """
+        isdir = filename.endswith('/')
+        if external_attr is None:
+            external_attr = (040755 if isdir else 0100644) << 16L
+        self._entries.append((filename, date_time, open_content, comment,
+                              external_attr))
+
+    def __iter__(self):
+        offset = 0
+        central_dir = []
+        for filename, date_time, open_content, comment, external_attr \
+                in self._entries:
+            filename = filename.encode('utf-8')
+            comment = comment.encode('utf-8')
+            flags = 0x800 # file name and comment encoded in UTF-8
+            compress_type = self.compress_type
+            if open_content is None:
+                compress_type = ZIP_STORED
+            else:
+                flags |= 0x08 # sizes and CRC after the content
+            year, month, day, hour, minute, second = date_time[:6]
+            dosdate = (year - 1980) << 9 | month << 5 | day
+            dostime = hour << 11 | minute << 5 | (second // 2)
+
+            header = struct.pack('<4s5H3L2H', 'PK\003\004', 20, flags,
+                                 compress_type, dostime, dosdate, 0, 0, 0,
+                                 len(filename), 0)
+            yield header
+            yield filename
+            crc = size = compress_size = 0
+            if open_content is not None:
+                if compress_type == ZIP_DEFLATED:
+                    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                                  zlib.DEFLATED, -15)
+                fileobj = open_content()
+                try:
+                    while True:
+                        data = fileobj.read(self.chunk_size)
+                        if not data:
+                            break
+                        crc = zlib.crc32(data, crc)
+                        size += len(data)
+                        if compress_type == ZIP_DEFLATED:
+                            data = compressor.compress(data)
+                        if data:
+                            compress_size += len(data)
+                            yield data
+                finally:
+                    if hasattr(fileobj, 'close'):
+                        fileobj.close()
+                if compress_type == ZIP_DEFLATED:
+                    data = compressor.flush()
+                    compress_size += len(data)
+                    yield data
+                crc &= 0xffffffff
+                yield struct.pack('<4s3L', 'PK\007\010', crc, compress_size,
+                                  size)
+            central_dir.append(struct.pack('<4s6H3L5H2L', 'PK\001\002',
+                                           3 << 8 | 20, 20, flags,
+                                           compress_type, dostime, dosdate,
+                                           crc, compress_size, size,
+                                           len(filename), 0, len(comment), 0,
+                                           0, external_attr, offset)
+                               + filename + comment)
+            offset += len(header) + len(filename) + compress_size
+            if open_content is not None:
+                offset += 16
+
+        central_dir_size = sum(len(record) for record in central_dir)
+        for record in central_dir:
+            yield record
+        yield struct.pack('<4s4H2LH', 'PK\005\006', 0, 0, len(central_dir),
+                          len(central_dir), central_dir_size, offset, 0)
@@ -20,6 +20,7 @@ import tempfile
 import unittest
 
 from trac import util
+from trac.util import archive
 from trac.util.tests import concurrency, datefmt, presentation, text, html
 
 
@@ -159,6 +160,7 @@ def suite():
     suite.addTest(datefmt.suite())
     suite.addTest(presentation.suite())
     suite.addTest(doctest.DocTestSuite(util))
+    suite.addTest(doctest.DocTestSuite(archive))
     suite.addTest(text.suite())
     suite.addTest(html.suite())
     return suite
@@ -13,17 +13,20 @@
 
 import os.path
 import sys
+import time
 
 from genshi.builder import tag
 
-from trac.admin import IAdminCommandProvider, IAdminPanelProvider
+from trac.admin import AdminCommandError, IAdminCommandProvider, \
+                       IAdminPanelProvider
 from trac.config import ListOption
 from trac.core import *
 from trac.perm import IPermissionRequestor
 from trac.util import as_bool, is_path_below
 from trac.util.compat import any
-from trac.util.text import breakable_path, normalize_whitespace, print_table, \
-                           printout
+from trac.util.concurrency import threading
+from trac.util.text import breakable_path, exception_to_unicode, \
+                           normalize_whitespace, print_table, printout
 from trac.util.translation import _, ngettext, tag_
 from trac.versioncontrol import DbRepositoryProvider, RepositoryManager, \
                                 is_default
@@ -54,6 +57,21 @@ class VersionControlAdmin(Component):
                revisions and notify components about the change.
                """,
                self._complete_repos, self._do_changeset_modified)
+        yield ('changeset listen', '[interval]',
+               """Notify trac about changesets queued by the hooks
+               
+               This command runs until it is interrupted. Every [interval]
+               seconds (1 by default), it reads the events queued in the
+               `spool/changeset` directory of the environment, and notifies
+               trac about the changesets of each repository at once, like
+               the `changeset added` and `changeset modified` commands.
+               
+               As the environment stays loaded between events, this is much
+               faster than calling these commands from the hooks for each
+               changeset. See the `contrib/trac-svn-hook` script for the
+               format of the events.
+               """,
+               None, self._do_changeset_listen)
         yield ('repository list', '',
                'List source repositories',
                None, self._do_list)
@@ -101,6 +119,111 @@ class VersionControlAdmin(Component):
         rm = RepositoryManager(self.env)
         rm.notify('changeset_modified', reponame, revs)
     
+    def _do_changeset_listen(self, interval=None):
+        try:
+            interval = float(interval or 1)
+        except ValueError:
+            raise AdminCommandError(_("Invalid interval '%(interval)s'",
+                                      interval=interval))
+        if not os.path.isdir(self.spool_dir):
+            os.makedirs(self.spool_dir)
+        printout(_('Waiting for changeset events in %(dir)s',
+                   dir=self.spool_dir))
+        try:
+            while True:
+                self.process_spool()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+    @property
+    def spool_dir(self):
+        return os.path.join(self.env.path, 'spool', 'changeset')
+
+    def process_spool(self):
+        """Notify the changeset events queued in the spool directory, and
+        return the number of events.
+
+        Each event is a file containing the event type (`added` or
+        `modified`), the repository name or directory and the revisions,
+        one per line. The files are processed in the order of their names,
+        and the files whose name starts with a `.` are ignored, so that
+        they can be written under such a name then renamed atomically.
+        The revisions of the events of the same type for the same
+        repository are notified together, in increasing order if they are
+        numbers. The files are removed once their events have been
+        notified, so that the events which failed are processed again.
+        """
+        try:
+            filenames = sorted(f for f in os.listdir(self.spool_dir)
+                               if not f.startswith('.'))
+        except OSError:
+            return 0
+        batches = []
+        revs_by_key = {}
+        paths_by_key = {}
+        for filename in filenames:
+            path = os.path.join(self.spool_dir, filename)
+            try:
+                f = open(path, 'rb')
+                try:
+                    lines = [line.strip() for line in f.read().splitlines()]
+                finally:
+                    f.close()
+            except (IOError, OSError), e:
+                self.log.warning("Can't read changeset event %s: %s", path,
+                                 exception_to_unicode(e))
+                continue
+            lines = [line.decode('utf-8') for line in lines if line]
+            if len(lines) < 3 or lines[0] not in ('added', 'modified'):
+                self.log.warning("Invalid changeset event %s: %r", path,
+                                 lines)
+                self._remove_event(path)
+                continue
+            event, reponame, revs = lines[0], lines[1], lines[2:]
+            if is_default(reponame):
+                reponame = ''
+            key = ('changeset_' + event, reponame)
+            if key not in revs_by_key:
+                revs_by_key[key] = []
+                paths_by_key[key] = []
+                batches.append(key)
+            revs_by_key[key].extend(revs)
+            paths_by_key[key].append(path)
+
+        rm = RepositoryManager(self.env)
+        try:
+            for event, reponame in batches:
+                revs = revs_by_key[(event, reponame)]
+                if all(rev.isdigit() for rev in revs):
+                    revs.sort(key=int)
+                printout(_('%(event)s on %(repos)s for changesets %(revs)s',
+                           event=event, repos=reponame or '(default)',
+                           revs=', '.join(revs)))
+                try:
+                    rm.notify(event, reponame, revs)
+                except Exception, e:
+                    self.log.error("Event %s on %s for changesets %r "
+                                   "failed: %s", event, reponame, revs,
+                                   exception_to_unicode(e, traceback=True))
+                    printout(_('Failed: %(error)s',
+                               error=exception_to_unicode(e)))
+                else:
+                    for path in paths_by_key[(event, reponame)]:
+                        self._remove_event(path)
+        finally:
+            # Reopen the repositories for the next events, so that the new
+            # changesets are seen
+            rm.shutdown(threading._get_ident())
+        return len(filenames)
+
+    def _remove_event(self, path):
+        try:
+            os.remove(path)
+        except OSError, e:
+            self.log.warning("Can't remove changeset event %s: %s", path,
+                             exception_to_unicode(e))
+
     def _do_list(self):
         rm = RepositoryManager(self.env)
         values = []
@@ -136,6 +259,8 @@ class VersionControlAdmin(Component):
         for repos in sorted(repositories, key=lambda r: r.reponame):
             printout(_('Resyncing repository history for %(reponame)s... ',
                        reponame=repos.reponame or '(default)'))
+            self._sync_started = time.time()
+            self._sync_count = 0
             repos.sync(self._sync_feedback, clean=clean)
             for cnt, in self.env.db_query(
                     "SELECT count(rev) FROM revision WHERE repos=%s",
@@ -145,7 +270,13 @@ class VersionControlAdmin(Component):
         printout(_('Done.'))
 
     def _sync_feedback(self, rev):
-        sys.stdout.write(' [%s]\r' % rev)
+        self._sync_count += 1
+        elapsed = time.time() - self._sync_started
+        if elapsed > 0:
+            sys.stdout.write(' [%s] %.1f revs/s \r'
+                             % (rev, self._sync_count / elapsed))
+        else:
+            sys.stdout.write(' [%s]\r' % rev)
         sys.stdout.flush()
 
     def _do_resync(self, reponame, rev=None):
@@ -20,7 +20,7 @@ import os.path
 import time
 
 from trac.admin import AdminCommandError, IAdminCommandProvider, get_dir_list
-from trac.config import ConfigSection, ListOption, Option
+from trac.config import ConfigSection, IntOption, ListOption, Option
 from trac.core import *
 from trac.resource import IResourceManager, Resource, ResourceNotFound
 from trac.util.concurrency import threading
@@ -244,6 +244,7 @@ class DbRepositoryProvider(Component):
             db("DELETE FROM repository WHERE id=%s", (id,))
             db("DELETE FROM revision WHERE repos=%s", (id,))
             db("DELETE FROM node_change WHERE repos=%s", (id,))
+            db("DELETE FROM node_change_prefix WHERE repos=%s", (id,))
         rm.reload_repositories()
     
     def modify_repository(self, reponame, changes):
@@ -324,6 +325,24 @@ class RepositoryManager(Component):
         repositories specified here. The default is to synchronize the default
         repository, for backward compatibility. (''since 0.12'')""")
 
+    repository_sync_batch_size = IntOption('trac',
+        'repository_sync_batch_size', 100,
+        """Number of revisions synchronized in a single transaction when
+        the repository cache is synchronized. Larger batches speed up
+        the initial synchronization of big repositories. (''since 0.13'')
+        """)
+
+    repository_sync_read_ahead = IntOption('trac',
+        'repository_sync_read_ahead', 0,
+        """Number of changesets read in advance from the repository by a
+        separate thread when the repository cache is synchronized, so that
+        reading the repository and writing to the database overlap. The
+        repository is then accessed from two threads, so this should only
+        be enabled for repository backends supporting it. The default of
+        0 reads the changesets in the synchronizing thread.
+        (''since 0.13'')
+        """)
+
     def __init__(self):
         self._cache = {}
         self._lock = threading.Lock()
@@ -813,6 +832,23 @@ class Repository(object):
         """Retrieve a Changeset corresponding to the given revision `rev`."""
         raise NotImplementedError
 
+    def get_changesets_by_revs(self, revs):
+        """Return a dictionary mapping the revisions of `revs` to the
+        corresponding `Changeset`.
+
+        The revisions which don't exist in the repository are left out.
+        Backends can override this method to retrieve many changesets
+        at once. (''since 0.13'')
+        """
+        changesets = {}
+        for rev in revs:
+            if rev not in changesets:
+                try:
+                    changesets[rev] = self.get_changeset(rev)
+                except NoSuchChangeset:
+                    pass
+        return changesets
+
     def get_changeset_uid(self, rev):
         """Return a globally unique identifier for the ''rev'' changeset.
 
@@ -820,17 +856,36 @@ class Repository(object):
         the ''very same'' changeset (e.g. the repositories are clones).
         """
 
-    def get_changesets(self, start, stop):
+    def get_changesets(self, start, stop, limit=None):
         """Generate Changeset belonging to the given time period (start, stop).
+
+        The changesets are generated newest first. `limit` is a hint
+        giving the number of changesets the caller is likely to use, so
+        that they can be retrieved in batches; more changesets may still
+        be generated.
+        (''since 0.13'': ordering and `limit` argument)
         """
+        changesets = []
         rev = self.youngest_rev
         while rev:
             chgset = self.get_changeset(rev)
             if chgset.date < start:
-                return
+                break
             if chgset.date < stop:
-                yield chgset
+                changesets.append(chgset)
             rev = self.previous_rev(rev)
+        changesets.sort(key=lambda c: c.date, reverse=True)
+        for chgset in changesets:
+            yield chgset
+
+    def get_node_history(self, path, rev=None, limit=None):
+        """Provide backward history for the node at the given path and
+        revision, as `Node.get_history()` does.
+
+        Backends keeping an index of the changes can override this to
+        avoid walking the history of the node. (''since 0.13'')
+        """
+        return self.get_node(path, rev).get_history(limit)
 
     def has_node(self, path, rev=None):
         """Tell if there's a node at the specified (path,rev) combination.
@@ -1096,6 +1151,10 @@ class Changeset(object):
         self.message = message or ''
         self.author = author or ''
         self.date = date
+
+    def __repr__(self):
+        return '<%s %r in %r>' % (self.__class__.__name__, self.rev,
+                                  self.repos.reponame)
     
     def get_properties(self):
         """Returns the properties (meta-data) of the node, as a dictionary.
@@ -16,13 +16,20 @@
 
 from __future__ import with_statement
 
+from itertools import islice
 import os
+import Queue
+import sys
 
-from trac.cache import cached
+from trac.cache import Generation, cached
 from trac.core import TracError
+from trac.search.api import SearchIndex
+from trac.timeline.api import get_timeline_rows
+from trac.util.concurrency import threading
 from trac.util.datefmt import from_utimestamp, to_utimestamp
 from trac.util.translation import _
-from trac.versioncontrol import Changeset, Node, Repository, NoSuchChangeset
+from trac.versioncontrol import Changeset, Node, Repository, \
+                                NoSuchChangeset, RepositoryManager
 
 
 _kindmap = {'D': Node.DIRECTORY, 'F': Node.FILE}
@@ -36,6 +43,25 @@ CACHE_YOUNGEST_REV = 'youngest_rev'
 CACHE_METADATA_KEYS = (CACHE_REPOSITORY_DIR, CACHE_YOUNGEST_REV)
 
 
+def path_prefixes(paths):
+    """Return the set of the given `paths` and of all their parent
+    directories, excluding the root.
+
+    This is what the `node_change_prefix` table stores for the changes of
+    a revision.
+
+    >>> sorted(path_prefixes(['trunk/a/b', '/trunk/c', 'tags']))
+    ['tags', 'trunk', 'trunk/a', 'trunk/a/b', 'trunk/c']
+    """
+    prefixes = set()
+    for path in paths:
+        path = path.strip('/')
+        while path and path not in prefixes:
+            prefixes.add(path)
+            path = path.rpartition('/')[0]
+    return prefixes
+
+
 class CachedRepository(Repository):
 
     has_linear_changesets = False
@@ -63,19 +89,48 @@ class CachedRepository(Repository):
     def get_changeset(self, rev):
         return CachedChangeset(self, self.normalize_rev(rev), self.env)
 
+    def get_changesets_by_revs(self, revs):
+        srevs = {}
+        for rev in revs:
+            try:
+                srev = self.db_rev(self.normalize_rev(rev))
+            except NoSuchChangeset:
+                continue
+            srevs.setdefault(srev, []).append(rev)
+        changesets = {}
+        keys = list(srevs)
+        with self.env.db_query as db:
+            for i in xrange(0, len(keys), 100):
+                chunk = keys[i:i + 100]
+                for srev, time, author, message in db("""
+                        SELECT rev, time, author, message FROM revision
+                        WHERE repos=%%s AND rev IN (%s)
+                        """ % ','.join(['%s'] * len(chunk)),
+                        [self.id] + chunk):
+                    changeset = CachedChangeset(self, self.rev_db(srev),
+                                                self.env,
+                                                (time, author, message))
+                    for rev in srevs[srev]:
+                        changesets[rev] = changeset
+        return changesets
+
     def get_changeset_uid(self, rev):
         return self.repos.get_changeset_uid(rev)
 
-    def get_changesets(self, start, stop):
-        for rev, in self.env.db_query("""
-                SELECT rev FROM revision
+    def get_changesets(self, start, stop, limit=None):
+        """Generate the changesets of the given time period, newest first.
+
+        When a `limit` hint is given, the changesets are retrieved by
+        batches, see `get_timeline_rows()`.
+        """
+        for rev, time, author, message in get_timeline_rows(self.env, """
+                SELECT rev, time, author, message FROM revision
                 WHERE repos=%s AND time >= %s AND time < %s
                 ORDER BY time DESC, rev DESC
-                """, (self.id, to_utimestamp(start), to_utimestamp(stop))):
-            try:
-                yield self.get_changeset(rev)
-            except NoSuchChangeset:
-                pass # skip changesets currently being resync'ed
+                """, (self.id, to_utimestamp(start), to_utimestamp(stop)),
+                limit):
+            yield CachedChangeset(self, self.rev_db(rev), self.env,
+                                  (time, author, message))
 
     def sync_changeset(self, rev):
         cset = self.repos.get_changeset(rev)
@@ -93,6 +148,7 @@ class CachedRepository(Repository):
                   WHERE repos=%s AND rev=%s
                   """, (to_utimestamp(cset.date), cset.author, cset.message,
                         self.id, srev))
+        self._index_changesets([srev])
         return old_cset
 
     @cached('_metadata_id')
@@ -112,6 +168,8 @@ class CachedRepository(Repository):
                    (self.id,))
                 db("DELETE FROM node_change WHERE repos=%s",
                    (self.id,))
+                db("DELETE FROM node_change_prefix WHERE repos=%s",
+                   (self.id,))
                 db.executemany("DELETE FROM repository WHERE id=%s AND name=%s",
                                [(self.id, k) for k in CACHE_METADATA_KEYS])
                 db.executemany("""
@@ -119,6 +177,7 @@ class CachedRepository(Repository):
                       VALUES (%s, %s, %s)
                       """, [(self.id, k, '') for k in CACHE_METADATA_KEYS])
                 del self.metadata
+                del Generation(self.env, 'repository').token
 
         metadata = self.metadata
         
@@ -220,63 +279,166 @@ class CachedRepository(Repository):
 
             kindmap = dict(zip(_kindmap.values(), _kindmap.keys()))
             actionmap = dict(zip(_actionmap.values(), _actionmap.keys()))
+            rm = RepositoryManager(self.env)
+            batch_size = max(1, rm.repository_sync_batch_size)
+            changesets = self._read_changesets(next_youngest,
+                                               rm.repository_sync_read_ahead)
+            unindexed = []
+
+            try:
+                while True:
+                    batch = list(islice(changesets, batch_size))
+                    if not batch:
+                        break
+                    node_changes = []
+                    node_prefixes = []
+
+                    with self.env.db_transaction as db:
+                        for rev, date, author, message, changes in batch:
+                            srev = self.db_rev(rev)
+
+                            # 1.1 Attempt to resync the 'revision' table
+                            self.log.info("Trying to sync revision [%s]", rev)
+                            try:
+                                db("""INSERT INTO revision
+                                        (repos, rev, time, author, message)
+                                      VALUES (%s, %s, %s, %s, %s)
+                                      """, (self.id, srev,
+                                            to_utimestamp(date), author,
+                                            message))
+                            except Exception, e: # *another* 1.1. resync
+                                                 # attempt won
+                                self.log.warning('Revision %s already '
+                                                 'cached: %r', rev, e)
+                                # also potentially in progress, so keep
+                                # ''previous'' notion of 'youngest'
+                                changesets.close()
+                                self.repos.clear(youngest_rev=youngest)
+                                # FIXME: This aborts a containing transaction
+                                db.rollback()
+                                self._index_changesets(unindexed)
+                                return
+
+                            # 1.2. now *only* one process was able to get
+                            #      there (i.e. there *shouldn't* be any race
+                            #      condition here)
+
+                            for path, kind, action, bpath, brev in changes:
+                                self.log.debug("Caching node change in "
+                                               "[%s]: %r", rev,
+                                               (path, kind, action, bpath,
+                                                brev))
+                                node_changes.append((self.id, srev, path,
+                                                     kindmap[kind],
+                                                     actionmap[action],
+                                                     bpath, brev))
+                            paths = [change[0] for change in changes]
+                            node_prefixes.extend((self.id, prefix, srev)
+                                                 for prefix
+                                                 in path_prefixes(paths))
+
+                        db.executemany("""
+                            INSERT INTO node_change
+                              (repos, rev, path, node_type, change_type,
+                               base_path, base_rev)
+                            VALUES (%s, %s, %s, %s, %s, %s, %s)
+                            """, node_changes)
+                        db.executemany("""
+                            INSERT INTO node_change_prefix (repos, prefix, rev)
+                            VALUES (%s, %s, %s)
+                            """, node_prefixes)
+
+                        # 1.3. update 'youngest_rev' metadata once per batch
+                        #      (minimize possibility of failures at point 0.)
+                        youngest = batch[-1][0]
+                        db("""UPDATE repository SET value=%s
+                              WHERE id=%s AND name=%s
+                              """, (str(youngest), self.id,
+                                    CACHE_YOUNGEST_REV))
+                        del self.metadata
+                        del Generation(self.env, 'repository').token
+
+                    # 1.4. update the search index by batches of revisions
+                    unindexed.extend(self.db_rev(item[0]) for item in batch)
+                    if len(unindexed) >= 100:
+                        self._index_changesets(unindexed)
+
+                    # 1.5. provide some feedback
+                    if feedback:
+                        for item in batch:
+                            feedback(item[0])
+            finally:
+                changesets.close()
+
+            self._index_changesets(unindexed)
+
+    def _read_changesets(self, rev, read_ahead=0):
+        """Generate `(rev, date, author, message, changes)` tuples for `rev`
+        and the revisions following it in the repository.
+
+        If `read_ahead` is positive, the changesets are read from the
+        repository by a separate thread, up to `read_ahead` changesets in
+        advance, so that extracting them from the repository overlaps with
+        writing the previous ones to the cache. The thread is stopped when
+        the generator is closed.
+        """
+        def read(rev):
+            while rev is not None:
+                cset = self.repos.get_changeset(rev)
+                yield (rev, cset.date, cset.author, cset.message,
+                       list(cset.get_changes()))
+                rev = self.repos.next_rev(rev)
+
+        if read_ahead <= 0 or threading.__name__ == 'dummy_threading':
+            for item in read(rev):
+                yield item
+            return
+
+        queue = Queue.Queue(read_ahead)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.isSet():
+                try:
+                    queue.put(item, True, 0.1)
+                    return True
+                except Queue.Full:
+                    pass
+            return False
 
-            while next_youngest is not None:
-                srev = self.db_rev(next_youngest)
-                
-                with self.env.db_transaction as db:
-                    
-                    # 1.1 Attempt to resync the 'revision' table
-                    self.log.info("Trying to sync revision [%s]",
-                                  next_youngest)
-                    cset = self.repos.get_changeset(next_youngest)
-                    try:
-                        db("""INSERT INTO revision
-                                (repos, rev, time, author, message)
-                              VALUES (%s, %s, %s, %s, %s)
-                              """, (self.id, srev, to_utimestamp(cset.date),
-                                    cset.author, cset.message))
-                    except Exception, e: # *another* 1.1. resync attempt won 
-                        self.log.warning('Revision %s already cached: %r',
-                                         next_youngest, e)
-                        # also potentially in progress, so keep ''previous''
-                        # notion of 'youngest'
-                        self.repos.clear(youngest_rev=youngest)
-                        # FIXME: This aborts a containing transaction
-                        db.rollback()
+        def produce():
+            try:
+                for item in read(rev):
+                    if not put((item, None)):
                         return
-    
-                    # 1.2. now *only* one process was able to get there
-                    #      (i.e. there *shouldn't* be any race condition here)
-    
-                    for path, kind, action, bpath, brev in cset.get_changes():
-                        self.log.debug("Caching node change in [%s]: %r",
-                                       next_youngest,
-                                       (path, kind, action, bpath, brev))
-                        kind = kindmap[kind]
-                        action = actionmap[action]
-                        db("""INSERT INTO node_change
-                                (repos, rev, path, node_type, change_type,
-                                 base_path, base_rev)
-                              VALUES (%s, %s, %s, %s, %s, %s, %s)
-                              """, (self.id, srev, path, kind, action, bpath,
-                                    brev))
-    
-                    # 1.3. update 'youngest_rev' metadata 
-                    #      (minimize possibility of failures at point 0.)
-                    db("""UPDATE repository SET value=%s
-                          WHERE id=%s AND name=%s
-                          """, (str(next_youngest), 
-                                self.id, CACHE_YOUNGEST_REV))
-                    del self.metadata
-
-                # 1.4. iterate (1.1 should always succeed now)
-                youngest = next_youngest
-                next_youngest = self.repos.next_rev(next_youngest)
-
-                # 1.5. provide some feedback
-                if feedback:
-                    feedback(youngest)
+            except Exception:
+                put((None, sys.exc_info()))
+            else:
+                put((None, None))
+
+        reader = threading.Thread(target=produce,
+                                  name='Repository sync reader')
+        reader.setDaemon(True)
+        reader.start()
+        try:
+            while True:
+                item, exc_info = queue.get()
+                if exc_info:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                if item is None:
+                    return
+                yield item
+        finally:
+            stop.set()
+            reader.join()
+
+    def _index_changesets(self, srevs):
+        """Update the search index for the given revisions, then empty
+        the `srevs` list."""
+        if srevs:
+            SearchIndex(self.env).update_documents('changeset',
+                [u'%s:%s' % (self.id, srev) for srev in srevs])
+            del srevs[:]
 
     def get_node(self, path, rev=None):
         return self.repos.get_node(path, self.normalize_rev(rev))
@@ -298,16 +460,115 @@ class CachedRepository(Repository):
                     """, (self.id, slast, path))
                 first = int(first[0][0]) if first else 0
             sfirst = self.db_rev(first)
+            prefix = path.strip('/')
+            if not prefix:
+                return [int(rev) for rev, in db("""
+                        SELECT DISTINCT rev FROM node_change
+                        WHERE repos=%s AND rev>=%s AND rev<=%s
+                        ORDER BY rev""", (self.id, sfirst, slast))]
+            # changes on path itself or its children
             return [int(rev) for rev, in db("""
-                    SELECT DISTINCT rev FROM node_change
-                    WHERE repos=%%s AND rev>=%%s AND rev<=%%s
-                      AND (path=%%s OR path %s)""" % db.like(),
-                    (self.id, sfirst, slast, path,
-                     db.like_escape(path + '/') + '%'))]
+                    SELECT rev FROM node_change_prefix
+                    WHERE repos=%s AND prefix=%s AND rev>=%s AND rev<=%s
+                    ORDER BY rev""", (self.id, prefix, sfirst, slast))]
 
     def has_node(self, path, rev=None):
         return self.repos.has_node(path, self.normalize_rev(rev))
 
+    def get_node_history(self, path, rev=None, limit=None):
+        """Generate `(path, rev, chg)` tuples for the changes on `path`,
+        starting at `rev` and following copies, like `Node.get_history()`
+        but using only the cache tables.
+
+        The cache tables can only be used for repositories with linear
+        changesets, as they rely on the ordering of the revisions. The
+        history of the other repositories is retrieved from the node.
+        """
+        if not self.has_linear_changesets:
+            node = self.repos.get_node(path, self.normalize_rev(rev))
+            for entry in node.get_history(limit):
+                yield entry
+            return
+        newer = None
+        numrevs = 0
+        for older in self._get_cached_history(path, self.normalize_rev(rev)):
+            if newer:
+                if newer[0] == older[0]: # stay on same path
+                    change = Changeset.EDIT
+                else:
+                    change = Changeset.COPY
+                yield (newer[0], newer[1], change)
+                numrevs += 1
+                if limit and numrevs >= limit:
+                    return
+            newer = older
+        if newer:
+            yield (newer[0], newer[1], Changeset.ADD)
+
+    def _get_cached_history(self, path, rev, page_size=100):
+        """Generate the `(path, rev)` pairs of the revisions changing
+        `path` or its children, from `rev` down to the creation of `path`,
+        then continuing on the copy source if any.
+
+        The revisions are retrieved by pages, each page starting below
+        the last revision of the previous one.
+        """
+        path = path.strip('/')
+        srev = self.db_rev(rev)
+        while True:
+            origin = None
+            with self.env.db_query as db:
+                ancestors = sorted(path_prefixes([path]))
+                if ancestors:
+                    # creation of the path or of one of its parents
+                    for row in db("""
+                            SELECT rev, path, change_type, base_path,
+                                   base_rev
+                            FROM node_change
+                            WHERE repos=%%s AND path IN (%s) AND rev<=%%s
+                              AND change_type IN ('A', 'C', 'M')
+                            ORDER BY rev DESC LIMIT 1
+                            """ % ','.join(('%s',) * len(ancestors)),
+                            [self.id] + ancestors + [srev]):
+                        origin = row
+            sfirst = origin[0] if origin else ''
+
+            last = None
+            bound = '<='
+            while True:
+                with self.env.db_query as db:
+                    if path:
+                        revs = [r for r, in db("""
+                            SELECT rev FROM node_change_prefix
+                            WHERE repos=%%s AND prefix=%%s AND rev>=%%s
+                              AND rev%s%%s
+                            ORDER BY rev DESC LIMIT %%s
+                            """ % bound,
+                            (self.id, path, sfirst, srev, page_size))]
+                    else:
+                        revs = [r for r, in db("""
+                            SELECT DISTINCT rev FROM node_change
+                            WHERE repos=%%s AND rev>=%%s AND rev%s%%s
+                            ORDER BY rev DESC LIMIT %%s
+                            """ % bound, (self.id, sfirst, srev, page_size))]
+                for last in revs:
+                    yield (path or '/', self.rev_db(last))
+                if len(revs) < page_size:
+                    break
+                srev = last
+                bound = '<'
+
+            if origin is None:
+                return
+            orev, opath, change, base_path, base_rev = origin
+            if last != orev:
+                # a parent was copied, the path itself didn't change
+                yield (path, self.rev_db(orev))
+            if change == 'A' or not base_path:
+                return
+            path = base_path.strip('/') + path[len(opath):]
+            srev = self.db_rev(self.rev_db(base_rev))
+
     def get_oldest_rev(self):
         return self.repos.oldest_rev
 
@@ -328,29 +589,39 @@ class CachedRepository(Repository):
 
     def _next_prev_rev(self, direction, rev, path=''):
         srev = self.db_rev(rev)
+        order = " DESC" if direction == '<' else ""
         with self.env.db_query as db:
+            path = path.strip('/')
+            if not path:
+                for rev, in db("""
+                        SELECT rev FROM node_change
+                        WHERE repos=%%s AND rev%s%%s
+                        ORDER BY rev%s LIMIT 1
+                        """ % (direction, order), (self.id, srev)):
+                    return int(rev)
+                return None
+
             # the changeset revs are sequence of ints:
-            sql = "SELECT rev FROM node_change WHERE repos=%s AND " + \
-                  "rev" + direction + "%s"
-            args = [self.id, srev]
-
-            if path:
-                path = path.lstrip('/')
-                # changes on path itself or its children
-                sql += " AND (path=%s OR path " + db.like()
-                args.extend((path, db.like_escape(path + '/') + '%'))
-                # deletion of path ancestors
-                components = path.lstrip('/').split('/')
-                parents = ','.join(('%s',) * len(components))
-                sql += " OR (path IN (" + parents + ") AND change_type='D'))"
-                for i in range(1, len(components) + 1):
-                    args.append('/'.join(components[:i]))
-
-            sql += " ORDER BY rev" + (" DESC" if direction == '<' else "") \
-                   + " LIMIT 1"
-            
-            for rev, in db(sql, args):
-                return int(rev)
+            revs = []
+            # changes on path itself or its children
+            revs.extend(int(rev) for rev, in db("""
+                    SELECT rev FROM node_change_prefix
+                    WHERE repos=%%s AND prefix=%%s AND rev%s%%s
+                    ORDER BY rev%s LIMIT 1
+                    """ % (direction, order), (self.id, path, srev)))
+            # deletion of path ancestors
+            components = path.split('/')
+            ancestors = ['/'.join(components[:i])
+                         for i in range(1, len(components) + 1)]
+            revs.extend(int(rev) for rev, in db("""
+                    SELECT rev FROM node_change
+                    WHERE repos=%%s AND path IN (%s) AND change_type='D'
+                      AND rev%s%%s
+                    ORDER BY rev%s LIMIT 1
+                    """ % (','.join(('%s',) * len(ancestors)), direction,
+                           order), [self.id] + ancestors + [srev]))
+            if revs:
+                return max(revs) if direction == '<' else min(revs)
 
     def rev_older_than(self, rev1, rev2):
         return self.repos.rev_older_than(self.normalize_rev(rev1),
@@ -393,18 +664,22 @@ class CachedRepository(Repository):
 
 class CachedChangeset(Changeset):
 
-    def __init__(self, repos, rev, env):
+    def __init__(self, repos, rev, env, row=None):
+        """`row` is the `(time, author, message)` tuple of the changeset
+        if it has already been retrieved from the `revision` table."""
         self.env = env
-        for _date, author, message in self.env.db_query("""
-                SELECT time, author, message FROM revision
-                WHERE repos=%s AND rev=%s
-                """, (repos.id, repos.db_rev(rev))):
-            date = from_utimestamp(_date)
-            Changeset.__init__(self, repos, repos.rev_db(rev), message, author,
-                               date)
-            break
-        else:
-            raise NoSuchChangeset(rev)
+        if row is None:
+            for row in self.env.db_query("""
+                    SELECT time, author, message FROM revision
+                    WHERE repos=%s AND rev=%s
+                    """, (repos.id, repos.db_rev(rev))):
+                break
+            else:
+                raise NoSuchChangeset(rev)
+        _date, author, message = row
+        date = from_utimestamp(_date)
+        Changeset.__init__(self, repos, repos.rev_db(rev), message, author,
+                           date)
 
     def get_changes(self):
         for path, kind, change, base_path, base_rev in sorted(
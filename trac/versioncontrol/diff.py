@@ -14,6 +14,7 @@
 #
 # Author: Christopher Lenz <cmlenz@gmx.de>
 
+from bisect import bisect_left
 import difflib
 import re
 
@@ -21,8 +22,8 @@ from genshi import Markup, escape
 
 from trac.util.text import expandtabs
 
-__all__ = ['diff_blocks', 'get_change_extent', 'get_diff_options', 
-           'unified_diff']
+__all__ = ['diff_algorithms', 'diff_blocks', 'get_change_extent',
+           'get_diff_options', 'unified_diff', 'PatienceSequenceMatcher']
 
 
 def get_change_extent(str1, str2):
@@ -45,9 +46,141 @@ def get_change_extent(str1, str2):
     return (start, end + 1)
 
 
+class PatienceSequenceMatcher(difflib.SequenceMatcher):
+    """`difflib.SequenceMatcher` computing the matching blocks with the
+    "patience diff" algorithm.
+
+    The lines occurring exactly once in both sequences are matched first,
+    keeping the longest increasing subsequence of them, and the algorithm
+    is repeated on the parts between these matches. This takes close to
+    linear time, unlike `difflib.SequenceMatcher` which degrades badly on
+    large inputs, especially with many repeated lines. The parts which
+    don't have any unique lines are compared with `difflib` when they are
+    smaller than `fallback_size` lines squared, and are otherwise reported
+    as replaced.
+
+    The same sequences as `difflib.SequenceMatcher` are supported, and
+    opcodes are retrieved the same way.
+
+    >>> matcher = PatienceSequenceMatcher(None, ['a', 'b', 'c', 'd', 'b'],
+    ...                                   ['a', 'x', 'c', 'b', 'd', 'b'])
+    >>> for opcode in matcher.get_opcodes():
+    ...     print opcode
+    ('equal', 0, 1, 0, 1)
+    ('replace', 1, 2, 1, 2)
+    ('equal', 2, 3, 2, 3)
+    ('insert', 3, 3, 3, 4)
+    ('equal', 3, 5, 4, 6)
+    """
+
+    fallback_size = 300
+
+    def get_matching_blocks(self):
+        if self.matching_blocks is not None:
+            return self.matching_blocks
+        a, b = self.a, self.b
+        fallback_limit = self.fallback_size ** 2
+        matches = []
+        regions = [(0, len(a), 0, len(b))]
+        while regions:
+            alo, ahi, blo, bhi = regions.pop()
+            # Match the common prefix and suffix of the region
+            n = 0
+            while alo + n < ahi and blo + n < bhi and \
+                    a[alo + n] == b[blo + n]:
+                n += 1
+            if n:
+                matches.append((alo, blo, n))
+                alo += n
+                blo += n
+            n = 0
+            while alo < ahi - n and blo < bhi - n and \
+                    a[ahi - n - 1] == b[bhi - n - 1]:
+                n += 1
+            if n:
+                ahi -= n
+                bhi -= n
+                matches.append((ahi, bhi, n))
+            if alo == ahi or blo == bhi:
+                continue
+            anchors = self._unique_lcs(alo, ahi, blo, bhi)
+            if anchors:
+                for i, j in anchors:
+                    matches.append((i, j, 1))
+                    regions.append((alo, i, blo, j))
+                    alo, blo = i + 1, j + 1
+                regions.append((alo, ahi, blo, bhi))
+            elif (ahi - alo) * (bhi - blo) <= fallback_limit:
+                matcher = difflib.SequenceMatcher(None, a[alo:ahi],
+                                                  b[blo:bhi])
+                for i, j, n in matcher.get_matching_blocks():
+                    if n:
+                        matches.append((alo + i, blo + j, n))
+
+        # Join the adjacent matches
+        matches.sort()
+        blocks = []
+        i1 = j1 = n1 = 0
+        for i2, j2, n2 in matches:
+            if i1 + n1 == i2 and j1 + n1 == j2:
+                n1 += n2
+            else:
+                if n1:
+                    blocks.append((i1, j1, n1))
+                i1, j1, n1 = i2, j2, n2
+        if n1:
+            blocks.append((i1, j1, n1))
+        blocks.append((len(a), len(b), 0))
+        self.matching_blocks = blocks
+        return blocks
+
+    def _unique_lcs(self, alo, ahi, blo, bhi):
+        """Return the `(i, j)` positions of the longest sequence of
+        matching elements occurring only once in `a[alo:ahi]` and
+        `b[blo:bhi]`, in increasing order."""
+        a, b = self.a, self.b
+        positions = {}
+        for i in xrange(alo, ahi):
+            line = a[i]
+            positions[line] = -1 if line in positions else i
+        unique = {}
+        for j in xrange(blo, bhi):
+            line = b[j]
+            i = positions.get(line, -1)
+            if i >= 0:
+                unique[line] = None if line in unique else (i, j)
+        pairs = sorted(pair for pair in unique.itervalues() if pair)
+
+        # Longest increasing subsequence of the positions in `b`, using
+        # patience sorting
+        tops = []
+        piles = []
+        backlinks = []
+        for k, (i, j) in enumerate(pairs):
+            pile = bisect_left(tops, j)
+            if pile == len(tops):
+                tops.append(j)
+                piles.append(k)
+            else:
+                tops[pile] = j
+                piles[pile] = k
+            backlinks.append(piles[pile - 1] if pile else -1)
+        lcs = []
+        k = piles[-1] if piles else -1
+        while k >= 0:
+            lcs.append(pairs[k])
+            k = backlinks[k]
+        lcs.reverse()
+        return lcs
+
+
+diff_algorithms = {'difflib': difflib.SequenceMatcher,
+                   'patience': PatienceSequenceMatcher}
+
+
 def get_filtered_hunks(fromlines, tolines, context=None,
                        ignore_blank_lines=False, ignore_case=False,
-                       ignore_space_changes=False):
+                       ignore_space_changes=False, algorithm='difflib'):
     """Retrieve differences in the form of `difflib.SequenceMatcher`
     opcodes, grouped according to the ``context`` and ``ignore_*``
     parameters.
@@ -59,13 +192,15 @@ def get_filtered_hunks(fromlines, tolines, context=None,
     :param ignore_space_changes: differences in amount of spaces are ignored
     :param context: the number of "equal" lines kept for representing
                     the context of the change
+    :param algorithm: the name of the diff algorithm, a key of
+                      `diff_algorithms`
     :return: generator of grouped `difflib.SequenceMatcher` opcodes
 
     If none of the ``ignore_*`` parameters is `True`, there's nothing
     to filter out the results will come straight from the
     SequenceMatcher.
     """
-    hunks = get_hunks(fromlines, tolines, context)
+    hunks = get_hunks(fromlines, tolines, context, algorithm)
     if ignore_space_changes or ignore_case or ignore_blank_lines:
         hunks = filter_ignorable_lines(hunks, fromlines, tolines, context,
                                        ignore_blank_lines, ignore_case,
@@ -73,12 +208,12 @@ def get_filtered_hunks(fromlines, tolines, context=None,
     return hunks
                  
 
-def get_hunks(fromlines, tolines, context=None):
+def get_hunks(fromlines, tolines, context=None, algorithm='difflib'):
     """Generator yielding grouped opcodes describing differences .
 
     See `get_filtered_hunks` for the parameter descriptions.
     """
-    matcher = difflib.SequenceMatcher(None, fromlines, tolines)
+    matcher = diff_algorithms[algorithm](None, fromlines, tolines)
     if context is None:
         return (hunk for hunk in [matcher.get_opcodes()])
     else:
@@ -181,7 +316,8 @@ def hdf_diff(*args, **kwargs):
     return diff_blocks(*args, **kwargs)
 
 def diff_blocks(fromlines, tolines, context=None, tabwidth=8,
-                ignore_blank_lines=0, ignore_case=0, ignore_space_changes=0):
+                ignore_blank_lines=0, ignore_case=0, ignore_space_changes=0,
+                algorithm='difflib'):
     """Return an array that is adequate for adding to the data dictionary
 
     See `get_filtered_hunks` for the parameter descriptions.
@@ -217,7 +353,7 @@ def diff_blocks(fromlines, tolines, context=None, tabwidth=8,
     changes = []
     for group in get_filtered_hunks(fromlines, tolines, context, 
                                     ignore_blank_lines, ignore_case,
-                                    ignore_space_changes):
+                                    ignore_space_changes, algorithm):
         blocks = []
         last_tag = None
         for tag, i1, i2, j1, j2 in markup_intraline_changes(group):
@@ -258,14 +394,14 @@ def diff_blocks(fromlines, tolines, context=None, tabwidth=8,
 
 
 def unified_diff(fromlines, tolines, context=None, ignore_blank_lines=0,
-                 ignore_case=0, ignore_space_changes=0):
+                 ignore_case=0, ignore_space_changes=0, algorithm='difflib'):
     """Generator producing lines corresponding to a textual diff.
 
     See `get_filtered_hunks` for the parameter descriptions.
     """
     for group in get_filtered_hunks(fromlines, tolines, context,
                                     ignore_blank_lines, ignore_case,
-                                    ignore_space_changes):
+                                    ignore_space_changes, algorithm):
         i1, i2, j1, j2 = group[0][1], group[-1][2], group[0][3], group[-1][4]
         if i1 == 0 and i2 == 0:
             i1, i2 = -1, -1 # support for 'A'dd changes
@@ -108,6 +108,59 @@ def parse(authz, modules):
     return authz
 
 
+class PathDecisions(object):
+    """Decisions of a parsed authz file for a list of modules and users.
+
+    The decision for each path having a section is resolved in advance,
+    as well as the set of the directories containing a readable path, so
+    that checking a path only involves a dictionary lookup for each of
+    its parents. The results are memoized.
+    """
+
+    MAX_CACHED_PATHS = 10000
+
+    def __init__(self, authz, modules, usernames):
+        self.decisions = {}
+        self.readable_parents = set()
+        for module in modules:
+            for spath, section in authz.get(module, {}).iteritems():
+                if spath not in self.decisions:
+                    for user in usernames:
+                        result = section.get(user)
+                        if result is not None:
+                            self.decisions[spath] = result
+                            break
+                if any(section.get(user) is True for user in usernames):
+                    self.readable_parents.add('/')
+                    idx = spath.find('/', 1)
+                    while idx != -1:
+                        self.readable_parents.add(spath[:idx + 1])
+                        idx = spath.find('/', idx + 1)
+        self._cache = {}
+
+    def check(self, path):
+        """Return the decision for `path`, which must be absolute and end
+        with a `/` (except for the root), or `None`."""
+        try:
+            return self._cache[path]
+        except KeyError:
+            pass
+        result = None
+        # Walk from resource up parent directories
+        for spath in parent_iter(path):
+            result = self.decisions.get(spath)
+            if result is not None:
+                break
+        else:
+            # Allow access to parent directories of allowed resources
+            if path in self.readable_parents:
+                result = True
+        if len(self._cache) >= self.MAX_CACHED_PATHS:
+            self._cache = {}
+        self._cache[path] = result
+        return result
+
+
 class AuthzSourcePolicy(Component):
     """Permission policy for `source:` and `changeset:` resources using a
     Subversion authz file.
@@ -136,6 +189,7 @@ class AuthzSourcePolicy(Component):
     _mtime = 0
     _authz = {}
     _users = set()
+    _path_decisions = {}
     
     _handled_perms = frozenset([(None, 'BROWSER_VIEW'),
                                 (None, 'CHANGESET_VIEW'),
@@ -169,32 +223,20 @@ class AuthzSourcePolicy(Component):
                 return True # Allow error to be displayed in the repo index
             if repos is None:
                 return True
-            modules = [resource.parent.id or self.authz_module_name]
+            modules = (resource.parent.id or self.authz_module_name,)
             if modules[0]:
-                modules.append('')
+                modules += ('',)
+            key = (modules, usernames)
+            decisions = self._path_decisions.get(key)
+            if decisions is None:
+                decisions = PathDecisions(authz, modules, usernames)
+                self._path_decisions[key] = decisions
 
             def check_path(path):
                 path = '/' + join(repos.scope, path)
                 if path != '/':
                     path += '/'
-                
-                # Walk from resource up parent directories
-                for spath in parent_iter(path):
-                    for module in modules:
-                        section = authz.get(module, {}).get(spath)
-                        if section:
-                            for user in usernames:
-                                result = section.get(user)
-                                if result is not None:
-                                    return result
-                
-                # Allow access to parent directories of allowed resources
-                if any(section.get(user) is True
-                       for module in modules
-                       for spath, section in authz.get(module, {}).iteritems()
-                       if spath.startswith(path)
-                       for user in usernames):
-                    return True
+                return decisions.check(path)
             
             if realm == 'source':
                 return check_path(resource.id)
@@ -215,6 +257,7 @@ class AuthzSourcePolicy(Component):
             self._mtime = mtime = 0
             self._authz = None
             self._users = set()
+            self._path_decisions = {}
         if mtime > self._mtime:
             self._mtime = mtime
             rm = RepositoryManager(self.env)
@@ -224,6 +267,7 @@ class AuthzSourcePolicy(Component):
                 modules.add(self.authz_module_name)
             modules.add('')
             self.log.info('Parsing authz file: %s' % self.authz_file)
+            self._path_decisions = {}
             try:
                 self._authz = parse(read_file(self.authz_file), modules)
                 self._users = set(user for paths in self._authz.itervalues()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011 Edgewall Software
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution. The terms
+# are also available at http://trac.edgewall.org/wiki/TracLicense.
+#
+# This software consists of voluntary contributions made by many
+# individuals. For the exact contribution history, see the revision
+# history and logs, available at http://trac.edgewall.org/log/.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from trac.core import TracError
+from trac.test import EnvironmentStub
+from trac.versioncontrol.admin import VersionControlAdmin
+from trac.versioncontrol.api import RepositoryManager
+
+
+class ChangesetSpoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub()
+        self.env.path = tempfile.mkdtemp(prefix='trac-tempenv-')
+        self.admin = VersionControlAdmin(self.env)
+        os.makedirs(self.admin.spool_dir)
+        self.notified = []
+        rm = RepositoryManager(self.env)
+        rm.notify = lambda event, reponame, revs: \
+                    self.notified.append((event, reponame, list(revs)))
+        self.orig_stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.orig_stdout
+        del RepositoryManager(self.env).notify
+        shutil.rmtree(self.env.path)
+
+    def _queue(self, name, content):
+        f = open(os.path.join(self.admin.spool_dir, name), 'wb')
+        try:
+            f.write(content)
+        finally:
+            f.close()
+
+    def test_batches(self):
+        self._queue('1-1-10', 'added\n/repos/a\n10\n')
+        self._queue('1-2-3', 'modified\n/repos/a\n3\n')
+        self._queue('2-1-11', 'added\n/repos/a\n11\n')
+        self._queue('2-2-5', 'added\n(default)\n5\n')
+        self.assertEqual(4, self.admin.process_spool())
+        self.assertEqual([('changeset_added', '/repos/a', ['10', '11']),
+                          ('changeset_modified', '/repos/a', ['3']),
+                          ('changeset_added', '', ['5'])], self.notified)
+        self.assertEqual([], os.listdir(self.admin.spool_dir))
+
+    def test_revisions_sorted(self):
+        self._queue('1-10', 'added\n/repos/a\n10\n')
+        self._queue('1-9', 'added\n/repos/a\n9\n')
+        self.assertEqual(2, self.admin.process_spool())
+        self.assertEqual([('changeset_added', '/repos/a', ['9', '10'])],
+                         self.notified)
+
+    def test_failed_events_kept(self):
+        def notify(event, reponame, revs):
+            if reponame == '/repos/a':
+                raise TracError('Failed')
+            self.notified.append((event, reponame, list(revs)))
+        RepositoryManager(self.env).notify = notify
+        self._queue('1-1-10', 'added\n/repos/a\n10\n')
+        self._queue('1-2-3', 'added\n/repos/b\n3\n')
+        self.assertEqual(2, self.admin.process_spool())
+        self.assertEqual([('changeset_added', '/repos/b', ['3'])],
+                         self.notified)
+        self.assertEqual(['1-1-10'], os.listdir(self.admin.spool_dir))
+
+    def test_skip_temporary_and_invalid_files(self):
+        self._queue('.1-1-10', 'added\n/repos/a\n10\n')
+        self._queue('1-1-11', 'removed\n/repos/a\n11\n')
+        self._queue('1-1-12', 'added\n/repos/a\n')
+        self.assertEqual(2, self.admin.process_spool())
+        self.assertEqual([], self.notified)
+        self.assertEqual(['.1-1-10'], os.listdir(self.admin.spool_dir))
+
+    def test_missing_spool_dir(self):
+        os.rmdir(self.admin.spool_dir)
+        self.assertEqual(0, self.admin.process_spool())
+
+
+def suite():
+    return unittest.makeSuite(ChangesetSpoolTestCase, 'test')
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
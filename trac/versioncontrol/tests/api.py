@@ -14,10 +14,13 @@
 # Author: Eli Carter <eli.carter@commprove.com>
 
 import unittest
+from datetime import datetime
 
 from trac.resource import Resource, get_resource_description, get_resource_url
 from trac.test import EnvironmentStub
-from trac.versioncontrol.api import Repository
+from trac.test import Mock
+from trac.util.datefmt import utc
+from trac.versioncontrol.api import Changeset, Repository
 
 
 class ApiTestCase(unittest.TestCase):
@@ -62,6 +65,20 @@ class ApiTestCase(unittest.TestCase):
     def test_raise_NotImplementedError_get_changes(self):
         self.failUnlessRaises(NotImplementedError, self.repo_base.get_changes, 'path', 1, 'path', 2)
 
+    def test_get_changesets_newest_first(self):
+        dates = {'c': datetime(2010, 1, 3, tzinfo=utc),
+                 'b': datetime(2010, 1, 4, tzinfo=utc),
+                 'a': datetime(2010, 1, 2, tzinfo=utc)}
+        repos = Mock(Repository, 'testrepo', {'name': 'testrepo', 'id': 1},
+                     None, get_youngest_rev=lambda: 'c',
+                     previous_rev=lambda rev: {'c': 'b', 'b': 'a'}.get(rev),
+                     get_changeset=lambda rev: Mock(Changeset, repos, rev, '',
+                                                    '', dates[rev]))
+        self.assertEqual(['b', 'c'],
+                         [c.rev for c in repos.get_changesets(
+                             datetime(2010, 1, 3, tzinfo=utc),
+                             datetime(2010, 1, 5, tzinfo=utc))])
+
 
 class ResourceManagerTestCase(unittest.TestCase):
 
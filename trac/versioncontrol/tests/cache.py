@@ -17,10 +17,13 @@
 from __future__ import with_statement
 
 from datetime import datetime
+import doctest
 
+from trac.core import TracError
 from trac.test import EnvironmentStub, Mock
 from trac.util.datefmt import to_utimestamp, utc
 from trac.versioncontrol import Repository, Changeset, Node, NoSuchChangeset
+import trac.versioncontrol.cache
 from trac.versioncontrol.cache import CachedRepository
 
 import unittest
@@ -113,6 +116,62 @@ class CacheTestCase(unittest.TestCase):
             self.assertEquals(('1', 'trunk/README', 'F', 'A', None, None),
                               rows[1])
 
+    def test_sync_batches(self):
+        t = datetime(2001, 1, 1, 1, 1, 1, 0, utc)
+        repos = self.get_repos(get_changeset=lambda x: changesets[int(x)],
+                               youngest_rev=4)
+        changesets = [Mock(Changeset, repos, rev, 'Rev %d' % rev, 'joe', t,
+                           get_changes=lambda: iter([
+                               ('trunk', Node.DIRECTORY, Changeset.EDIT,
+                                'trunk', 0)]))
+                      for rev in range(5)]
+        self.env.config.set('trac', 'repository_sync_batch_size', 2)
+        cache = CachedRepository(self.env, repos, self.log)
+        synced = []
+        def feedback(rev):
+            # Revisions are reported once their batch is committed
+            youngest = self.env.db_query("""
+                SELECT value FROM repository
+                WHERE id=1 AND name='youngest_rev'""")[0][0]
+            synced.append((rev, youngest))
+        cache.sync(feedback)
+
+        self.assertEquals([(0, '1'), (1, '1'), (2, '3'), (3, '3'),
+                           (4, '4')], synced)
+        with self.env.db_query as db:
+            self.assertEquals(5, db("SELECT COUNT(*) FROM revision")[0][0])
+            self.assertEquals(5, db("SELECT COUNT(*) FROM node_change")[0][0])
+
+    def test_sync_with_read_ahead(self):
+        self.env.config.set('trac', 'repository_sync_read_ahead', 2)
+        self.test_sync_batches()
+
+    def _test_sync_read_error(self):
+        t = datetime(2001, 1, 1, 1, 1, 1, 0, utc)
+        def get_changeset(rev):
+            if int(rev) == 3:
+                raise TracError('Unreadable')
+            return Mock(Changeset, repos, int(rev), '', 'joe', t,
+                        get_changes=lambda: iter([]))
+        repos = self.get_repos(get_changeset=get_changeset, youngest_rev=4)
+        self.env.config.set('trac', 'repository_sync_batch_size', 2)
+        cache = CachedRepository(self.env, repos, self.log)
+        self.assertRaises(TracError, cache.sync)
+
+        with self.env.db_query as db:
+            self.assertEquals(['0', '1'], [rev for rev, in db(
+                "SELECT rev FROM revision ORDER BY rev")])
+            self.assertEquals('1', db("""
+                SELECT value FROM repository
+                WHERE id=1 AND name='youngest_rev'""")[0][0])
+
+    def test_sync_read_error(self):
+        self._test_sync_read_error()
+
+    def test_sync_read_ahead_error(self):
+        self.env.config.set('trac', 'repository_sync_read_ahead', 2)
+        self._test_sync_read_error()
+
     def test_update_sync(self):
         t1 = datetime(2001, 1, 1, 1, 1, 1, 0, utc)
         t2 = datetime(2002, 1, 1, 1, 1, 1, 0, utc)
@@ -219,6 +278,132 @@ class CacheTestCase(unittest.TestCase):
         self.assertEquals((to_utimestamp(t1), 'joe', '**empty**'), rows[0])
         self.assertEquals((to_utimestamp(t2), 'joe', 'Import'), rows[1])
 
+    def _sync_history(self, *extra):
+        t = datetime(2001, 1, 1, 1, 1, 1, 0, utc)
+        history = [
+            [],
+            [('trunk', Node.DIRECTORY, Changeset.ADD, None, None),
+             ('trunk/a', Node.DIRECTORY, Changeset.ADD, None, None),
+             ('trunk/a/x', Node.FILE, Changeset.ADD, None, None)],
+            [('branches', Node.DIRECTORY, Changeset.ADD, None, None)],
+            [('trunk/a/y', Node.FILE, Changeset.ADD, None, None),
+             ('trunk/ab', Node.FILE, Changeset.ADD, None, None)],
+            [('trunk/ab', Node.FILE, Changeset.EDIT, 'trunk/ab', 3)],
+            [('trunk', Node.DIRECTORY, Changeset.DELETE, 'trunk', 4)],
+            ] + list(extra)
+        repos = self.get_repos(get_changeset=lambda x: changesets[int(x)],
+                               youngest_rev=len(history) - 1)
+        repos.get_node = lambda path, rev: None
+        changesets = [Mock(Changeset, repos, rev, '', 'joe', t,
+                           get_changes=lambda changes=changes: iter(changes))
+                      for rev, changes in enumerate(history)]
+        cache = CachedRepository(self.env, repos, self.log)
+        cache.sync()
+        cache.has_linear_changesets = True
+        return cache
+
+    def test_node_change_prefixes(self):
+        self._sync_history()
+        self.assertEqual([('branches', '2'), ('trunk', '1'), ('trunk', '3'),
+                          ('trunk', '4'), ('trunk', '5'), ('trunk/a', '1'),
+                          ('trunk/a', '3'), ('trunk/a/x', '1'),
+                          ('trunk/a/y', '3'), ('trunk/ab', '3'),
+                          ('trunk/ab', '4')],
+                         self.env.db_query("""
+                            SELECT prefix, rev FROM node_change_prefix
+                            WHERE repos=1 ORDER BY prefix, rev"""))
+
+    def test_next_prev_rev_on_path(self):
+        cache = self._sync_history()
+        self.assertEqual(3, cache.next_rev(1, 'trunk/a'))
+        self.assertEqual(5, cache.next_rev(3, '/trunk/a/'))
+        self.assertEqual(3, cache.previous_rev(5, 'trunk/a'))
+        self.assertEqual(1, cache.previous_rev(3, 'trunk/a'))
+        self.assertEqual(None, cache.previous_rev(1, 'trunk/a'))
+        self.assertEqual(None, cache.next_rev(2, 'branches'))
+        self.assertEqual(2, cache.next_rev(1, ''))
+        self.assertEqual(4, cache.previous_rev(5))
+
+    def test_get_node_revs(self):
+        cache = self._sync_history()
+        self.assertEqual([1, 3], cache._get_node_revs('trunk/a', 4))
+        self.assertEqual([3, 4], cache._get_node_revs('trunk/ab', 4))
+        self.assertEqual([1, 2, 3, 4], cache._get_node_revs('', 4, 1))
+
+    def _history(self, history):
+        return [(h[0], int(h[1])) + h[2:] for h in history]
+
+    def test_get_node_history(self):
+        cache = self._sync_history(
+            [('branches/b1', Node.DIRECTORY, Changeset.COPY, 'trunk', 4)],
+            [('branches/b1/a/x', Node.FILE, Changeset.EDIT,
+              'branches/b1/a/x', 6)])
+        self.assertEqual([('branches/b1/a/x', 7, Changeset.EDIT),
+                          ('branches/b1/a/x', 6, Changeset.COPY),
+                          ('trunk/a/x', 1, Changeset.ADD)],
+                         self._history(cache.get_node_history(
+                             'branches/b1/a/x', 7)))
+        self.assertEqual([('branches/b1', 7, Changeset.EDIT),
+                          ('branches/b1', 6, Changeset.COPY),
+                          ('trunk', 4, Changeset.EDIT)],
+                         self._history(cache.get_node_history(
+                             '/branches/b1', None, 3)))
+        self.assertEqual([('trunk/a', 3, Changeset.EDIT),
+                          ('trunk/a', 1, Changeset.ADD)],
+                         self._history(cache.get_node_history(
+                             'trunk/a', 4)))
+        self.assertEqual([('/', 4, Changeset.EDIT), ('/', 3, Changeset.EDIT),
+                          ('/', 2, Changeset.EDIT), ('/', 1, Changeset.ADD)],
+                         self._history(cache.get_node_history('/',
+                                                              4)))
+
+    def test_get_node_history_non_linear(self):
+        cache = self._sync_history()
+        cache.has_linear_changesets = False
+        history = [('trunk', 3, Changeset.EDIT), ('trunk', 1, Changeset.ADD)]
+        cache.repos.get_node = lambda path, rev: \
+            Mock(Node, cache.repos, path, rev, Node.DIRECTORY,
+                 get_history=lambda limit=None: iter(history[:limit]))
+        self.assertEqual(history, list(cache.get_node_history('trunk', 4)))
+        self.assertEqual(history[:1],
+                         list(cache.get_node_history('trunk', 4, 1)))
+
+    def test_cached_history_pages(self):
+        cache = self._sync_history()
+        self.assertEqual([('trunk', 4), ('trunk', 3), ('trunk', 1)],
+                         self._history(cache._get_cached_history(
+                             'trunk', 4, 1)))
+        self.assertEqual([('/', 5), ('/', 4), ('/', 3), ('/', 2), ('/', 1)],
+                         self._history(cache._get_cached_history(
+                             '', 5, 2)))
+
+    def test_get_changesets_by_revs(self):
+        t1 = datetime(2001, 1, 1, 1, 1, 1, 0, utc)
+        t2 = datetime(2002, 1, 1, 1, 1, 1, 0, utc)
+        self.preset_cache(
+            (('0', to_utimestamp(t1), '', ''), []),
+            (('1', to_utimestamp(t2), 'joe', 'Import'), []),
+            )
+        cache = CachedRepository(self.env, self.get_repos(), self.log)
+        changesets = cache.get_changesets_by_revs([1, '0', 1, 5])
+        self.assertEqual([1, '0'], sorted(changesets))
+        self.assertEqual(('joe', 'Import', t2),
+                         (changesets[1].author, changesets[1].message,
+                          changesets[1].date))
+        self.assertEqual('0', changesets['0'].rev)
+
+    def test_get_changesets(self):
+        t = datetime(2001, 1, 1, 1, 1, 1, 0, utc)
+        self.preset_cache(*[((str(rev), to_utimestamp(t) + rev, 'joe', ''),
+                             []) for rev in xrange(6)])
+        cache = CachedRepository(self.env, self.get_repos(), self.log)
+        start = datetime(2000, 1, 1, tzinfo=utc)
+        stop = datetime(2002, 1, 1, tzinfo=utc)
+        for limit in (None, 1, 2, 10):
+            self.assertEqual(['5', '4', '3', '2', '1', '0'],
+                             [c.rev for c in cache.get_changesets(start, stop,
+                                                                  limit)])
+
     def test_get_changes(self):
         t1 = datetime(2001, 1, 1, 1, 1, 1, 0, utc)
         t2 = datetime(2002, 1, 1, 1, 1, 1, 0, utc)
@@ -244,7 +429,10 @@ class CacheTestCase(unittest.TestCase):
 
 
 def suite():
-    return unittest.makeSuite(CacheTestCase, 'test')
+    suite = unittest.TestSuite()
+    suite.addTest(doctest.DocTestSuite(trac.versioncontrol.cache))
+    suite.addTest(unittest.makeSuite(CacheTestCase, 'test'))
+    return suite
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,7 @@
 from trac.versioncontrol import diff
 
+import doctest
+import random
 import unittest
 
 def get_opcodes(*args, **kwargs):
@@ -206,8 +208,70 @@ class DiffTestCase(unittest.TestCase):
         self.assertEquals(str(block['changed']['lines'][0]),
                           'aa<ins>x</ins>b')
 
+
+class PatienceSequenceMatcherTestCase(unittest.TestCase):
+
+    def _assert_opcodes(self, a, b, opcodes):
+        """Check that the opcodes cover both sequences and transform `a`
+        into `b`."""
+        i = j = 0
+        result = []
+        for tag, i1, i2, j1, j2 in opcodes:
+            self.assertEqual((i, j), (i1, j1))
+            if tag == 'equal':
+                self.assertEqual(a[i1:i2], b[j1:j2])
+            result.extend(b[j1:j2])
+            i, j = i2, j2
+        self.assertEqual((len(a), len(b)), (i, j))
+        self.assertEqual(b, result)
+
+    def test_random_sequences(self):
+        rnd = random.Random(42)
+        for n in range(500):
+            a = [rnd.choice('abcdefgh') for i in range(rnd.randint(0, 30))]
+            b = [rnd.choice('abcdefgh') for i in range(rnd.randint(0, 30))]
+            matcher = diff.PatienceSequenceMatcher(None, a, b)
+            if n % 2:
+                matcher.fallback_size = 0
+            self._assert_opcodes(a, b, matcher.get_opcodes())
+
+    def test_unique_lines_anchor(self):
+        a = ['{', 'a', '}', '{', 'b', '}']
+        b = ['{', 'b', '}', '{', 'a', '}', '{', 'c', '}']
+        opcodes = diff.PatienceSequenceMatcher(None, a, b).get_opcodes()
+        self._assert_opcodes(a, b, opcodes)
+        self.assertTrue(('equal', 4, 5, 1, 2) in opcodes)
+
+    def test_repeated_lines(self):
+        a = ['INSERT INTO t VALUES (1);'] * 20000 + ['end']
+        b = ['INSERT INTO t VALUES (1);'] * 10000 + ['middle'] + \
+            ['INSERT INTO t VALUES (1);'] * 10001 + ['end']
+        matcher = diff.PatienceSequenceMatcher(None, a, b)
+        self.assertEqual([('equal', 0, 10000, 0, 10000),
+                          ('insert', 10000, 10000, 10000, 10002),
+                          ('equal', 10000, 20001, 10002, 20003)],
+                         matcher.get_opcodes())
+
+    def test_grouped_opcodes(self):
+        groups = diff.get_filtered_hunks(['A', 'B', 'C', 'D', 'E', 'F'],
+                                         ['A', 'B', 'x', 'D', 'E', 'F'],
+                                         context=1, algorithm='patience')
+        self.assertEqual([('equal', 1, 2, 1, 2), ('replace', 2, 3, 2, 3),
+                          ('equal', 3, 4, 3, 4)], groups.next())
+        self.assertRaises(StopIteration, groups.next)
+
+    def test_unified_diff(self):
+        diff_lines = list(diff.unified_diff(['a', 'b'], ['a', 'c'], 1,
+                                            algorithm='patience'))
+        self.assertEqual(['@@ -1,2 +1,2 @@', ' a', '-b', '+c'], diff_lines)
+
+
 def suite():
-    return unittest.makeSuite(DiffTestCase, 'test')
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(DiffTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(PatienceSequenceMatcherTestCase, 'test'))
+    suite.addTest(doctest.DocTestSuite(diff))
+    return suite
 
 if __name__ == '__main__':
-    unittest.main()
+    unittest.main(defaultTest='suite')
@@ -384,6 +384,24 @@ unknown = r
         self.assertRevPerm(None, 'user', 'scoped', 456)
         self.assertRevPerm(True, 'user', 'scoped', 789)
 
+    def test_parent_directories(self):
+        # Parent directories of allowed paths are allowed
+        self.assertPathPerm(True, 'user', '', '/')
+        self.assertPathPerm(True, 'user', '', '/sub')
+        self.assertPathPerm(None, 'user', '', '/su')
+        self.assertPathPerm(None, 'joe', '', '/sub')
+
+    def test_decisions_reset_on_change(self):
+        self.assertPathPerm(True, 'user', '', '/readonly')
+        self.assertPathPerm(True, 'user', '', '/sub')
+        self.policy._mtime = 0
+        create_file(self.authz, """\
+[/readonly]
+user =
+""")
+        self.assertPathPerm(False, 'user', '', '/readonly')
+        self.assertPathPerm(None, 'user', '', '/sub')
+
 
 def suite():
     suite = unittest.TestSuite()
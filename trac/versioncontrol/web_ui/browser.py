@@ -21,7 +21,8 @@ import re
 
 from genshi.builder import tag
 
-from trac.config import ListOption, BoolOption, Option
+from trac.cache import FileCache
+from trac.config import ListOption, BoolOption, IntOption, Option
 from trac.core import *
 from trac.mimeview.api import IHTMLPreviewAnnotator, Mimeview, is_binary
 from trac.perm import IPermissionRequestor
@@ -40,6 +41,7 @@ from trac.wiki.api import IWikiSyntaxProvider, IWikiMacroProvider, parse_args
 from trac.wiki.formatter import format_to_html, format_to_oneliner
 
 from ..api import NoSuchChangeset, RepositoryManager
+from ..diff import diff_algorithms
 from trac.versioncontrol.web_ui.util import * # `from .util import *` FIXME 2.6
 
 
@@ -244,8 +246,36 @@ class BrowserModule(Component):
         the repository browser.
         (''since 0.9'')""")
 
+    blame_cache_size = IntOption('browser', 'blame_cache_size', 10240,
+        """Size in kilobytes allowed for the annotations of the blame
+        view in the `cache/blame` directory of the environment. When the
+        annotations of the previous revision of a file are available
+        there, those of a new revision are derived from them and from
+        the diff between both revisions, which is much faster than
+        asking the version control system. Set to 0 to always ask the
+        version control system (''since 0.13'').""")
+
     # public methods
 
+    def get_annotations(self, node):
+        """Return the list of the revisions in which each line of the file
+        `node` was last changed, like `Node.get_annotations()`, but using
+        the blame cache when possible."""
+        cache = FileCache.for_option(self.env, 'browser', 'blame_cache_size',
+                                     'blame')
+        if cache is None:
+            return node.get_annotations()
+        key = self._blame_key(node)
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+        annotations = self._get_incremental_annotations(cache, node)
+        if annotations is None:
+            annotations = node.get_annotations()
+        cache[key] = annotations
+        return annotations
+
     def get_custom_colorizer(self):
         """Returns a converter for values from [0.0, 1.0] to a RGB triple."""
         
@@ -818,6 +848,40 @@ class BrowserModule(Component):
             pass
         return (node, raw_href, title)
         
+    def _blame_key(self, node):
+        return (node.repos.id, node.created_path, node.created_rev)
+
+    def _get_incremental_annotations(self, cache, node):
+        """Compute the annotations of `node` from the cached annotations
+        of its previous revision, if available.
+
+        The lines which are unchanged since the previous revision keep
+        their annotation, the others are annotated with the revision in
+        which `node` was last changed.
+        """
+        previous = node.get_previous()
+        if not previous:
+            return None
+        old_node = node.repos.get_node(previous[0], previous[1])
+        try:
+            old_annotations = cache[self._blame_key(old_node)]
+        except KeyError:
+            return None
+        old_lines = old_node.get_content().read().splitlines()
+        new_lines = node.get_content().read().splitlines()
+        if len(old_lines) != len(old_annotations):
+            return None
+        algorithm = self.config.get('changeset', 'diff_algorithm')
+        matcher = diff_algorithms.get(algorithm, diff_algorithms['difflib'])
+        annotations = []
+        for tag, i1, i2, j1, j2 in matcher(None, old_lines,
+                                           new_lines).get_opcodes():
+            if tag == 'equal':
+                annotations.extend(old_annotations[i1:i2])
+            else:
+                annotations.extend([node.created_rev] * (j2 - j1))
+        return annotations
+
     # IHTMLPreviewAnnotator methods
 
     def get_annotation_type(self):
@@ -939,31 +1003,33 @@ class BlameAnnotator(object):
         node = self.repos.get_node(self.path, rev)
         # FIXME: get_annotations() should be in the Resource API
         # -- get revision numbers for each line
-        self.annotations = node.get_annotations()
+        browser = BrowserModule(self.env)
+        self.annotations = browser.get_annotations(node)
         # -- from the annotations, retrieve changesets and
         # determine the span of dates covered, for the color code.
         # Note: changesets[i].rev can differ from annotations[i]
         # (long form vs. compact, short rev form for the latter).
         self.changesets = []
-        chgset = self.repos.get_changeset(rev)
-        chgsets = {rev: chgset}
+        revs = set(self.annotations)
+        revs.add(rev)
+        chgsets = self.repos.get_changesets_by_revs(revs)
+        chgset = chgsets.get(rev) or self.repos.get_changeset(rev)
         self.timerange = TimeRange(chgset.date)
         for idx in range(len(self.annotations)):
             rev = self.annotations[idx]
             chgset = chgsets.get(rev)
             if not chgset:
-                chgset = self.repos.get_changeset(rev)
-                chgsets[rev] = chgset
-                self.timerange.insert(chgset.date)
+                chgset = chgsets[rev] = self.repos.get_changeset(rev)
             # get list of changeset parallel to annotations
             self.changesets.append(chgset)
+        for chgset in chgsets.itervalues():
+            self.timerange.insert(chgset.date)
         # -- retrieve the original path of the source, for each rev
         # (support for copy/renames)
         self.paths = {}
         for path, rev, chg in node.get_history():
             self.paths[rev] = path
         # -- get custom colorize function
-        browser = BrowserModule(self.env)
         self.colorize_age = browser.get_custom_colorizer()
 
     def annotate(self, row, lineno):
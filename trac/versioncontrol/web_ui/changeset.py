@@ -28,14 +28,18 @@ from StringIO import StringIO
 
 from genshi.builder import tag
 
-from trac.config import Option, BoolOption, IntOption
+from trac.cache import FileCache
+from trac.config import Option, BoolOption, ChoiceOption, IntOption
 from trac.core import *
 from trac.mimeview.api import Mimeview
 from trac.perm import IPermissionRequestor
 from trac.resource import Resource, ResourceNotFound
-from trac.search import ISearchSource, search_to_sql, shorten_result
-from trac.timeline.api import ITimelineEventProvider
+from trac.search import ISearchDocumentProvider, ISearchSource, \
+                        SearchIndex, search_by_ids, search_to_sql, \
+                        shorten_result
+from trac.timeline.api import ITimelineEventProvider, merge_events
 from trac.util import as_bool, content_disposition, embedded_numbers, pathjoin
+from trac.util.archive import ZipStream
 from trac.util.datefmt import from_utimestamp, pretty_timedelta
 from trac.util.text import exception_to_unicode, to_unicode, \
                            unicode_urlencode, shorten_line, CRLF
@@ -49,7 +53,7 @@ from trac.web import IRequestHandler, RequestDone
 from trac.web.chrome import (Chrome, INavigationContributor, add_ctxtnav, 
                              add_link, add_script, add_stylesheet, 
                              prevnext_nav, web_context)
-from trac.wiki import IWikiSyntaxProvider, WikiParser
+from trac.wiki import IWikiLinkPrefetcher, IWikiSyntaxProvider, WikiParser
 from trac.wiki.formatter import format_to
 
 
@@ -122,7 +126,8 @@ class ChangesetModule(Component):
     """
 
     implements(INavigationContributor, IPermissionRequestor, IRequestHandler,
-               ITimelineEventProvider, IWikiSyntaxProvider, ISearchSource)
+               ITimelineEventProvider, IWikiLinkPrefetcher, IWikiSyntaxProvider,
+               ISearchDocumentProvider, ISearchSource)
 
     property_diff_renderers = ExtensionPoint(IPropertyDiffRenderer)
     
@@ -158,6 +163,23 @@ class ChangesetModule(Component):
         plus their new size) for which the changeset view will attempt to show
         the diffs inlined (''since 0.10'').""")
 
+    diff_cache_size = IntOption('changeset', 'diff_cache_size', 10240,
+        """Size in kilobytes allowed for keeping the file diffs shown by
+        the changeset and diff views in the `cache/diff` directory of the
+        environment, so that they aren't computed again for each request.
+        The diffs depend on the diff options and `diff_algorithm`, so
+        changing these only adds new entries. 0 disables the diff cache
+        (''since 0.13'').""")
+
+    diff_algorithm = ChoiceOption('changeset', 'diff_algorithm',
+                                  ['difflib', 'patience'],
+        """Algorithm used for computing the diffs of files. "difflib" is
+        the `SequenceMatcher` of the Python standard library, which can be
+        very slow on large files. "patience" runs in close to linear time
+        and often aligns the changes better to the structure of the code,
+        but may find a less minimal diff when the files have few unique
+        lines (''since 0.13'').""")
+
     wiki_format_messages = BoolOption('changeset', 'wiki_format_messages',
                                       'true',
         """Whether wiki formatting should be applied to changeset messages.
@@ -544,6 +566,11 @@ class ChangesetModule(Component):
             are detected, but the return value is None for non-comparable
             files.
             """
+            return self._get_cached_diff('html', old_node, new_node, options,
+                                         lambda: _diff_blocks(old_node,
+                                                              new_node))
+
+        def _diff_blocks(old_node, new_node):
             mview = Mimeview(self.env)
             if mview.is_binary(old_node.content_type, old_node.path):
                 return None
@@ -573,7 +600,8 @@ class ChangesetModule(Component):
                                    context, tabwidth,
                                    ignore_blank_lines=ignore_blank_lines,
                                    ignore_case=ignore_case,
-                                   ignore_space_changes=ignore_space)
+                                   ignore_space_changes=ignore_space,
+                                   algorithm=self.diff_algorithm)
             else:
                 return []
 
@@ -683,7 +711,7 @@ class ChangesetModule(Component):
         req.send_header('Content-Disposition',
                         content_disposition('inline', filename + '.diff'))
         buf = StringIO()
-        mimeview = Mimeview(self.env)
+        options = data['diff']['options']
 
         for old_node, new_node, kind, change in repos.get_changes(
                 new_path=data['new_path'], new_rev=data['new_rev'],
@@ -693,66 +721,106 @@ class ChangesetModule(Component):
             # Content changes
             if kind == Node.DIRECTORY:
                 continue
+            if old_node and not old_node.is_viewable(req.perm) or \
+                    new_node and not new_node.is_viewable(req.perm):
+                continue
 
-            new_content = old_content = ''
-            new_node_info = old_node_info = ('','')
+            lines = self._get_cached_diff('unified', old_node, new_node,
+                                          options,
+                                          lambda: self._unified_diff(
+                                              old_node, new_node, options))
+            if not lines:
+                continue # binary or identical files
 
+            new_node_info = old_node_info = ('','')
             if old_node:
-                if not old_node.is_viewable(req.perm):
-                    continue
-                if mimeview.is_binary(old_node.content_type, old_node.path):
-                    continue
-                old_content = old_node.get_content().read()
-                if mimeview.is_binary(content=old_content):
-                    continue
                 old_node_info = (old_node.path, old_node.rev)
-                old_content = mimeview.to_unicode(old_content,
-                                                  old_node.content_type)
             if new_node:
-                if not new_node.is_viewable(req.perm):
-                    continue
-                if mimeview.is_binary(new_node.content_type, new_node.path):
-                    continue
-                new_content = new_node.get_content().read()
-                if mimeview.is_binary(content=new_content):
-                    continue
                 new_node_info = (new_node.path, new_node.rev)
                 new_path = new_node.path
-                new_content = mimeview.to_unicode(new_content,
-                                                  new_node.content_type)
             else:
                 old_node_path = repos.normalize_path(old_node.path)
                 diff_old_path = repos.normalize_path(data['old_path'])
                 new_path = pathjoin(data['new_path'],
                                     old_node_path[len(diff_old_path) + 1:])
+            if not old_node_info[0]:
+                old_node_info = new_node_info # support for 'A'dd changes
+            buf.write('Index: ' + new_path + CRLF)
+            buf.write('=' * 67 + CRLF)
+            buf.write('--- %s\t(revision %s)' % old_node_info + CRLF)
+            buf.write('+++ %s\t(revision %s)' % new_node_info + CRLF)
+            for line in lines:
+                buf.write(line + CRLF)
 
-            if old_content != new_content:
-                options = data['diff']['options']
-                context = options.get('contextlines', 3)
-                if context < 0 or options.get('contextall'):
-                    context = 3 # FIXME: unified_diff bugs with context=None
-                ignore_blank_lines = options.get('ignoreblanklines')
-                ignore_case = options.get('ignorecase')
-                ignore_space = options.get('ignorewhitespace')
-                if not old_node_info[0]:
-                    old_node_info = new_node_info # support for 'A'dd changes
-                buf.write('Index: ' + new_path + CRLF)
-                buf.write('=' * 67 + CRLF)
-                buf.write('--- %s\t(revision %s)' % old_node_info + CRLF)
-                buf.write('+++ %s\t(revision %s)' % new_node_info + CRLF)
-                for line in unified_diff(old_content.splitlines(),
-                                         new_content.splitlines(), context,
-                                         ignore_blank_lines=ignore_blank_lines,
-                                         ignore_case=ignore_case,
-                                         ignore_space_changes=ignore_space):
-                    buf.write(line + CRLF)
-                    
         diff_str = buf.getvalue().encode('utf-8')
         req.send_header('Content-Length', len(diff_str))
         req.end_headers()
         req.write(diff_str)
         raise RequestDone
 
+    def _unified_diff(self, old_node, new_node, options):
+        """Return the lines of the unified diff between the contents of two
+        nodes, or `None` if one of them is binary.
+
+        One of the nodes may be `None`, for added or deleted files.
+        """
+        mimeview = Mimeview(self.env)
+        contents = []
+        for node in (old_node, new_node):
+            content = ''
+            if node:
+                if mimeview.is_binary(node.content_type, node.path):
+                    return None
+                content = node.get_content().read()
+                if mimeview.is_binary(content=content):
+                    return None
+                content = mimeview.to_unicode(content, node.content_type)
+            contents.append(content)
+        old_content, new_content = contents
+        if old_content == new_content:
+            return []
+        context = options.get('contextlines', 3)
+        if context < 0 or options.get('contextall'):
+            context = 3 # FIXME: unified_diff bugs with context=None
+        return list(unified_diff(old_content.splitlines(),
+                                 new_content.splitlines(), context,
+                                 ignore_blank_lines=options.get(
+                                     'ignoreblanklines'),
+                                 ignore_case=options.get('ignorecase'),
+                                 ignore_space_changes=options.get(
+                                     'ignorewhitespace'),
+                                 algorithm=self.diff_algorithm))
+
+    def _get_cached_diff(self, format, old_node, new_node, options,
+                         compute):
+        """Return the diff between two nodes in the given `format`, from
+        the diff cache if possible, otherwise by calling `compute()` and
+        storing its result in the cache.
+
+        As a node revision never changes, the diff is identified by the
+        repository, path and revision of both nodes, and by the options
+        and algorithm affecting its output.
+        """
+        cache = FileCache.for_option(self.env, 'changeset', 'diff_cache_size',
+                                     'diff')
+        if cache is None:
+            return compute()
+        def node_key(node):
+            if node is None:
+                return None
+            return (node.repos.id, node.created_path, node.created_rev,
+                    node.content_type)
+        tabwidth = self.config['diff'].getint('tab_width') or \
+                   self.config['mimeviewer'].getint('tab_width', 8)
+        key = (format, node_key(old_node), node_key(new_node),
+               tuple(sorted(options.items())), tabwidth,
+               Mimeview(self.env).default_charset, self.diff_algorithm)
+        try:
+            return cache[key]
+        except KeyError:
+            diff = cache[key] = compute()
+            return diff
+
     def _render_zip(self, req, filename, repos, data):
         """ZIP archive containing all the added and/or modified files."""
         req.send_response(200)
@@ -760,38 +828,26 @@ class ChangesetModule(Component):
         req.send_header('Content-Disposition',
                         content_disposition('inline', filename + '.zip'))
 
-        from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED as compression
-
-        buf = StringIO()
-        zipfile = ZipFile(buf, 'w', compression)
+        zipstream = ZipStream()
         for old_node, new_node, kind, change in repos.get_changes(
             new_path=data['new_path'], new_rev=data['new_rev'],
             old_path=data['old_path'], old_rev=data['old_rev']):
             if (kind == Node.FILE or kind == Node.DIRECTORY) and \
                     change != Changeset.DELETE \
                     and new_node.is_viewable(req.perm):
-                zipinfo = ZipInfo()
-                # Note: unicode filenames are not supported by zipfile.
-                # UTF-8 is not supported by all Zip tools either,
+                # Note: UTF-8 is not supported by all Zip tools,
                 # but as some do, UTF-8 is the best option here.
-                zipinfo.filename = new_node.path.strip('/').encode('utf-8')
-                zipinfo.date_time = new_node.last_modified.utctimetuple()[:6]
-                zipinfo.compress_type = compression
-                # setting zipinfo.external_attr is needed since Python 2.5
+                filename = new_node.path.strip('/')
+                date_time = new_node.last_modified.utctimetuple()[:6]
                 if new_node.isfile:
-                    zipinfo.external_attr = 0644 << 16L
-                    content = new_node.get_content().read()
+                    zipstream.add(filename, date_time, new_node.get_content)
                 elif new_node.isdir:
-                    zipinfo.filename += '/'
-                    zipinfo.external_attr = 040755 << 16L
-                    content = ''
-                zipfile.writestr(zipinfo, content)
-        zipfile.close()
-
-        zip_str = buf.getvalue()
-        req.send_header("Content-Length", len(zip_str))
+                    zipstream.add(filename + '/', date_time)
+
+        # The content of the files is read while the archive is sent
         req.end_headers()
-        req.write(zip_str)
+        if req.method != 'HEAD':
+            req.write_stream(zipstream)
         raise RequestDone
 
     def title_for_diff(self, data):
@@ -885,7 +941,10 @@ class ChangesetModule(Component):
         else:
             return []
 
-    def get_timeline_events(self, req, start, stop, filters):
+    # `Repository.get_changesets()` generates the changesets newest first
+    timeline_events_ordered = True
+
+    def get_timeline_events(self, req, start, stop, filters, limit=None):
         all_repos = 'changeset' in filters
         repo_filters = set(f for f in filters if f.startswith('repo-'))
         if all_repos or repo_filters:
@@ -905,7 +964,8 @@ class ChangesetModule(Component):
                 
             uids_seen = {}
             def generate_changesets(repos):
-                for _, changesets in groupby(repos.get_changesets(start, stop),
+                changesets = repos.get_changesets(start, stop, limit)
+                for _, changesets in groupby(changesets,
                                              key=collapse_changesets):
                     viewable_changesets = []
                     for cset in changesets:
@@ -928,17 +988,23 @@ class ChangesetModule(Component):
                                (viewable_changesets, 
                                 show_location, show_files))
 
+            def generate_events(repos):
+                try:
+                    for event in generate_changesets(repos):
+                        yield event
+                except TracError, e:
+                    self.log.error("Timeline event provider for repository"
+                                   " '%s' failed: %r", 
+                                   repos.reponame, exception_to_unicode(e))
+
             rm = RepositoryManager(self.env)
-            for repos in sorted(rm.get_real_repositories(),
-                                key=lambda repos: repos.reponame):
-                if all_repos or ('repo-' + repos.reponame) in repo_filters:
-                    try:
-                        for event in generate_changesets(repos):
-                            yield event
-                    except TracError, e:
-                        self.log.error("Timeline event provider for repository"
-                                       " '%s' failed: %r", 
-                                       repos.reponame, exception_to_unicode(e))
+            for event in merge_events(
+                    [generate_events(repos)
+                     for repos in sorted(rm.get_real_repositories(),
+                                         key=lambda repos: repos.reponame)
+                     if all_repos or
+                        ('repo-' + repos.reponame) in repo_filters]):
+                yield event
 
     def render_timeline_event(self, context, field, event):
         changesets, show_location, show_files = event[3]
@@ -1038,6 +1104,36 @@ class ChangesetModule(Component):
             return _("%(title)s: %(message)s",
                      title=title, message=shorten_line(message))
 
+    # IWikiLinkPrefetcher methods
+
+    _changeset_shorthand_re = re.compile(r"r\d+(?:/|$)")
+
+    def prefetch_links(self, formatter, matches):
+        targets = formatter.get_link_targets(matches, ('changeset',))
+        for m in matches:
+            token = m.group(0)
+            if m.group('it_changeset') == '':
+                targets.append(token[1:-1])
+            elif self._changeset_shorthand_re.match(token):
+                targets.append(token[1:])
+        revs = {}
+        for target in targets:
+            try:
+                rev, path, reponame, repos = self._resolve_changeset_link(
+                    formatter, formatter.split_link(target)[0])
+            except TracError:
+                continue
+            if repos:
+                revs.setdefault(repos.reponame, (repos, set()))[1].add(rev)
+        changesets = formatter.prefetched.setdefault('changeset', {})
+        for reponame, (repos, repos_revs) in revs.iteritems():
+            try:
+                for rev, changeset in repos.get_changesets_by_revs(
+                        repos_revs).iteritems():
+                    changesets[(reponame, rev)] = changeset
+            except TracError:
+                continue
+
     # IWikiSyntaxProvider methods
 
     CHANGESET_ID = r"(?:\d+|[a-fA-F\d]{8,})" # only "long enough" hexa ids
@@ -1067,26 +1163,17 @@ class ChangesetModule(Component):
         if intertrac:
             return intertrac
 
-        # identifying repository
-        rm = RepositoryManager(self.env)
         chgset, params, fragment = formatter.split_link(chgset)
-        sep = chgset.find('/')
-        if sep > 0:
-            rev, path = chgset[:sep], chgset[sep:]
-        else:
-            rev, path = chgset, '/'
         try:
-            reponame, repos, path = rm.get_repository_by_path(path)
-            if not reponame:
-                reponame = rm.get_default_repository(formatter.context)
-                if reponame is not None:
-                    repos = rm.get_repository(reponame)
-            if path == '/':
-                path = None
+            rev, path, reponame, repos = self._resolve_changeset_link(
+                formatter, chgset)
 
             # rendering changeset link
             if repos:
-                changeset = repos.get_changeset(rev)
+                changeset = formatter.prefetched.get('changeset', {}) \
+                                     .get((repos.reponame, rev))
+                if changeset is None:
+                    changeset = repos.get_changeset(rev)
                 if changeset.is_viewable(formatter.perm):
                     href = formatter.href.changeset(rev,
                                                     repos.reponame or None,
@@ -1105,6 +1192,24 @@ class ChangesetModule(Component):
             errmsg = to_unicode(e)
         return tag.a(label, class_="missing changeset", title=errmsg)
 
+    def _resolve_changeset_link(self, formatter, chgset):
+        """Return the `(rev, path, reponame, repos)` designated by the
+        target of a changeset link, without query and fragment."""
+        rm = RepositoryManager(self.env)
+        sep = chgset.find('/')
+        if sep > 0:
+            rev, path = chgset[:sep], chgset[sep:]
+        else:
+            rev, path = chgset, '/'
+        reponame, repos, path = rm.get_repository_by_path(path)
+        if not reponame:
+            reponame = rm.get_default_repository(formatter.context)
+            if reponame is not None:
+                repos = rm.get_repository(reponame)
+        if path == '/':
+            path = None
+        return rev, path, reponame, repos
+
     def _format_diff_link(self, formatter, ns, target, label):
         params, query, fragment = formatter.split_link(target)
         def pathrev(path):
@@ -1149,12 +1254,18 @@ class ChangesetModule(Component):
         rm = RepositoryManager(self.env)
         repositories = dict((repos.params['id'], repos)
                             for repos in rm.get_real_repositories())
+        ids = SearchIndex(self.env).find_documents('changeset', terms)
         with self.env.db_query as db:
-            sql, args = search_to_sql(db, ['rev', 'message', 'author'], terms)
-            for id, rev, ts, author, log in db("""
-                    SELECT repos, rev, time, author, message 
-                    FROM revision WHERE """ + sql,
-                    args):
+            query = """SELECT repos, rev, time, author, message 
+                       FROM revision"""
+            if ids is not None:
+                rows = self._search_by_ids(db, query, ids)
+            else:
+                sql, args = search_to_sql(db, ['rev', 'message', 'author'],
+                                          terms)
+                rows = db(query + " WHERE " + sql, args)
+            changesets = []
+            for id, rev, ts, author, log in rows:
                 try:
                     rev = int(rev)
                 except ValueError:
@@ -1162,13 +1273,49 @@ class ChangesetModule(Component):
                 repos = repositories.get(id)
                 if not repos:
                     continue # revisions for a no longer active repository
-                cset = repos.resource.child('changeset', rev)
-                if 'CHANGESET_VIEW' in req.perm(cset):
+                changesets.append((repos.resource.child('changeset', rev),
+                                   repos, rev, ts, author, log))
+            allowed = set(req.perm.filter('CHANGESET_VIEW',
+                                          [c[0] for c in changesets]))
+            for cset, repos, rev, ts, author, log in changesets:
+                if cset in allowed:
                     yield (req.href.changeset(rev, repos.reponame or None),
                            '[%s]: %s' % (rev, shorten_line(log)),
                            from_utimestamp(ts), author,
                            shorten_result(log, terms))
 
+    # ISearchDocumentProvider methods
+
+    def get_search_document_realms(self):
+        yield 'changeset'
+
+    def get_search_documents(self, realm, ids=None):
+        with self.env.db_query as db:
+            query = "SELECT repos, rev, author, message FROM revision"
+            if ids is None:
+                rows = db(query)
+            else:
+                rows = self._search_by_ids(db, query, ids)
+            for repos, rev, author, message in rows:
+                try:
+                    label = unicode(int(rev))
+                except ValueError:
+                    label = rev
+                yield (u'%s:%s' % (repos, rev),
+                       '\n'.join([label, author or '', message or '']))
+
+    def _search_by_ids(self, db, query, ids):
+        """Generate the rows of the `revision` table returned by `query`
+        for the `repos:rev` document identifiers `ids`."""
+        revs = {}
+        for id in ids:
+            repos, rev = id.split(':', 1)
+            revs.setdefault(int(repos), []).append(rev)
+        for repos, revs in sorted(revs.iteritems()):
+            for row in search_by_ids(db, query + " WHERE repos=%s", 'rev',
+                                     revs, (repos,)):
+                yield row
+
 
 class AnyDiffModule(Component):
 
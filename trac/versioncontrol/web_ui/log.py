@@ -53,6 +53,11 @@ class LogModule(Component):
         doc="""Comma-separated list of colors to use for the TracRevisionLog
         graph display. (''since 0.13'')""")
 
+    _graph_cache_size = 50
+
+    def __init__(self):
+        self._graph_cache = {}
+
     # INavigationContributor methods
 
     def get_active_navigation_item(self, req):
@@ -115,7 +120,8 @@ class LogModule(Component):
 
         # The `history()` method depends on the mode:
         #  * for ''stop on copy'' and ''follow copies'', it's `Node.history()`
-        #    unless explicit ranges have been specified
+        #    (read from the cache tables for cached repositories) unless
+        #    explicit ranges have been specified
         #  * for ''show only add, delete'' we're using
         #   `Repository.get_path_history()` 
         cset_resource = repos.resource.child('changeset')
@@ -160,7 +166,7 @@ class LogModule(Component):
                          and not repos.has_linear_changesets
             def history():
                 node = get_existing_node(req, repos, path, rev)
-                for h in node.get_history():
+                for h in repos.get_node_history(node.path, rev):
                     if 'CHANGESET_VIEW' in req.perm(cset_resource(id=h[1])):
                         yield h
 
@@ -212,7 +218,7 @@ class LogModule(Component):
         graph = {}
         if show_graph:
             threads, vertices, columns = \
-                make_log_graph(repos, (item['rev'] for item in info))
+                self._get_log_graph(repos, [item['rev'] for item in info])
             graph.update(threads=threads, vertices=vertices, columns=columns,
                          colors=self.graph_colors,
                          line_width=0.04, dot_radius=0.1)
@@ -332,6 +338,18 @@ class LogModule(Component):
 
         return 'revisionlog.html', data, None
 
+    def _get_log_graph(self, repos, revs):
+        """Return the graph information of `make_log_graph` for `revs`,
+        memoized until the repository gets new revisions."""
+        key = (repos.reponame, repos.youngest_rev, tuple(revs))
+        graph = self._graph_cache.get(key)
+        if graph is None:
+            graph = make_log_graph(repos, revs)
+            if len(self._graph_cache) >= self._graph_cache_size:
+                self._graph_cache.clear()
+            self._graph_cache[key] = graph
+        return graph
+
     # IWikiSyntaxProvider methods
 
     REV_RANGE = r"(?:%s|%s)" % (Ranges.RE_STR, ChangesetModule.CHANGESET_ID)
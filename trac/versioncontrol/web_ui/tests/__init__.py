@@ -1,9 +1,10 @@
 import unittest
 
-from trac.versioncontrol.web_ui.tests import wikisyntax
+from trac.versioncontrol.web_ui.tests import browser, wikisyntax
 
 def suite():
     suite = unittest.TestSuite()
+    suite.addTest(browser.suite())
     suite.addTest(wikisyntax.suite())
     return suite
 
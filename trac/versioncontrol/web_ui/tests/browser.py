@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011 Edgewall Software
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution. The terms
+# are also available at http://trac.edgewall.org/wiki/TracLicense.
+#
+# This software consists of voluntary contributions made by many
+# individuals. For the exact contribution history, see the revision
+# history and logs, available at http://trac.edgewall.org/log/.
+
+from StringIO import StringIO
+import shutil
+import tempfile
+import unittest
+
+from trac.test import EnvironmentStub, Mock
+from trac.versioncontrol.web_ui.browser import BrowserModule
+
+
+class BlameCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub()
+        self.env.path = tempfile.mkdtemp(prefix='trac-tempenv-')
+        self.blamed = []
+        self.nodes = {}
+        self.repos = Mock(id=1, get_node=lambda path, rev: self.nodes[rev])
+
+    def tearDown(self):
+        shutil.rmtree(self.env.path)
+
+    def _node(self, rev, content, annotations, previous=None):
+        def get_annotations():
+            self.blamed.append(rev)
+            return annotations
+        node = Mock(repos=self.repos, created_path='file.txt',
+                    created_rev=rev, get_annotations=get_annotations,
+                    get_content=lambda: StringIO(content),
+                    get_previous=lambda: previous and ('file.txt', previous,
+                                                       'edit'))
+        self.nodes[rev] = node
+        return node
+
+    def test_cached_annotations(self):
+        node = self._node(1, 'a\nb\n', [1, 1])
+        browser = BrowserModule(self.env)
+        self.assertEqual([1, 1], browser.get_annotations(node))
+        self.assertEqual([1, 1], browser.get_annotations(node))
+        self.assertEqual([1], self.blamed)
+
+    def test_incremental_annotations(self):
+        browser = BrowserModule(self.env)
+        browser.get_annotations(self._node(1, 'a\nb\nc\n', [1, 1, 1]))
+        node = self._node(3, 'a\nx\ny\nc\nd\n', None, previous=1)
+        self.assertEqual([1, 3, 3, 1, 3], browser.get_annotations(node))
+        node = self._node(5, 'x\ny\nc\nd\n', None, previous=3)
+        self.assertEqual([3, 3, 1, 3], browser.get_annotations(node))
+        self.assertEqual([1], self.blamed)
+
+    def test_previous_not_cached(self):
+        self._node(1, 'a\n', [1])
+        node = self._node(2, 'a\nb\n', [1, 2], previous=1)
+        self.assertEqual([1, 2], BrowserModule(self.env).get_annotations(node))
+        self.assertEqual([2], self.blamed)
+
+    def test_cache_disabled(self):
+        self.env.config.set('browser', 'blame_cache_size', 0)
+        node = self._node(1, 'a\n', [1])
+        browser = BrowserModule(self.env)
+        browser.get_annotations(node)
+        browser.get_annotations(node)
+        self.assertEqual([1, 1], self.blamed)
+
+
+def suite():
+    return unittest.makeSuite(BlameCacheTestCase, 'test')
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
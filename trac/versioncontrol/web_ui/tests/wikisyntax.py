@@ -15,6 +15,9 @@ def _get_changeset(rev):
     else:
         raise NoSuchChangeset(rev)
 
+def _get_changesets_by_revs(revs):
+    return dict((rev, _get_changeset(rev)) for rev in revs if rev == '1')
+
 def _normalize_rev(rev):
     try:
         return int(rev)
@@ -37,6 +40,7 @@ def _get_node(path, rev=None):
 def _get_repository(reponame):
     return Mock(reponame=reponame, youngest_rev='200',
                 get_changeset=_get_changeset,
+                get_changesets_by_revs=_get_changesets_by_revs,
                 normalize_rev=_normalize_rev,
                 get_node=_get_node)
 
@@ -590,6 +590,29 @@ class Request(object):
             self.end_headers()
         if not hasattr(self, '_content_length'):
             raise RuntimeError("No Content-Length header set")
+        self._write_data(data)
+
+    def write_stream(self, chunks):
+        """Write the `str` strings generated by `chunks` to the response
+        body, as they are generated.
+
+        Unlike `write`, no ''Content-Length'' header is needed, which
+        allows sending content of unknown length without building it in
+        memory first. The end of the response is signaled by the server,
+        either by closing the connection or with a chunked transfer
+        encoding.
+        """
+        if hasattr(self, '_content_length'):
+            raise RuntimeError("Content-Length header set for a stream")
+        if not self._write:
+            self.end_headers()
+        for data in chunks:
+            if data:
+                self._write_data(data)
+
+    # Internal methods
+
+    def _write_data(self, data):
         if isinstance(data, unicode):
             raise ValueError("Can't send unicode content")
         try:
@@ -599,8 +622,6 @@ class Request(object):
                 raise RequestDone
             raise
 
-    # Internal methods
-
     def _parse_arg_list(self):
         """Parse the supplied request parameters into a list of
         `(name, value)` tuples.
@@ -108,6 +108,21 @@ class RequestTestCase(unittest.TestCase):
         # anyway we're not supposed to send unicode, so we get a ValueError
         self.assertRaises(ValueError, req.write, u'Föö')
 
+    def test_write_stream(self):
+        buf = StringIO()
+        def start_response(status, headers):
+            self.assertEqual([('Content-Type', 'application/zip')], headers)
+            return buf.write
+        req = Request(self._make_environ(), start_response)
+        req.send_header('Content-Type', 'application/zip')
+        req.write_stream(iter(['PK', '', 'data']))
+        self.assertEqual('PKdata', buf.getvalue())
+
+        req = Request(self._make_environ(), start_response)
+        req.send_header('Content-Length', 4)
+        # the length of a stream is unknown
+        self.assertRaises(RuntimeError, req.write_stream, ['data'])
+
     def test_invalid_cookies(self):
         environ = self._make_environ(HTTP_COOKIE='bad:key=value;')
         req = Request(environ, None)
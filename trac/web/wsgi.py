@@ -216,6 +216,10 @@ class WSGIServerGateway(WSGIGateway):
                 self.handler.send_response(int(status[:3]))
                 for name, value in headers:
                     self.handler.send_header(name, value)
+                if not any(name.lower() == 'content-length'
+                           for name, value in headers):
+                    # the end of the response is the end of the connection
+                    self.handler.close_connection = 1
                 self.handler.end_headers()
             self.handler.wfile.write(data)
         except (IOError, socket.error), e:
@@ -20,8 +20,10 @@ import sys
 
 from trac.admin import *
 from trac.core import *
+from trac.search.api import SearchIndex
 from trac.wiki import model
 from trac.wiki.api import WikiSystem, validate_page_name
+from trac.wiki.links import LinkIndex
 from trac.util import read_file
 from trac.util.datefmt import format_datetime, from_utimestamp, \
                               to_utimestamp, utc
@@ -152,6 +154,9 @@ class WikiAdmin(Component):
                             title))
             if not old:
                 del WikiSystem(self.env).pages
+        SearchIndex(self.env).update_documents('wiki', [title])
+        if self.env.is_component_enabled(LinkIndex):
+            LinkIndex(self.env).update_wiki_page(title)
         return True
 
     def load_pages(self, dir, ignore=[], create_only=[], replace=False):
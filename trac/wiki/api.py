@@ -16,6 +16,7 @@
 # Author: Jonas Borgström <jonas@edgewall.com>
 #         Christopher Lenz <cmlenz@gmx.de>
 
+from bisect import bisect_left
 import re
 
 from genshi.builder import tag
@@ -196,6 +197,21 @@ class IWikiSyntaxProvider(Interface):
         """
 
 
+class IWikiLinkPrefetcher(Interface):
+    """Retrieve at once the resources referenced by the links of a wiki
+    text, before the links are formatted one by one.
+    (''since 0.13'')"""
+
+    def prefetch_links(formatter, matches):
+        """Retrieve the resources referenced by the wiki syntax `matches`.
+
+        `matches` is the list of the regexp match objects for the wiki
+        syntax found in the text about to be formatted. The data should
+        be stored in the `formatter.prefetched` dictionary, under the
+        realm of the resources, for use by the link resolvers.
+        """
+
+
 def parse_args(args, strict=True):
     """Utility for parsing macro "content" and splitting them into arguments.
 
@@ -251,6 +267,7 @@ class WikiSystem(Component):
     implements(IWikiSyntaxProvider, IResourceManager)
 
     change_listeners = ExtensionPoint(IWikiChangeListener)
+    link_prefetchers = ExtensionPoint(IWikiLinkPrefetcher)
     macro_providers = ExtensionPoint(IWikiMacroProvider)
     syntax_providers = ExtensionPoint(IWikiSyntaxProvider)
 
@@ -277,6 +294,8 @@ class WikiSystem(Component):
         external links even if `[wiki] render_unsafe_content` is `false`.
         (''since 0.11.8'')""")
 
+    _sorted_pages = None
+
     @cached
     def pages(self):
         """Return the names of all existing wiki pages."""
@@ -286,19 +305,34 @@ class WikiSystem(Component):
     # Public API
 
     def get_pages(self, prefix=None):
-        """Iterate over the names of existing Wiki pages.
+        """Iterate over the names of existing Wiki pages, in sorted order.
 
         :param prefix: if given, only names that start with that
           prefix are included.
         """
-        for page in self.pages:
-            if not prefix or page.startswith(prefix):
-                yield page
+        names = self._get_sorted_pages()
+        if not prefix:
+            for name in names:
+                yield name
+            return
+        for i in xrange(bisect_left(names, prefix), len(names)):
+            if not names[i].startswith(prefix):
+                break
+            yield names[i]
 
     def has_page(self, pagename):
         """Whether a page with the specified name exists."""
         return pagename.rstrip('/') in self.pages
 
+    def _get_sorted_pages(self):
+        """Return the sorted list of the names in `pages`, which is built
+        again whenever `pages` is reloaded."""
+        pages = self.pages
+        sorted_pages = self._sorted_pages
+        if sorted_pages is None or sorted_pages[0] is not pages:
+            sorted_pages = self._sorted_pages = (pages, sorted(pages))
+        return sorted_pages[1]
+
     # IWikiSyntaxProvider methods
 
     XML_NAME = r"[\w:](?<!\d)(?:[\w:.-]*[\w-])?"
@@ -389,6 +389,7 @@ class Formatter(object):
         self.perm = context.perm
         self.wiki = WikiSystem(self.env)
         self.wikiparser = WikiParser(self.env)
+        self.prefetched = {}
         self._anchors = {}
         self._open_tags = []
         self._safe_schemes = None
@@ -399,6 +400,42 @@ class Formatter(object):
     def split_link(self, target):
         return split_url_into_path_query_fragment(target)
 
+    def prefetch_links(self, lines):
+        """Let the `IWikiLinkPrefetcher`s retrieve at once the resources
+        referenced in `lines`, skipping the content of code blocks."""
+        prefetchers = self.wiki.link_prefetchers
+        if not prefetchers:
+            return
+        matches = []
+        in_code_block = 0
+        for line in lines:
+            if WikiParser.ENDBLOCK not in line and \
+                    WikiParser._startblock_re.match(line):
+                in_code_block += 1
+            elif line.strip() == WikiParser.ENDBLOCK:
+                if in_code_block:
+                    in_code_block -= 1
+            elif not in_code_block:
+                matches.extend(self.wikiparser.tokenize(
+                    line.replace('\t', ' ' * 8)))
+        if matches:
+            for prefetcher in prefetchers:
+                prefetcher.prefetch_links(self, matches)
+
+    def get_link_targets(self, matches, namespaces):
+        """Return the targets of the TracLinks in `matches` using one of
+        the given `namespaces`."""
+        targets = []
+        for fullmatch in matches:
+            if fullmatch.group(0)[0] == '!':
+                continue
+            if fullmatch.group('sns') in namespaces:
+                targets.append(unquote_label(fullmatch.group('stgt')))
+            elif fullmatch.group('lns') in namespaces and \
+                    fullmatch.group('ltgt'):
+                targets.append(unquote_label(fullmatch.group('ltgt')))
+        return targets
+
     # -- Pre- IWikiSyntaxProvider rules (Font styles)
 
     _indirect_tags = {
@@ -1171,6 +1208,21 @@ class Formatter(object):
         if replacement:
             return _markup_to_unicode(replacement)
 
+    def substitute(self, text):
+        """Replace all the matches in `text` with their expansion.
+
+        This is equivalent to `re.sub(self.wikiparser.rules, self.replace,
+        text)`, but uses the cached tokenization of `text`.
+        """
+        result = []
+        pos = 0
+        for match in self.wikiparser.tokenize(text):
+            result.append(text[pos:match.start()])
+            result.append(self.replace(match) or '')
+            pos = match.end()
+        result.append(text[pos:])
+        return ''.join(result)
+
     _normalize_re = re.compile(r'[\v\f]', re.UNICODE)
 
     def reset(self, source, out=None):
@@ -1202,7 +1254,8 @@ class Formatter(object):
         text = self.reset(text, out)
         if isinstance(text, basestring):
             text = text.splitlines()
-            
+        self.prefetch_links(text)
+
         for line in text:
             # Detect start of code block (new block or embedded block)
             block_start_match = None
@@ -1249,7 +1302,7 @@ class Formatter(object):
             self.in_quote = False
             # Throw a bunch of regexps on the problem
             self.line = line
-            result = re.sub(self.wikiparser.rules, self.replace, line)
+            result = self.substitute(line)
 
             if not self.in_list_item:
                 self.close_list()
@@ -1351,7 +1404,8 @@ class OneLinerFormatter(Formatter):
         if shorten:
             result = shorten_line(result)
 
-        result = re.sub(self.wikiparser.rules, self.replace, result)
+        self.prefetch_links([result])
+        result = self.substitute(result)
         result = result.replace('[...]', u'[\u2026]')
         if result.endswith('...'):
             result = result[:-3] + u'\u2026'
@@ -1435,9 +1489,9 @@ class LinkFormatter(OutlineFormatter):
         """Return the Wiki match found at the beginning of the `wikitext`"""
         wikitext = self.reset(wikitext)
         self.line = wikitext
-        match = re.match(self.wikiparser.rules, wikitext)
-        if match:
-            return self.handle_match(match)
+        tokens = self.wikiparser.tokenize(wikitext)
+        if tokens and tokens[0].start() == 0:
+            return self.handle_match(tokens[0])
 
 
 # Pure Wiki Formatter
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011 Edgewall Software
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution. The terms
+# are also available at http://trac.edgewall.org/wiki/TracLicense.
+#
+# This software consists of voluntary contributions made by many
+# individuals. For the exact contribution history, see the revision
+# history and logs, available at http://trac.edgewall.org/log/.
+
+from __future__ import with_statement
+
+from StringIO import StringIO
+
+from trac.admin import IAdminCommandProvider
+from trac.core import *
+from trac.env import IEnvironmentSetupParticipant
+from trac.mimeview.api import RenderingContext
+from trac.resource import Resource
+from trac.ticket.api import ITicketChangeListener
+from trac.util.text import exception_to_unicode, printout
+from trac.util.translation import _
+from trac.web.href import Href
+from trac.wiki.api import IWikiChangeListener
+from trac.wiki.formatter import LinkFormatter
+
+
+class _AllowAll(object):
+    """Permission cache granting everything, so that the extracted links
+    don't depend on the permissions of any user."""
+
+    username = 'trac'
+
+    def has_permission(self, action, realm_or_resource=None, id=False,
+                       version=False):
+        return True
+    __contains__ = has_permission
+
+    def __call__(self, realm_or_resource, id=False, version=False):
+        return self
+
+    def require(self, action, realm_or_resource=None, id=False,
+                version=False):
+        pass
+
+
+class _RecordingHref(Href):
+    """`Href` remembering the resources of the indexed realms for which
+    an URL was built."""
+
+    def __init__(self, realms):
+        Href.__init__(self, '/')
+        self.realms = realms
+        self.targets = set()
+
+    def __call__(self, *args, **kw):
+        if len(args) >= 2 and args[0] in self.realms and args[1]:
+            self.targets.add((args[0], unicode(args[1])))
+        return Href.__call__(self, *args, **kw)
+
+
+class LinkIndex(Component):
+    """Index of the TracLinks found in the wiki pages and tickets.
+
+    The links of the latest version of each wiki page, and of the
+    description and comments of each ticket, are extracted when they are
+    saved and stored in the `resource_link` table. The index only keeps
+    the links to wiki pages, tickets and milestones.
+
+    The links are extracted with the `LinkFormatter`, which resolves
+    them the same way as when the text is rendered, without expanding
+    macros and processors. Links to tickets which don't exist are not
+    recorded, while links to missing wiki pages are.
+    """
+
+    implements(IAdminCommandProvider, IEnvironmentSetupParticipant,
+               ITicketChangeListener, IWikiChangeListener)
+
+    target_realms = ('milestone', 'ticket', 'wiki')
+
+    # Public API
+
+    def get_backlinks(self, realm, id):
+        """Return the `(realm, id)` of the wiki pages and tickets linking
+        to the given resource, sorted."""
+        return sorted(self.env.db_query("""
+            SELECT source_realm, source_id FROM resource_link
+            WHERE target_realm=%s AND target_id=%s
+            """, (realm, unicode(id))))
+
+    def get_links(self, realm, id):
+        """Return the `(realm, id)` of the resources the given wiki page
+        or ticket links to, sorted."""
+        return sorted(self.env.db_query("""
+            SELECT target_realm, target_id FROM resource_link
+            WHERE source_realm=%s AND source_id=%s
+            """, (realm, unicode(id))))
+
+    def get_wiki_referrers(self, name):
+        """Return the names of the wiki pages whose links could resolve
+        to the page `name` if it was created or deleted.
+
+        Besides the pages linking to `name`, this includes the pages
+        linking to a page with the same last path component, as the
+        scoped page names resolve to any existing page in the hierarchy
+        of the referrer, and the pages linking to sub-pages of `name`.
+        """
+        basename = name.rsplit('/', 1)[-1]
+        with self.env.db_query as db:
+            return sorted(set(source_id for source_id, in db("""
+                SELECT source_id FROM resource_link
+                WHERE source_realm='wiki' AND target_realm='wiki'
+                  AND (target_id=%%s OR target_id=%%s OR target_id %s
+                       OR target_id %s)
+                """ % (db.like(), db.like()),
+                (name, basename, '%' + db.like_escape('/' + basename),
+                 db.like_escape(name + '/') + '%'))))
+
+    def extract_links(self, resource, text):
+        """Return the set of `(realm, id)` targets of the links found in
+        the wiki `text` of `resource`."""
+        href = _RecordingHref(self.target_realms)
+        context = RenderingContext(resource, href=href, perm=_AllowAll())
+        context.req = None
+        try:
+            LinkFormatter(self.env, context).format(text, StringIO())
+        except Exception, e:
+            self.log.warning("Failed to extract the links of %r: %s",
+                             resource, exception_to_unicode(e))
+        href.targets.discard((resource.realm, unicode(resource.id)))
+        return href.targets
+
+    def update_links(self, realm, id, version, text):
+        """Replace the links of the given wiki page or ticket by the ones
+        found in `text`."""
+        id = unicode(id)
+        targets = self.extract_links(Resource(realm, id), text)
+        with self.env.db_transaction as db:
+            db("""DELETE FROM resource_link
+                  WHERE source_realm=%s AND source_id=%s""", (realm, id))
+            db.executemany("""
+                INSERT INTO resource_link (source_realm, source_id,
+                                           source_version, target_realm,
+                                           target_id)
+                VALUES (%s,%s,%s,%s,%s)
+                """, [(realm, id, version, target_realm, target_id)
+                      for target_realm, target_id in sorted(targets)])
+
+    def add_links(self, realm, id, version, text):
+        """Add the links found in `text` to the links of the given wiki
+        page or ticket."""
+        id = unicode(id)
+        targets = self.extract_links(Resource(realm, id), text)
+        with self.env.db_transaction as db:
+            targets -= set(db("""
+                SELECT target_realm, target_id FROM resource_link
+                WHERE source_realm=%s AND source_id=%s
+                """, (realm, id)))
+            db.executemany("""
+                INSERT INTO resource_link (source_realm, source_id,
+                                           source_version, target_realm,
+                                           target_id)
+                VALUES (%s,%s,%s,%s,%s)
+                """, [(realm, id, version, target_realm, target_id)
+                      for target_realm, target_id in sorted(targets)])
+
+    def remove_links(self, realm, id):
+        """Remove the links of the given wiki page or ticket."""
+        self.env.db_transaction("""
+            DELETE FROM resource_link WHERE source_realm=%s AND source_id=%s
+            """, (realm, unicode(id)))
+
+    def update_wiki_page(self, name):
+        """Index the links of the latest version of the wiki page `name`.
+        """
+        for version, text in self.env.db_query("""
+                SELECT version, text FROM wiki WHERE name=%s
+                ORDER BY version DESC LIMIT 1
+                """, (name,)):
+            self.update_links('wiki', name, version, text)
+            break
+        else:
+            self.remove_links('wiki', name)
+
+    def update_ticket(self, id):
+        """Index the links of the description and comments of the ticket
+        `id`.
+
+        This parses the description and all the comments of the ticket,
+        so it is only done when links may have been removed. A new
+        comment only adds its own links, with `add_links()`.
+        """
+        with self.env.db_query as db:
+            texts = [description for description, in db("""
+                SELECT description FROM ticket WHERE id=%s""", (id,))]
+            if not texts:
+                self.remove_links('ticket', id)
+                return
+            texts.extend(comment for comment, in db("""
+                SELECT newvalue FROM ticket_change
+                WHERE ticket=%s AND field='comment'
+                ORDER BY time
+                """, (id,)))
+        self.update_links('ticket', id, None,
+                          '\n\n'.join(text or '' for text in texts))
+
+    def rebuild(self):
+        """Rebuild the index for all the wiki pages and tickets."""
+        with self.env.db_transaction as db:
+            db("DELETE FROM resource_link")
+            for name, in db("SELECT DISTINCT name FROM wiki"):
+                self.update_wiki_page(name)
+            for id, in db("SELECT id FROM ticket"):
+                self.update_ticket(id)
+
+    # IAdminCommandProvider methods
+
+    def get_admin_commands(self):
+        yield ('wiki links-rebuild', '',
+               """Rebuild the index of the links between wiki pages and
+               tickets""",
+               None, self._do_rebuild)
+
+    def _do_rebuild(self):
+        self.rebuild()
+        printout(_("Link index rebuilt."))
+
+    # IEnvironmentSetupParticipant methods
+
+    def environment_created(self):
+        self.rebuild()
+
+    def environment_needs_upgrade(self, db):
+        return False
+
+    def upgrade_environment(self, db):
+        pass
+
+    # ITicketChangeListener methods
+
+    def ticket_created(self, ticket):
+        self.update_ticket(ticket.id)
+
+    def ticket_changed(self, ticket, comment, author, old_values):
+        if 'description' in old_values:
+            self.update_ticket(ticket.id)
+        elif comment:
+            self.add_links('ticket', ticket.id, None, comment)
+
+    def ticket_deleted(self, ticket):
+        self.remove_links('ticket', ticket.id)
+
+    def ticket_comment_modified(self, ticket, cdate, author, comment,
+                                old_comment):
+        self.update_ticket(ticket.id)
+
+    def ticket_change_deleted(self, ticket, cdate, changes):
+        if 'comment' in changes or 'description' in changes:
+            self.update_ticket(ticket.id)
+
+    # IWikiChangeListener methods
+
+    def wiki_page_added(self, page):
+        self.update_links('wiki', page.name, page.version, page.text)
+
+    def wiki_page_changed(self, page, version, t, comment, author, ipnr):
+        self.wiki_page_added(page)
+
+    def wiki_page_deleted(self, page):
+        self.remove_links('wiki', page.name)
+
+    def wiki_page_version_deleted(self, page):
+        self.update_wiki_page(page.name)
+
+    def wiki_page_renamed(self, page, old_name):
+        self.remove_links('wiki', old_name)
+        self.update_wiki_page(page.name)
@@ -135,11 +135,11 @@ class TitleIndexMacro(WikiMacroBase):
 
         wiki = formatter.wiki
 
-        pages = sorted(page for page in wiki.get_pages(prefix)
-                       if (depth < 0 or depth >= page.count('/') - start)
-                       and 'WIKI_VIEW' in formatter.perm('wiki', page)
-                       and any(fnmatchcase(page, inc) for inc in includes)
-                       and not any(fnmatchcase(page, exc) for exc in excludes))
+        pages = [page for page in wiki.get_pages(prefix)
+                 if (depth < 0 or depth >= page.count('/') - start)
+                 and 'WIKI_VIEW' in formatter.perm('wiki', page)
+                 and any(fnmatchcase(page, inc) for inc in includes)
+                 and not any(fnmatchcase(page, exc) for exc in excludes)]
 
         if format == 'compact':
             return tag(
@@ -20,6 +20,7 @@
 
 import re
 
+from trac.config import IntOption
 from trac.core import *
 from trac.notification import EMAIL_LOOKALIKE_PATTERN
 
@@ -164,11 +165,19 @@ class WikiParser(Component):
 
     _set_anchor_wc_re = re.compile(_set_anchor(XML_NAME, r'\|\s*') + r'$')
 
+    token_cache_size = IntOption('wiki', 'token_cache_size', 10000,
+        """Maximum number of lines of wiki text whose tokenization is
+        kept in memory, so that formatting the same text again doesn't
+        need to match the wiki syntax rules against it. Set to 0 to
+        disable the cache. (''since 0.13'')""")
+
     def __init__(self):
         self._compiled_rules = None
         self._link_resolvers = None
         self._helper_patterns = None
         self._external_handlers = None
+        self._tokens = {}
+        self._old_tokens = {}
 
     @property
     def rules(self):
@@ -217,6 +226,28 @@ class WikiParser(Component):
             self._link_resolvers = resolvers
         return self._link_resolvers
 
+    def tokenize(self, line):
+        """Return the list of the matches of the wiki syntax `rules` in
+        `line`, in order.
+
+        The result is cached for the most recently tokenized lines. The
+        cache keeps two generations, the older one being dropped when
+        the current one is full, and the lines found in the older one
+        are moved to the current one.
+        """
+        tokens = self._tokens.get(line)
+        if tokens is None:
+            tokens = self._old_tokens.get(line)
+            if tokens is None:
+                tokens = tuple(self.rules.finditer(line))
+            size = self.token_cache_size
+            if size > 0:
+                if len(self._tokens) >= (size + 1) // 2:
+                    self._old_tokens = self._tokens
+                    self._tokens = {}
+                self._tokens[line] = tokens
+        return tokens
+
     def parse(self, wikitext):
         """Parse `wikitext` and produce a WikiDOM tree."""
         # obviously still some work to do here ;)
@@ -4,15 +4,19 @@ import unittest
 import trac.wiki.api
 import trac.wiki.formatter
 import trac.wiki.parser
-from trac.wiki.tests import formatter, macros, model, wikisyntax
+from trac.wiki.tests import formatter, links, macros, model, parser, \
+                            web_ui, wikisyntax
 from trac.wiki.tests.functional import functionalSuite
 
 def suite():
 
     suite = unittest.TestSuite()
     suite.addTest(formatter.suite())
+    suite.addTest(links.suite())
     suite.addTest(macros.suite())
     suite.addTest(model.suite())
+    suite.addTest(parser.suite())
+    suite.addTest(web_ui.suite())
     suite.addTest(wikisyntax.suite())
     suite.addTest(doctest.DocTestSuite(trac.wiki.api))
     suite.addTest(doctest.DocTestSuite(trac.wiki.formatter))
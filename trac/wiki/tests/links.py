@@ -0,0 +1,101 @@
+import unittest
+
+from trac.test import EnvironmentStub
+from trac.ticket.model import Ticket
+from trac.ticket.roadmap import MilestoneModule
+from trac.wiki.links import LinkIndex
+from trac.wiki.model import WikiPage
+
+
+class LinkIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub(default_data=True)
+        self.index = LinkIndex(self.env)
+        self.ticket = Ticket(self.env)
+        self.ticket['summary'] = 'Summary'
+        self.ticket['reporter'] = 'joe'
+        self.ticket['description'] = 'See SomePage'
+        self.ticket.insert()
+
+    def tearDown(self):
+        self.env.reset_db()
+
+    def _save_page(self, name, text):
+        page = WikiPage(self.env, name)
+        page.text = text
+        page.save('joe', '', '::1')
+        return page
+
+    def test_extract_links(self):
+        self.assertEqual(set([('wiki', 'SomePage'), ('ticket', '1'),
+                              ('milestone', 'milestone1')]),
+                         self.index.extract_links(
+                             WikiPage(self.env, 'Page').resource,
+                             'SomePage, #1, #42, milestone:milestone1, '
+                             '!OtherPage, `#1 NotALink` and [[Page]]'))
+
+    def test_self_link_ignored(self):
+        self.assertEqual(set(), self.index.extract_links(
+            WikiPage(self.env, 'Page').resource, 'See [wiki:Page]'))
+
+    def test_wiki_page_links(self):
+        self._save_page('Page', 'See SomePage and #1')
+        self.assertEqual([('ticket', '1'), ('wiki', 'SomePage')],
+                         self.index.get_links('wiki', 'Page'))
+        self.assertEqual([('ticket', u'1'), ('wiki', 'Page')],
+                         self.index.get_backlinks('wiki', 'SomePage'))
+        self.assertEqual([('wiki', 'Page')],
+                         self.index.get_backlinks('ticket', 1))
+
+    def test_wiki_page_renamed_and_deleted(self):
+        page = self._save_page('Page', 'See SomePage')
+        page.rename('NewPage')
+        self.assertEqual([('ticket', u'1'), ('wiki', 'NewPage')],
+                         self.index.get_backlinks('wiki', 'SomePage'))
+        page.delete()
+        self.assertEqual([('ticket', u'1')],
+                         self.index.get_backlinks('wiki', 'SomePage'))
+
+    def test_ticket_comments(self):
+        self.ticket.save_changes('joe', 'Done in milestone:milestone2')
+        self.assertEqual([('milestone', 'milestone2'), ('wiki', 'SomePage')],
+                         self.index.get_links('ticket', 1))
+        self.ticket.delete()
+        self.assertEqual([], self.index.get_links('ticket', 1))
+
+    def test_ticket_comment_modified(self):
+        self.ticket.save_changes('joe', 'See OtherPage')
+        self.ticket.modify_comment(self.ticket['changetime'], 'joe',
+                                   'See ThirdPage')
+        self.assertEqual([('wiki', 'SomePage'), ('wiki', 'ThirdPage')],
+                         self.index.get_links('ticket', 1))
+
+    def test_ticket_description_changed(self):
+        self.ticket['description'] = 'Nothing'
+        self.ticket.save_changes('joe', 'See OtherPage')
+        self.assertEqual([('wiki', 'OtherPage')],
+                         self.index.get_links('ticket', 1))
+
+    def test_wiki_referrers(self):
+        self._save_page('Page', 'See SomePage and SubDir/OtherPage')
+        self._save_page('Other', 'See SubDir/ChildPage and [wiki:Page]')
+        self.assertEqual(['Page'],
+                         self.index.get_wiki_referrers('Dir/SomePage'))
+        self.assertEqual(['Other', 'Page'],
+                         self.index.get_wiki_referrers('SubDir'))
+        self.assertEqual([], self.index.get_wiki_referrers('Missing'))
+
+    def test_rebuild(self):
+        self._save_page('Page', 'See SomePage')
+        self.env.db_transaction("DELETE FROM resource_link")
+        self.index.rebuild()
+        self.assertEqual([('ticket', u'1'), ('wiki', 'Page')],
+                         self.index.get_backlinks('wiki', 'SomePage'))
+
+
+def suite():
+    return unittest.makeSuite(LinkIndexTestCase, 'test')
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
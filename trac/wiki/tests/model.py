@@ -13,7 +13,7 @@ from trac.attachment import Attachment
 from trac.core import *
 from trac.test import EnvironmentStub
 from trac.util.datefmt import utc, to_utimestamp
-from trac.wiki import WikiPage, IWikiChangeListener
+from trac.wiki import WikiPage, WikiSystem, IWikiChangeListener
 
 
 class TestWikiChangeListener(Component):
@@ -266,6 +266,20 @@ class WikiPageTestCase(unittest.TestCase):
             page = WikiPage(self.env, 'TestPage')
             self.assertRaises(TracError, page.rename, name)
 
+    def test_get_pages(self):
+        for name in ('B', 'A/Sub', 'A', 'AB', 'C'):
+            page = WikiPage(self.env, name)
+            page.text = 'Bla bla'
+            page.save('joe', 'Testing', '::1')
+        wiki = WikiSystem(self.env)
+        self.assertEqual(['A', 'A/Sub', 'AB', 'B', 'C'],
+                         list(wiki.get_pages()))
+        self.assertEqual(['A', 'A/Sub', 'AB'], list(wiki.get_pages('A')))
+        self.assertEqual(['A/Sub'], list(wiki.get_pages('A/')))
+        self.assertEqual([], list(wiki.get_pages('D')))
+        WikiPage(self.env, 'AB').rename('A/Other')
+        self.assertEqual(['A/Other', 'A/Sub'], list(wiki.get_pages('A/')))
+
 
 def suite():
     return unittest.makeSuite(WikiPageTestCase, 'test')
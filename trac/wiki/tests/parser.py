@@ -0,0 +1,46 @@
+import unittest
+
+from trac.test import EnvironmentStub
+from trac.wiki.parser import WikiParser
+
+
+class WikiParserTokenizeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub()
+        self.parser = WikiParser(self.env)
+
+    def _groups(self, tokens):
+        return [m.group(0) for m in tokens]
+
+    def test_tokenize(self):
+        line = u"A ''WikiLink'' to #1 and [1]"
+        self.assertEqual(self._groups(self.parser.rules.finditer(line)),
+                         self._groups(self.parser.tokenize(line)))
+        self.assertEqual((), self.parser.tokenize(u'plain text'))
+
+    def test_cached_tokens(self):
+        tokens = self.parser.tokenize(u'See WikiStart')
+        self.assertTrue(tokens is self.parser.tokenize(u'See WikiStart'))
+
+    def test_cache_size(self):
+        self.env.config.set('wiki', 'token_cache_size', 4)
+        tokens = self.parser.tokenize(u'line 0')
+        for i in range(1, 3):
+            self.parser.tokenize(u'line %d' % i)
+        self.assertTrue(tokens is self.parser.tokenize(u'line 0'))
+        for i in range(1, 6):
+            self.parser.tokenize(u'line %d' % i)
+        self.assertFalse(tokens is self.parser.tokenize(u'line 0'))
+
+    def test_cache_disabled(self):
+        self.env.config.set('wiki', 'token_cache_size', 0)
+        tokens = self.parser.tokenize(u'See WikiStart')
+        self.assertFalse(tokens is self.parser.tokenize(u'See WikiStart'))
+
+
+def suite():
+    return unittest.makeSuite(WikiParserTokenizeTestCase, 'test')
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,137 @@
+from datetime import datetime
+import unittest
+
+from trac.perm import PermissionCache, PermissionSystem
+from trac.test import EnvironmentStub, Mock
+from trac.ticket.model import Ticket
+from trac.util.datefmt import utc
+from trac.versioncontrol.api import Changeset, Repository
+from trac.versioncontrol.cache import CachedRepository
+from trac.web.chrome import web_context
+from trac.web.href import Href
+from trac.wiki.model import WikiPage
+from trac.wiki.web_ui import WikiRenderCache
+
+
+class WikiRenderCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub(default_data=True)
+        self.cache = WikiRenderCache(self.env)
+        self.ticket = Ticket(self.env)
+        self.ticket['summary'] = 'First summary'
+        self.ticket['reporter'] = 'joe'
+        self.ticket.insert()
+
+    def tearDown(self):
+        self.env.reset_db()
+
+    def _render(self, text, username='anonymous', name='Page'):
+        req = Mock(perm=PermissionCache(self.env, username),
+                   href=Href('/trac'), abs_href=Href('http://example.org'),
+                   authname=username, locale=None, tz=None)
+        context = web_context(req, WikiPage(self.env, name).resource)
+        return self.cache.render(context, text)
+
+    def _save_page(self, name, text='Content'):
+        page = WikiPage(self.env, name)
+        page.text = text
+        page.save('joe', '', '::1')
+
+    def test_cached_rendering(self):
+        html = self._render('Some text, #1 and WikiStart')
+        self.assertTrue(html is self._render('Some text, #1 and WikiStart'))
+        self.assertFalse(html is self._render('Other text'))
+
+    def test_missing_page_created(self):
+        html = self._render('See NewPage')
+        self.assertTrue('missing wiki' in html)
+        page = WikiPage(self.env, 'NewPage')
+        page.text = 'Content'
+        page.save('joe', '', '::1')
+        self.assertFalse('missing wiki' in self._render('See NewPage'))
+
+    def test_page_index_macro(self):
+        html = self._render('[[TitleIndex]]')
+        self.assertTrue(html is self._render('[[TitleIndex]]'))
+        page = WikiPage(self.env, 'NewPage')
+        page.text = 'Content'
+        page.save('joe', '', '::1')
+        self.assertTrue('NewPage' in self._render('[[TitleIndex]]'))
+
+    def test_page_links(self):
+        page = WikiPage(self.env, 'Page')
+        page.text = 'See NewPage'
+        page.save('joe', '', '::1')
+        html = self._render(page.text)
+        other = WikiPage(self.env, 'OtherPage')
+        other.text = 'Content'
+        other.save('joe', '', '::1')
+        self.assertTrue(html is self._render(page.text))
+        other.text = 'See Page'
+        other.save('joe', '', '::1')
+        self.assertTrue(html is self._render(page.text))
+        new = WikiPage(self.env, 'NewPage')
+        new.text = 'Content'
+        new.save('joe', '', '::1')
+        self.assertFalse('missing wiki' in self._render(page.text))
+
+    def test_scoped_page_links(self):
+        html = self._render('See OtherPage', name='Parent/Page')
+        self.assertTrue('missing wiki' in html)
+        self._save_page('Unrelated')
+        self.assertTrue(html is self._render('See OtherPage',
+                                             name='Parent/Page'))
+        self._save_page('OtherPage')
+        self.assertFalse('missing wiki' in
+                         self._render('See OtherPage', name='Parent/Page'))
+
+    def test_ticket_changed(self):
+        self.assertTrue('First summary' in self._render('See #1'))
+        self.ticket['summary'] = 'Second summary'
+        self.ticket.save_changes('joe', '')
+        self.assertTrue('Second summary' in self._render('See #1'))
+
+    def test_repository_synced_per_request(self):
+        html = self._render('See [1]')
+        self.assertTrue(html is self._render('See [1]'))
+        other = self._render('See #1')
+        t = datetime(2001, 1, 1, 1, 1, 1, 0, utc)
+        def get_changeset(rev):
+            return Mock(Changeset, repos, 1, 'Import', 'joe', t,
+                        get_changes=lambda: iter([]))
+        repos = Mock(Repository, 'repos', {'name': 'repos', 'id': 1},
+                     self.env.log, get_changeset=get_changeset,
+                     get_oldest_rev=lambda: 1, get_youngest_rev=lambda: 1,
+                     normalize_rev=lambda rev: 1, next_rev=lambda rev: None)
+        CachedRepository(self.env, repos, self.env.log).sync()
+        self.assertFalse(html is self._render('See [1]'))
+        self.assertTrue(other is self._render('See #1'))
+
+    def test_permission_decisions(self):
+        perm = PermissionSystem(self.env)
+        perm.revoke_permission('anonymous', 'TICKET_VIEW')
+        perm.grant_permission('joe', 'TICKET_VIEW')
+        html = self._render('See #1', 'joe')
+        self.assertTrue('First summary' in html)
+        self.assertTrue(html is self._render('See #1', 'joe'))
+        self.assertFalse('First summary' in self._render('See #1'))
+
+    def test_volatile_macro(self):
+        html = self._render('[[RecentChanges]]')
+        self.assertFalse(html is self._render('[[RecentChanges]]'))
+        self.env.config.set('wiki', 'render_cache_volatile_macros', '')
+        html = self._render('[[RecentChanges]]')
+        self.assertTrue(html is self._render('[[RecentChanges]]'))
+
+    def test_cache_disabled(self):
+        self.env.config.set('wiki', 'render_cache_size', 0)
+        html = self._render('Some text')
+        self.assertFalse(html is self._render('Some text'))
+
+
+def suite():
+    return unittest.makeSuite(WikiRenderCacheTestCase, 'test')
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
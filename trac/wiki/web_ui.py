@@ -23,26 +23,35 @@ import re
 
 from genshi.builder import tag
 
-from trac.attachment import AttachmentModule
-from trac.config import IntOption
+from trac.attachment import AttachmentModule, IAttachmentChangeListener
+from trac.cache import Generation
+from trac.config import IntOption, ListOption
 from trac.core import *
-from trac.mimeview.api import IContentConverter, Mimeview 
-from trac.perm import IPermissionRequestor
+from trac.mimeview.api import IContentConverter, Mimeview, RenderingContext
+from trac.perm import IPermissionRequestor, PermissionCache
 from trac.resource import *
-from trac.search import ISearchSource, search_to_sql, shorten_result
-from trac.timeline.api import ITimelineEventProvider
-from trac.util import get_reporter_id
+from trac.search import ISearchDocumentProvider, ISearchSource, \
+                        SearchIndex, search_by_ids, search_to_sql, \
+                        shorten_result
+from trac.ticket.api import IMilestoneChangeListener, ITicketChangeListener
+from trac.timeline.api import ITimelineEventProvider, get_timeline_rows, \
+                             merge_events
+from trac.util import get_reporter_id, sha1
+from trac.util.concurrency import threading
 from trac.util.datefmt import from_utimestamp, to_utimestamp
 from trac.util.text import shorten_line
 from trac.util.translation import _, tag_
+from trac.versioncontrol.api import IRepositoryChangeListener
 from trac.versioncontrol.diff import get_diff_options, diff_blocks
 from trac.web.api import IRequestHandler
 from trac.web.chrome import (Chrome, INavigationContributor, ITemplateProvider,
                              add_ctxtnav, add_link, add_notice, add_script,
                              add_stylesheet, add_warning, prevnext_nav, 
                              web_context)
-from trac.wiki.api import IWikiPageManipulator, WikiSystem, validate_page_name
-from trac.wiki.formatter import format_to, OneLinerFormatter
+from trac.wiki.api import IWikiChangeListener, IWikiPageManipulator, \
+                          WikiSystem, validate_page_name
+from trac.wiki.formatter import format_to, format_to_html, OneLinerFormatter
+from trac.wiki.links import LinkIndex
 from trac.wiki.model import WikiPage
 
 
@@ -56,8 +65,8 @@ class InvalidWikiPage(TracError):
 class WikiModule(Component):
 
     implements(IContentConverter, INavigationContributor, IPermissionRequestor,
-               IRequestHandler, ITimelineEventProvider, ISearchSource,
-               ITemplateProvider)
+               IRequestHandler, ITimelineEventProvider,
+               ISearchDocumentProvider, ISearchSource, ITemplateProvider)
 
     page_manipulators = ExtensionPoint(IWikiPageManipulator)
 
@@ -169,6 +178,8 @@ class WikiModule(Component):
             return self._render_diff(req, versioned_page)
         elif action == 'history':
             return self._render_history(req, versioned_page)
+        elif action == 'backlinks':
+            return self._render_backlinks(req, page)
         else:
             format = req.args.get('format')
             if format:
@@ -389,8 +400,30 @@ class WikiModule(Component):
            
         data = self._page_data(req, page, 'rename')
         data['new_name'] = new_name if new_name is not None else page.name
+        data['backlinks'] = self._get_backlinks(req, page)
         self._wiki_ctxtnav(req, page)
         return 'wiki_rename.html', data, None
+
+    def _render_backlinks(self, req, page):
+        req.perm(page.resource).require('WIKI_VIEW')
+        data = self._page_data(req, page, 'backlinks')
+        data['backlinks'] = self._get_backlinks(req, page)
+        self._wiki_ctxtnav(req, page)
+        return 'wiki_backlinks.html', data, None
+
+    _view_actions = {'ticket': 'TICKET_VIEW', 'wiki': 'WIKI_VIEW'}
+
+    def _get_backlinks(self, req, page):
+        """Return the resources linking to `page` the user can see."""
+        backlinks = []
+        for realm, id in LinkIndex(self.env).get_backlinks('wiki', page.name):
+            if realm == 'ticket':
+                id = int(id)
+            resource = Resource(realm, id)
+            action = self._view_actions.get(realm)
+            if action and action in req.perm(resource):
+                backlinks.append(resource)
+        return backlinks
         
     def _render_diff(self, req, page):
         if not page.exists:
@@ -686,6 +719,7 @@ class WikiModule(Component):
         data.update({
             'context': context,
             'text': text,
+            'html': WikiRenderCache(self.env).render(context, text),
             'latest_version': latest_page.version,
             'attachments': AttachmentModule(self.env).attachment_data(context),
             'default_template': self.DEFAULT_PAGE_TEMPLATE,
@@ -704,6 +738,8 @@ class WikiModule(Component):
         if page.exists:
             add_ctxtnav(req, _('History'), req.href.wiki(page.name, 
                                                          action='history'))
+            add_ctxtnav(req, _('Backlinks'), req.href.wiki(page.name,
+                                                           action='backlinks'))
 
     # ITimelineEventProvider methods
 
@@ -711,22 +747,31 @@ class WikiModule(Component):
         if 'WIKI_VIEW' in req.perm:
             yield ('wiki', _('Wiki changes'))
 
-    def get_timeline_events(self, req, start, stop, filters):
+    timeline_events_ordered = True
+
+    def get_timeline_events(self, req, start, stop, filters, limit=None):
         if 'wiki' in filters:
             wiki_realm = Resource('wiki')
-            for ts, name, comment, author, version in self.env.db_query("""
-                    SELECT time, name, comment, author, version FROM wiki
-                    WHERE time>=%s AND time<=%s
-                    """, (to_utimestamp(start), to_utimestamp(stop))):
-                wiki_page = wiki_realm(id=name, version=version)
-                if 'WIKI_VIEW' not in req.perm(wiki_page):
-                    continue
-                yield ('wiki', from_utimestamp(ts), author,
-                       (wiki_page, comment))
+            def wiki_events():
+                for ts, name, comment, author, version in get_timeline_rows(
+                        self.env, """
+                        SELECT time, name, comment, author, version FROM wiki
+                        WHERE time>=%s AND time<=%s
+                        ORDER BY time DESC, name, version DESC
+                        """, (to_utimestamp(start), to_utimestamp(stop)),
+                        limit):
+                    wiki_page = wiki_realm(id=name, version=version)
+                    if 'WIKI_VIEW' not in req.perm(wiki_page):
+                        continue
+                    yield ('wiki', from_utimestamp(ts), author,
+                           (wiki_page, comment))
 
             # Attachments
-            for event in AttachmentModule(self.env).get_timeline_events(
-                req, wiki_realm, start, stop):
+            attachment_events = AttachmentModule(self.env) \
+                                .get_timeline_events(req, wiki_realm, start,
+                                                     stop, limit)
+
+            for event in merge_events([wiki_events(), attachment_events]):
                 yield event
 
     def render_timeline_event(self, context, field, event):
@@ -758,18 +803,27 @@ class WikiModule(Component):
     def get_search_results(self, req, terms, filters):
         if not 'wiki' in filters:
             return
+        wiki_realm = Resource('wiki')
+        ids = SearchIndex(self.env).find_documents('wiki', terms)
         with self.env.db_query as db:
-            sql_query, args = search_to_sql(db, ['w1.name', 'w1.author',
-                                                 'w1.text'], terms)
-            wiki_realm = Resource('wiki')
-            for name, ts, author, text in db("""
-                    SELECT w1.name, w1.time, w1.author, w1.text
-                    FROM wiki w1,(SELECT name, max(version) AS ver 
-                                  FROM wiki GROUP BY name) w2
-                    WHERE w1.version = w2.ver AND w1.name = w2.name
-                    AND """ + sql_query, args):
+            query = """
+                SELECT w1.name, w1.time, w1.author, w1.text
+                FROM wiki w1,(SELECT name, max(version) AS ver 
+                              FROM wiki GROUP BY name) w2
+                WHERE w1.version = w2.ver AND w1.name = w2.name"""
+            if ids is not None:
+                rows = search_by_ids(db, query, 'w1.name', ids)
+            else:
+                sql_query, args = search_to_sql(db, ['w1.name', 'w1.author',
+                                                     'w1.text'], terms)
+                rows = db(query + " AND " + sql_query, args)
+            rows = list(rows)
+            allowed = set(req.perm.filter('WIKI_VIEW',
+                                          [wiki_realm(id=row[0])
+                                           for row in rows]))
+            for name, ts, author, text in rows:
                 page = wiki_realm(id=name)
-                if 'WIKI_VIEW' in req.perm(page):
+                if page in allowed:
                     yield (get_resource_url(self.env, page, req.href),
                            '%s: %s' % (name, shorten_line(text)),
                            from_utimestamp(ts), author,
@@ -779,3 +833,280 @@ class WikiModule(Component):
         for result in AttachmentModule(self.env).get_search_results(
             req, wiki_realm, terms):
             yield result
+
+    # ISearchDocumentProvider methods
+
+    def get_search_document_realms(self):
+        yield 'wiki'
+
+    def get_search_documents(self, realm, ids=None):
+        with self.env.db_query as db:
+            for name, author, text in search_by_ids(db, """
+                    SELECT w1.name, w1.author, w1.text
+                    FROM wiki w1,(SELECT name, max(version) AS ver
+                                  FROM wiki GROUP BY name) w2
+                    WHERE w1.version = w2.ver AND w1.name = w2.name
+                    """, 'w1.name', ids):
+                yield name, '\n'.join([name, author or '', text or ''])
+
+
+class _RecordingCache(dict):
+    """Permission cache remembering every decision stored into it."""
+
+    def __init__(self):
+        dict.__init__(self)
+        self.checks = []
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        decision, resource = value
+        self.checks.append((key[2], resource, decision))
+
+
+class WikiRenderCache(Component):
+    """Cache for the rendered HTML of wiki pages.
+
+    The rendering of a page is reused as long as the resources it
+    depends on haven't changed. The dependencies are the realms of all
+    the resources whose permissions were checked while rendering, as
+    the link resolvers check the permissions of the resources they
+    look up, plus the InterWiki map. Changes are tracked with one
+    `~trac.cache.Generation` per realm. Pages which may link to a
+    changeset or to a repository path also depend on the `repository`
+    generation, as missing changesets aren't checked for permissions.
+    That generation is invalidated whenever revisions are added to the
+    repository cache, including by the synchronization done at the
+    beginning of the requests.
+
+    The existence of wiki pages is checked against `WikiSystem.pages`.
+    When a page is created, deleted or renamed, the pages using macros
+    or processors are rendered again, while for the other pages, only
+    the pages their wiki links could resolve to are compared.
+
+    The permission checks done during the rendering are recorded with
+    their outcome, and the cached HTML is only used for a request
+    getting the same decisions. Pages using one of the volatile macros
+    are never cached.
+    """
+
+    implements(IAttachmentChangeListener, IMilestoneChangeListener,
+               IRepositoryChangeListener, ITicketChangeListener,
+               IWikiChangeListener)
+
+    cache_size = IntOption('wiki', 'render_cache_size', 100,
+        """Maximum number of rendered wiki pages kept in memory. Set to 0
+        to disable the cache. (''since 0.13'')""")
+
+    volatile_macros = ListOption('wiki', 'render_cache_volatile_macros',
+                                 'Image, RecentChanges, RepositoryIndex, '
+                                 'TicketQuery',
+        doc="""List of macros and processors whose output depends on
+        the user or on data which isn't tracked by the wiki render
+        cache. Pages using any of them are rendered for every request.
+        (''since 0.13'')""")
+
+    # Realms whose changes are tracked, with the generation they use
+    realm_generations = {'attachment': 'attachment',
+                         'changeset': 'repository',
+                         'interwiki': 'interwiki',
+                         'milestone': 'milestone',
+                         'repository': 'repository',
+                         'source': 'repository',
+                         'ticket': 'ticket'}
+
+    # Links possibly resolving to a changeset or to a repository path
+    _repository_link_re = re.compile(
+        r"\b(?:browser|changeset|diff|export|log|repos|source):|"
+        r"\[\d|\br\d")
+
+    _macro_re = re.compile(r'\[\[\s*([\w/+-]+)|^\s*(?:\{\{\{)?\s*#!([\w/+-]+)',
+                           re.MULTILINE)
+
+    def __init__(self):
+        self._pages = {}
+        self._tick = 0
+        self._lock = threading.Lock()
+
+    # Public methods
+
+    def render(self, context, text):
+        """Return the wiki `text` formatted to HTML in the rendering
+        `context` of a page view, as created by `web_context`, using the
+        cached rendering if possible."""
+        req = getattr(context, 'req', None)
+        if not text or self.cache_size <= 0 or req is None or \
+                not isinstance(context.perm, PermissionCache) or \
+                self._uses_volatile_macros(text):
+            return format_to_html(self.env, context, text)
+        resource = context.resource
+        key = (resource.realm, resource.id, resource.version,
+               sha1(text.encode('utf-8')).digest(), 'html',
+               str(req.locale), context.href.base, req.abs_href.base)
+        with self._lock:
+            self._tick += 1
+            entry = self._pages.get(key)
+            if entry:
+                entry[0] = self._tick
+        if entry and self._is_valid(context.perm, entry):
+            return entry[5]
+
+        tokens = self._get_tokens(self.realm_generations.values())
+        pages = WikiSystem(self.env).pages
+        recorder = _RecordingCache()
+        rcontext = RenderingContext(resource, href=context.href,
+                                    perm=PermissionCache(self.env,
+                                        context.perm.username,
+                                        cache=recorder))
+        rcontext.req = req
+        html = format_to_html(self.env, rcontext, text)
+        realms = set(['interwiki'])
+        if self._repository_link_re.search(text):
+            realms.add('repository')
+        for action, checked, decision in recorder.checks:
+            if checked is not None and checked.realm in self.realm_generations:
+                realms.add(self.realm_generations[checked.realm])
+        links = None
+        if not self._macro_re.search(text):
+            # The wiki links are all checked for permissions
+            names = set(checked.id for action, checked, decision
+                        in recorder.checks
+                        if checked is not None and checked.realm == 'wiki'
+                        and checked.id)
+            links = (resource, names,
+                     self._get_linked_pages(resource, names, pages))
+        tokens = dict((realm, tokens[realm]) for realm in realms)
+        with self._lock:
+            self._pages[key] = [self._tick, tokens, recorder.checks, pages,
+                                links, html]
+            if len(self._pages) > self.cache_size:
+                lru = min(self._pages, key=lambda k: self._pages[k][0])
+                del self._pages[lru]
+        return html
+
+    def invalidate(self, *realms):
+        """Invalidate the rendered pages depending on the given `realms`.
+        """
+        for realm in set(self.realm_generations.get(r) for r in realms):
+            if realm:
+                del Generation(self.env, realm).token
+
+    # IAttachmentChangeListener methods
+
+    def attachment_added(self, attachment):
+        self.invalidate('attachment')
+
+    def attachment_deleted(self, attachment):
+        self.invalidate('attachment')
+
+    def attachment_reparented(self, attachment, old_parent_realm,
+                              old_parent_id):
+        self.invalidate('attachment')
+
+    # IMilestoneChangeListener methods
+
+    def milestone_created(self, milestone):
+        self.invalidate('milestone')
+
+    def milestone_changed(self, milestone, old_values):
+        self.invalidate('milestone')
+
+    def milestone_deleted(self, milestone):
+        self.invalidate('milestone')
+
+    # IRepositoryChangeListener methods
+
+    def changeset_added(self, repos, changeset):
+        self.invalidate('changeset')
+
+    def changeset_modified(self, repos, changeset, old_changeset):
+        self.invalidate('changeset')
+
+    # ITicketChangeListener methods
+
+    def ticket_created(self, ticket):
+        self.invalidate('ticket')
+
+    def ticket_changed(self, ticket, comment, author, old_values):
+        self.invalidate('ticket')
+
+    def ticket_deleted(self, ticket):
+        self.invalidate('ticket')
+
+    def ticket_change_deleted(self, ticket, cdate, changes):
+        # The fields changed by the deleted change are reverted
+        self.invalidate('ticket')
+
+    # IWikiChangeListener methods
+
+    # The existence of pages is checked against `WikiSystem.pages`, so
+    # only the InterWiki map changes the rendering of other pages
+
+    def wiki_page_added(self, page):
+        self._intermap_changed(page.name)
+
+    def wiki_page_changed(self, page, version, t, comment, author, ipnr):
+        self._intermap_changed(page.name)
+
+    def wiki_page_deleted(self, page):
+        self._intermap_changed(page.name)
+
+    def wiki_page_version_deleted(self, page):
+        self._intermap_changed(page.name)
+
+    def wiki_page_renamed(self, page, old_name):
+        self._intermap_changed(page.name, old_name)
+
+    # Internal methods
+
+    def _intermap_changed(self, *names):
+        if 'InterMapTxt' in names:
+            self.invalidate('interwiki')
+
+    def _get_linked_pages(self, resource, names, pages):
+        """Return the existing `pages` whose creation or deletion could
+        change how links to the wiki pages `names` are rendered from
+        `resource`.
+
+        Scoped links resolve to pages with the same base name, possibly
+        below one of the parent pages of `resource`.
+        """
+        basenames = set(name.rstrip('/').rsplit('/', 1)[-1]
+                        for name in names)
+        linked = set(name for name in pages
+                     if name.rsplit('/', 1)[-1] in basenames)
+        if resource.realm == 'wiki' and resource.id:
+            parts = resource.id.split('/')
+            linked.update(name for name in ('/'.join(parts[:i])
+                                            for i in xrange(1, len(parts)))
+                          if name in pages)
+        return frozenset(linked)
+
+    def _uses_volatile_macros(self, text):
+        volatile = set(self.volatile_macros)
+        for match in self._macro_re.finditer(text):
+            if (match.group(1) or match.group(2)) in volatile:
+                return True
+        return False
+
+    def _get_tokens(self, realms):
+        return dict((realm, Generation(self.env, realm).token)
+                    for realm in set(realms))
+
+    def _is_valid(self, perm, entry):
+        """Return whether the cached `entry` is still up to date and can
+        be shown with the permissions `perm`."""
+        tick, tokens, checks, pages, links, html = entry
+        if self._get_tokens(tokens) != tokens:
+            return False
+        current = WikiSystem(self.env).pages
+        if current is not pages:
+            if links is None:
+                return False
+            resource, names, linked = links
+            if self._get_linked_pages(resource, names, current) != linked:
+                return False
+            entry[3] = current
+        for action, resource, decision in checks:
+            if bool(perm.has_permission(action, resource)) != bool(decision):
+                return False
+        return True
@@ -14,9 +14,11 @@
 #
 # Author: Alec Thomas <alec@swapoff.org>
 
-from fnmatch import fnmatch
+from fnmatch import translate
 from itertools import groupby
 import os
+import re
+from time import time
 
 from trac.core import *
 from trac.config import Option
@@ -135,6 +137,11 @@ class AuthzPolicy(Component):
 
     authz = None
     authz_mtime = None
+    authz_checked = 0
+
+    # Number of seconds between two checks of the modification time of the
+    # authz file
+    AUTHZ_CHECK_INTERVAL = 5
 
     # IPermissionPolicy methods
     
@@ -143,25 +150,26 @@ class AuthzPolicy(Component):
             self.log.error('configobj package not found')
             return None
         
-        if self.authz_file and not self.authz_mtime or \
-                os.path.getmtime(self.get_authz_file()) > self.authz_mtime:
-            self.parse_authz()
+        now = time()
+        if self.authz is None or \
+                now - self.authz_checked > self.AUTHZ_CHECK_INTERVAL:
+            self.authz_checked = now
+            if self.authz_file and not self.authz_mtime or \
+                    os.path.getmtime(self.get_authz_file()) > \
+                    self.authz_mtime:
+                self.parse_authz()
         resource_key = self.normalise_resource(resource)
         self.log.debug('Checking %s on %s', action, resource_key)
-        permissions = self.authz_permissions(resource_key, username)
-        if permissions is None:
+        entry = self._match_entry(resource_key, username)
+        if entry is None:
             return None                 # no match, can't decide
-        elif permissions == ['']:
+        permissions, expanded = entry
+        if permissions == ['']:
             return False                # all actions are denied
 
-        # FIXME: expand all permissions once for all
-        ps = PermissionSystem(self.env)
-        for deny, perms in groupby(permissions,
-                                   key=lambda p: p.startswith('!')):
-            if deny and action in ps.expand_actions([p[1:] for p in perms]):
-                return False            # action is explicitly denied
-            elif action in ps.expand_actions(perms):
-                return True            # action is explicitly granted
+        for deny, actions in expanded:
+            if action in actions:
+                return not deny         # action is explicitly denied/granted
 
         return None                    # no match for action, can't decide
 
@@ -174,25 +182,61 @@ class AuthzPolicy(Component):
     def parse_authz(self):
         self.log.debug('Parsing authz security policy %s',
                        self.get_authz_file())
-        self.authz = ConfigObj(self.get_authz_file())
+        authz = ConfigObj(self.get_authz_file())
         groups = {}
-        for group, users in self.authz.get('groups', {}).iteritems():
+        for group, users in authz.get('groups', {}).iteritems():
             if isinstance(users, basestring):
                 users = [users]
             groups[group] = users
         
-        self.groups_by_user = {}
+        groups_by_user = {}
         
         def add_items(group, items):
             for item in items:
                 if item.startswith('@'):
                     add_items(group, groups[item[1:]])
                 else:
-                    self.groups_by_user.setdefault(item, set()).add(group)
+                    groups_by_user.setdefault(item, set()).add(group)
                     
         for group, users in groups.iteritems():
             add_items('@' + group, users)
 
+        # Compile the sections in matchers, indexed by the realm of the
+        # resources they can match when it doesn't contain wildcards, and
+        # expand the permissions once for all
+        ps = PermissionSystem(self.env)
+        def expand(permissions):
+            return [(deny, ps.expand_actions(p[1:] if deny else p
+                                             for p in perms))
+                    for deny, perms in groupby(
+                        permissions, key=lambda p: p.startswith('!'))]
+        sections_by_realm = {}
+        any_realm_sections = []
+        sections = [s for s in authz.sections if s != 'groups']
+        for idx, resource_section in enumerate(sections):
+            resource_glob = to_unicode(resource_section)
+            if '@' not in resource_glob:
+                resource_glob += '@*'
+            entries = []
+            for who, permissions in authz[resource_section].iteritems():
+                if isinstance(permissions, basestring):
+                    permissions = [permissions]
+                entries.append((who, permissions, expand(permissions)))
+            match = re.compile(translate(os.path.normcase(resource_glob)))
+            section = (idx, resource_glob, match.match, entries)
+            realm = resource_glob.split(':', 1)[0]
+            if realm != resource_glob and not re.search(r'[*?[/]', realm):
+                sections_by_realm.setdefault(realm, []).append(section)
+            else:
+                any_realm_sections.append(section)
+        for realm, realm_sections in sections_by_realm.iteritems():
+            realm_sections.extend(any_realm_sections)
+            realm_sections.sort()
+
+        self.groups_by_user = groups_by_user
+        self.sections_by_realm = sections_by_realm
+        self.any_realm_sections = any_realm_sections
+        self.authz = authz
         self.authz_mtime = os.path.getmtime(self.get_authz_file())
 
     def normalise_resource(self, resource):
@@ -223,25 +267,28 @@ class AuthzPolicy(Component):
     def authz_permissions(self, resource_key, username):
         # TODO: Handle permission negation in sections. eg. "if in this
         # ticket, remove TICKET_MODIFY"
+        entry = self._match_entry(resource_key, username)
+        if entry is not None:
+            return entry[0]
+
+    def _match_entry(self, resource_key, username):
+        """Return the `(permissions, expanded)` tuple of the first entry
+        of the first section matching `resource_key` and `username`, or
+        `None`.
+        """
         if username and username != 'anonymous':
-            valid_users = ['*', 'authenticated', username]
+            valid_users = set(['*', 'authenticated', username])
         else:
-            valid_users = ['*', 'anonymous']
-        for resource_section in [a for a in self.authz.sections
-                                 if a != 'groups']:
-            resource_glob = to_unicode(resource_section)
-            if '@' not in resource_glob:
-                resource_glob += '@*'
-
-            if fnmatch(resource_key, resource_glob):
-                section = self.authz[resource_section]
-                for who, permissions in section.iteritems():
-                    if who in valid_users or \
-                            who in self.groups_by_user.get(username, []):
+            valid_users = set(['*', 'anonymous'])
+        valid_users.update(self.groups_by_user.get(username, ()))
+        realm = resource_key.split(':', 1)[0]
+        sections = self.sections_by_realm.get(realm, self.any_realm_sections)
+        resource_key = os.path.normcase(resource_key)
+        for idx, resource_glob, match, entries in sections:
+            if match(resource_key):
+                for who, permissions, expanded in entries:
+                    if who in valid_users:
                         self.log.debug('%s matched section %s for user %s',
                                        resource_key, resource_glob, username)
-                        if isinstance(permissions, basestring):
-                            return [permissions]
-                        else:
-                            return permissions
+                        return permissions, expanded
         return None
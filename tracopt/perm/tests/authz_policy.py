@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011 Edgewall Software
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution. The terms
+# are also available at http://trac.edgewall.org/wiki/TracLicense.
+#
+# This software consists of voluntary contributions made by many
+# individuals. For the exact contribution history, see the revision
+# history and logs, available at http://trac.edgewall.org/log/.
+
+import os
+import tempfile
+import unittest
+
+from trac.resource import Resource
+from trac.test import EnvironmentStub
+from tracopt.perm import authz_policy
+from tracopt.perm.authz_policy import AuthzPolicy
+
+
+class AuthzPolicyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.authz_file = tempfile.mkstemp()
+        f = os.fdopen(fd, 'w')
+        try:
+            f.write("""\
+[groups]
+admins = joe
+devs = @admins, jim
+
+[wiki:WikiStart@*]
+@admins = WIKI_ADMIN
+* = WIKI_VIEW
+
+[wiki:Private*]
+@devs = WIKI_VIEW
+* =
+
+[*/attachment:*]
+* = !ATTACHMENT_VIEW
+
+[ticket:*]
+@devs = TICKET_ADMIN
+anonymous = TICKET_VIEW, !TICKET_MODIFY
+
+[*]
+authenticated = WIKI_VIEW
+""")
+        finally:
+            f.close()
+        self.env = EnvironmentStub(enable=['trac.*', AuthzPolicy])
+        self.env.config.set('authz_policy', 'authz_file', self.authz_file)
+        self.policy = AuthzPolicy(self.env)
+
+    def tearDown(self):
+        os.remove(self.authz_file)
+
+    def check(self, action, username, realm, id, parent=None):
+        resource = Resource(realm, id)
+        if parent:
+            resource = Resource(*parent).child(realm, id)
+        return self.policy.check_permission(action, username, resource, None)
+
+    def test_sections_in_order(self):
+        self.assertEqual(True, self.check('WIKI_ADMIN', 'joe', 'wiki',
+                                          'WikiStart'))
+        self.assertEqual(True, self.check('WIKI_VIEW', 'jane', 'wiki',
+                                          'WikiStart'))
+        self.assertEqual(None, self.check('WIKI_ADMIN', 'jane', 'wiki',
+                                          'WikiStart'))
+        self.assertEqual(True, self.check('WIKI_VIEW', 'jane', 'wiki',
+                                          'OtherPage'))
+        self.assertEqual(None, self.check('WIKI_VIEW', 'anonymous', 'wiki',
+                                          'OtherPage'))
+
+    def test_nested_groups(self):
+        self.assertEqual(True, self.check('WIKI_VIEW', 'joe', 'wiki',
+                                          'PrivatePage'))
+        self.assertEqual(True, self.check('WIKI_VIEW', 'jim', 'wiki',
+                                          'PrivatePage'))
+        self.assertEqual(False, self.check('WIKI_VIEW', 'jane', 'wiki',
+                                           'PrivatePage'))
+
+    def test_expanded_and_denied_permissions(self):
+        self.assertEqual(True, self.check('TICKET_MODIFY', 'jim', 'ticket',
+                                          '1'))
+        self.assertEqual(True, self.check('TICKET_VIEW', 'anonymous',
+                                          'ticket', '1'))
+        self.assertEqual(False, self.check('TICKET_MODIFY', 'anonymous',
+                                           'ticket', '1'))
+        self.assertEqual(False, self.check('ATTACHMENT_VIEW', 'joe',
+                                           'attachment', 'file.txt',
+                                           ('ticket', '1')))
+
+    def test_reload_after_check_interval(self):
+        self.assertEqual(None, self.check('WIKI_VIEW', 'anonymous', 'wiki',
+                                          'OtherPage'))
+        f = open(self.authz_file, 'a')
+        try:
+            f.write("anonymous = WIKI_VIEW\n")
+        finally:
+            f.close()
+        mtime = os.path.getmtime(self.authz_file) + 10
+        os.utime(self.authz_file, (mtime, mtime))
+        self.assertEqual(None, self.check('WIKI_VIEW', 'anonymous', 'wiki',
+                                          'OtherPage'))
+        self.policy.authz_checked -= AuthzPolicy.AUTHZ_CHECK_INTERVAL + 1
+        self.assertEqual(True, self.check('WIKI_VIEW', 'anonymous', 'wiki',
+                                          'OtherPage'))
+
+
+def suite():
+    suite = unittest.TestSuite()
+    if authz_policy.ConfigObj:
+        suite.addTest(unittest.makeSuite(AuthzPolicyTestCase, 'test'))
+    else:
+        print "SKIP: tracopt/perm/tests/authz_policy.py (no configobj " \
+              "installed)"
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')